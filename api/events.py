@@ -0,0 +1,143 @@
+import asyncio
+import threading
+from django.conf import settings
+from api.metrics import REGISTRY, Counter, Gauge
+
+EVENT_SUBSCRIBERS = REGISTRY.register(Gauge(
+    'event_stream_subscribers', 'Open server-sent event streams.'
+))
+EVENT_OVERFLOWS = REGISTRY.register(Counter(
+    'event_stream_overflows_total', 'Event streams closed because the client fell a full buffer behind.'
+))
+
+
+def event_setting(name, default):
+    return getattr(settings, 'EVENT_STREAMS', {}).get(name, default)
+
+
+def format_event(event, data, event_id=None):
+    """
+    Encodes one server-sent event frame; `data` is already serialized bytes.
+    """
+    head = f"id: {event_id}\nevent: {event}\n" if event_id is not None else f"event: {event}\n"
+    return head.encode() + b"data: " + data + b"\n\n"
+
+
+class Subscription:
+    """
+    One client's bounded buffer of encoded frames, drained by its stream on the
+    event loop it was opened on. A client that falls a whole buffer behind is
+    not waited for: its buffer is dropped and the stream ends with an overflow
+    event, so one slow dashboard never holds up the others or the publisher.
+    """
+    def __init__(self, loop, topics, maxsize):
+        self.loop = loop
+        self.topics = frozenset(topics)
+        self.queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+        self.closed = False
+
+    def offer(self, frame):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            EVENT_OVERFLOWS.inc()
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+def _deliver(deliveries):
+    for subscription, frame in deliveries:
+        subscription.offer(frame)
+
+
+class EventBroker:
+    """
+    In-process publish/subscribe between request threads and event streams.
+    Publishing never blocks: frames are encoded once by the caller and handed
+    to each subscriber's loop in a single call_soon_threadsafe per loop.
+    Only streams served by the same process see an event.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.topics = {}
+
+    def has_subscribers(self):
+        return bool(self.topics)
+
+    def subscribe(self, topics, maxsize=None):
+        """
+        Opens a subscription on the running event loop.
+        """
+        subscription = Subscription(
+            asyncio.get_running_loop(), topics, maxsize or event_setting('BUFFER_SIZE', 100)
+        )
+        with self.lock:
+            for topic in subscription.topics:
+                self.topics.setdefault(topic, set()).add(subscription)
+        EVENT_SUBSCRIBERS.inc()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            if subscription.closed:
+                return
+            subscription.closed = True
+            for topic in subscription.topics:
+                subscribers = self.topics.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self.topics[topic]
+        EVENT_SUBSCRIBERS.dec()
+
+    def publish(self, events):
+        """
+        Fans out (topics, frame) pairs. A subscriber listening on several of an
+        event's topics receives it once.
+        """
+        by_loop = {}
+        with self.lock:
+            for topics, frame in events:
+                recipients = set()
+                for topic in topics:
+                    recipients |= self.topics.get(topic, set())
+                for subscription in recipients:
+                    by_loop.setdefault(subscription.loop, []).append((subscription, frame))
+        for loop, deliveries in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(_deliver, deliveries)
+            except RuntimeError:
+                # The loop has shut down; its streams are gone with it
+                pass
+
+
+BROKER = EventBroker()
+
+
+async def event_stream(topics, retry_ms=3000):
+    """
+    Async iterator for a StreamingHttpResponse: subscribes to `topics` when the
+    response starts streaming and yields their frames, with keepalive comments
+    while idle. Unsubscribes when the client disconnects.
+    """
+    heartbeat = event_setting('HEARTBEAT_SECONDS', 15)
+    subscription = BROKER.subscribe(topics)
+    try:
+        yield f"retry: {retry_ms}\n\n".encode()
+        while True:
+            try:
+                frame = await asyncio.wait_for(subscription.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield b": keepalive\n\n"
+                continue
+            if frame is None:
+                yield format_event('overflow', b'{}')
+                return
+            yield frame
+    finally:
+        BROKER.unsubscribe(subscription)
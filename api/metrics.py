@@ -0,0 +1,312 @@
+import os
+import hmac
+import json
+import glob
+import fcntl
+import threading
+from time import monotonic
+from bisect import bisect_left
+from contextlib import contextmanager, ExitStack
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden, Http404
+
+# Counters and histograms of exited workers, kept so merged totals never decrease
+RETIRED_FILE = 'retired.json'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def snapshot(self):
+        with self.lock:
+            samples = [[list(key), value] for key, value in self.samples.items()]
+        return {
+            'kind': self.kind,
+            'documentation': self.documentation,
+            'labelnames': list(self.labelnames),
+            'samples': samples,
+        }
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.samples[key] = self.samples.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.samples[key] = self.samples.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.samples[key] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            # Per-bucket counts (last slot is +Inf), then sum and count
+            sample = self.samples.get(key)
+            if sample is None:
+                sample = self.samples[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            sample[index] += 1
+            sample[-2] += value
+            sample[-1] += 1
+
+    def snapshot(self):
+        snapshot = super().snapshot()
+        snapshot['buckets'] = list(self.buckets)
+        return snapshot
+
+
+class Registry:
+    """
+    In-process metrics registry. With METRICS['MULTIPROC_DIR'] set, every worker
+    process writes its snapshot to that directory and a scrape served by any worker
+    merges all of them, so gunicorn workers report as one target. The directory
+    must be local to the host: worker liveness is checked by pid.
+    """
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.last_flush = 0.0
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def _multiproc_dir(self):
+        return getattr(settings, 'METRICS', {}).get('MULTIPROC_DIR')
+
+    def flush(self, force=False):
+        directory = self._multiproc_dir()
+        if not directory:
+            return
+        now = monotonic()
+        if not force and now - self.last_flush < getattr(settings, 'METRICS', {}).get('FLUSH_INTERVAL', 1.0):
+            return
+        self.last_flush = now
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'metrics-{os.getpid()}.json')
+        with open(path + '.tmp', 'w') as handle:
+            json.dump(self.snapshot(), handle)
+        os.replace(path + '.tmp', path)
+
+    def retire_dead_workers(self, directory):
+        """
+        Folds the counters and histograms of worker processes that no longer run
+        into RETIRED_FILE and deletes their snapshots, so totals never go back
+        and the directory does not grow with every restart. Their gauges
+        described a live process and are dropped.
+        """
+        with open(os.path.join(directory, 'metrics.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            dead = []
+            for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+                pid = os.path.basename(path)[len('metrics-'):-len('.json')]
+                if pid.isdigit() and not _pid_alive(int(pid)):
+                    dead.append(path)
+            if not dead:
+                return
+            retired_path = os.path.join(directory, RETIRED_FILE)
+            snapshots = [_load_snapshot(path) for path in [retired_path] + dead]
+            retired = _merge_snapshots(
+                {name: metric for name, metric in snapshot.items() if metric['kind'] != 'gauge'}
+                for snapshot in snapshots if snapshot
+            )
+            with open(retired_path + '.tmp', 'w') as handle:
+                json.dump(retired, handle)
+            os.replace(retired_path + '.tmp', retired_path)
+            for path in dead:
+                os.remove(path)
+
+    def collect(self):
+        directory = self._multiproc_dir()
+        if not directory:
+            return self.snapshot()
+
+        self.flush(force=True)
+        self.retire_dead_workers(directory)
+        paths = glob.glob(os.path.join(directory, 'metrics-*.json'))
+        return _merge_snapshots(
+            snapshot for snapshot in map(_load_snapshot, paths + [os.path.join(directory, RETIRED_FILE)])
+            if snapshot
+        )
+
+    def render(self):
+        lines = []
+        for name, metric in sorted(self.collect().items()):
+            lines.append(f"# HELP {name} {metric['documentation']}")
+            lines.append(f"# TYPE {name} {metric['kind']}")
+            for labels, value in metric['samples']:
+                pairs = list(zip(metric['labelnames'], labels))
+                if metric['kind'] == 'histogram':
+                    cumulative = 0
+                    bounds = [_format_value(b) for b in metric['buckets']] + ['+Inf']
+                    for bound, count in zip(bounds, value[:-2]):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(pairs + [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(pairs)} {_format_value(value[-2])}")
+                    lines.append(f"{name}_count{_format_labels(pairs)} {value[-1]}")
+                else:
+                    lines.append(f"{name}{_format_labels(pairs)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _load_snapshot(path):
+    try:
+        with open(path) as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return None
+
+
+def _merge_snapshots(snapshots):
+    merged = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            target = merged.setdefault(name, {**metric, 'samples': {}})
+            for labels, value in metric['samples']:
+                key = tuple(labels)
+                if key not in target['samples']:
+                    target['samples'][key] = value
+                elif isinstance(value, list):
+                    target['samples'][key] = [a + b for a, b in zip(target['samples'][key], value)]
+                else:
+                    target['samples'][key] += value
+    for metric in merged.values():
+        metric['samples'] = [[list(key), value] for key, value in metric['samples'].items()]
+    return merged
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    escaped = (
+        name + '="' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    return repr(float(value))
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    'http_requests_total', 'HTTP requests by view, method and status.', ('view', 'method', 'status')
+))
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    'http_request_duration_seconds', 'End-to-end request latency by view.', ('view', 'method')
+))
+HTTP_IN_FLIGHT = REGISTRY.register(Gauge(
+    'http_requests_in_flight', 'Requests currently being served.'
+))
+ATTENDANCE_SCANS = REGISTRY.register(Counter(
+    'attendance_scans_total', 'Tags processed by markAttendance by outcome; invalid_batch counts rejected payloads.', ('outcome',)
+))
+ATTENDANCE_SCAN_ERRORS = REGISTRY.register(Counter(
+    'attendance_scan_errors_total', 'Rejected markAttendance tags by reason.', ('reason',)
+))
+ATTENDANCE_QUERIES_PER_SCAN = REGISTRY.register(Histogram(
+    'attendance_db_queries_per_scan', 'Database round-trips per tag in a markAttendance call.',
+    buckets=(1, 2, 4, 6, 8, 12, 16, 32, 64)
+))
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def count_queries(counter=None):
+    """
+    Counts database round-trips made inside the block, on every connection.
+    Pass the counter from a previous block to keep accumulating into it.
+    """
+    counter = counter or QueryCounter()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(counter))
+        yield counter
+
+
+def metrics_enabled():
+    return getattr(settings, 'METRICS', {}).get('ENABLED', False)
+
+
+def metrics_access_allowed(request):
+    """
+    With METRICS['TOKEN'] set, scrapers must send it as a bearer token;
+    otherwise only addresses in METRICS['ALLOWED_IPS'] may read the metrics.
+    """
+    config = getattr(settings, 'METRICS', {})
+    token = config.get('TOKEN')
+    if token:
+        return hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}')
+    return request.META.get('REMOTE_ADDR') in config.get('ALLOWED_IPS', ())
+
+
+def metrics_view(request):
+    """
+    Prometheus text exposition of all registered metrics.
+    """
+    if not metrics_enabled():
+        raise Http404()
+    if not metrics_access_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,283 @@
+import heapq
+import json
+import logging
+from time import perf_counter
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+from django.utils.text import compress_string, compress_sequence
+from django.utils.cache import patch_vary_headers
+from django.core.exceptions import MiddlewareNotUsed
+from api.routers import replica_configured, pin_to_primary
+from api.metrics import REGISTRY, HTTP_REQUESTS, HTTP_LATENCY, HTTP_IN_FLIGHT, metrics_enabled
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger('api.sql')
+
+
+class ReplicaPinningMiddleware:
+    """
+    Pins a client to the primary database after it performs a successful write,
+    giving read-your-writes consistency on replica-routed views.
+    """
+    UNSAFE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (replica_configured() and request.method in self.UNSAFE_METHODS
+                and response.status_code < 400):
+            pin_to_primary(request)
+        return response
+
+
+def negotiate_encoding(accept_encoding, supported):
+    """
+    Picks the content coding from `supported` (in order of preference) with the
+    highest non-zero q-value in an Accept-Encoding header, or None.
+    """
+    qualities = {}
+    for part in accept_encoding.split(','):
+        coding, *params = [piece.strip() for piece in part.split(';')]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            qualities[coding.lower()] = quality
+
+    best, best_quality = None, 0.0
+    for coding in supported:
+        quality = qualities.get(coding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def brotli_sequence(sequence, quality):
+    compressor = brotli.Compressor(quality=quality)
+    for item in sequence:
+        # Flush every chunk so a streamed response keeps flowing
+        data = compressor.process(item) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses of at least COMPRESSION_MIN_SIZE bytes with brotli
+    (when the Brotli package is installed) or gzip, whichever the client
+    prefers. Streaming responses are compressed chunk by chunk; event streams
+    and async streams are passed through untouched.
+    """
+    BROTLI_QUALITY = 5
+    max_random_bytes = 100
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+        self.encodings = ('br', 'gzip') if brotli else ('gzip',)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.has_header('Content-Encoding'):
+            return response
+        if response.get('Content-Type', '').startswith('text/event-stream'):
+            return response
+        if response.streaming:
+            if getattr(response, 'is_async', False):
+                return response
+        elif len(response.content) < self.min_size:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = negotiate_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''), self.encodings)
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if encoding == 'br':
+                response.streaming_content = brotli_sequence(response.streaming_content, self.BROTLI_QUALITY)
+            else:
+                response.streaming_content = compress_sequence(
+                    response.streaming_content, max_random_bytes=self.max_random_bytes
+                )
+            del response.headers['Content-Length']
+        else:
+            if encoding == 'br':
+                compressed = brotli.compress(response.content, quality=self.BROTLI_QUALITY)
+            else:
+                compressed = compress_string(response.content, max_random_bytes=self.max_random_bytes)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Records request count, latency histogram and in-flight requests per view
+    (labelled with the url name, e.g. markAttendance) into the metrics registry.
+    """
+    def __init__(self, get_response):
+        if not metrics_enabled():
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        HTTP_IN_FLIGHT.inc()
+        started = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+        elapsed = perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.url_name if match and match.url_name else 'unmatched'
+        HTTP_REQUESTS.inc(view=view, method=request.method, status=response.status_code)
+        HTTP_LATENCY.observe(elapsed, view=view, method=request.method)
+        REGISTRY.flush()
+        return response
+
+
+class QueryStats:
+    """
+    Per-request SQL statistics collected through connection.execute_wrapper.
+    Statements are grouped by their parametrized SQL, so repeated lookups that
+    differ only by parameters show up as duplicates (the N+1 pattern).
+    """
+    def __init__(self, top_n, slow_seconds):
+        self.top_n = top_n
+        self.slow_seconds = slow_seconds
+        self.slow = []
+        self.count = 0
+        self.duration = 0.0
+        self.slowest = []
+        self.statements = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            self.statements[sql] = self.statements.get(sql, 0) + 1
+            if elapsed >= self.slow_seconds:
+                self.slow.append((elapsed, sql))
+            entry = (elapsed, self.count, sql)
+            if len(self.slowest) < self.top_n:
+                heapq.heappush(self.slowest, entry)
+            elif elapsed > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, entry)
+
+    def duplicates(self, threshold):
+        return sorted(
+            ((sql, count) for sql, count in self.statements.items() if count >= threshold),
+            key=lambda item: -item[1]
+        )
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Records query count, DB time, view time and render time for every request.
+    Emits them as a Server-Timing header and a structured JSON log line on the
+    'api.sql' logger, logs slow statements, and flags duplicate statements with
+    the originating view. Configured by SQL_INSTRUMENTATION in api/settings.py.
+    """
+    def __init__(self, get_response):
+        config = getattr(settings, 'SQL_INSTRUMENTATION', {})
+        if not config.get('ENABLED'):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.slow_query_ms = config.get('SLOW_QUERY_MS', 100)
+        self.top_n = config.get('TOP_STATEMENTS', 3)
+        self.duplicate_threshold = config.get('DUPLICATE_THRESHOLD', 5)
+
+    def __call__(self, request):
+        stats = QueryStats(self.top_n, self.slow_query_ms / 1000)
+        request.query_stats = stats
+        request._instrumentation_view_end = None
+        started = perf_counter()
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            response = self.get_response(request)
+
+        total = perf_counter() - started
+        view_end = request._instrumentation_view_end or perf_counter()
+        render_end = getattr(request, '_instrumentation_render_end', None) or view_end
+        timings = {
+            'db': stats.duration * 1000,
+            'view': (view_end - started) * 1000,
+            'render': max(render_end - view_end, 0) * 1000,
+            'total': total * 1000,
+        }
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={timings["db"]:.1f};desc="{stats.count} queries"',
+            f'view;dur={timings["view"]:.1f}',
+            f'render;dur={timings["render"]:.1f}',
+            f'total;dur={timings["total"]:.1f}',
+        ])
+        self.log(request, response, stats, timings)
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns; time that separately
+        request._instrumentation_view_end = perf_counter()
+        response.add_post_render_callback(
+            lambda rendered: setattr(request, '_instrumentation_render_end', perf_counter())
+        )
+        return response
+
+    def log(self, request, response, stats, timings):
+        match = getattr(request, 'resolver_match', None)
+        view = match.url_name if match else None
+        duplicates = stats.duplicates(self.duplicate_threshold)
+
+        logger.info(json.dumps({
+            'view': view,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': stats.count,
+            'db_ms': round(timings['db'], 2),
+            'view_ms': round(timings['view'], 2),
+            'render_ms': round(timings['render'], 2),
+            'total_ms': round(timings['total'], 2),
+            'slowest': [
+                {'sql': sql, 'ms': round(elapsed * 1000, 2)}
+                for elapsed, _, sql in sorted(stats.slowest, reverse=True)
+            ],
+            'duplicates': [{'sql': sql, 'count': count} for sql, count in duplicates],
+        }))
+
+        for elapsed, sql in stats.slow:
+            logger.warning(json.dumps({
+                'event': 'slow_query', 'view': view, 'ms': round(elapsed * 1000, 2), 'sql': sql
+            }))
+        for sql, count in duplicates:
+            logger.warning(json.dumps({
+                'event': 'duplicate_queries', 'view': view, 'count': count, 'sql': sql
+            }))
@@ -0,0 +1,130 @@
+import os
+import sys
+import random
+import threading
+from collections import Counter
+from django.conf import settings
+from django.utils import timezone
+from django.core.exceptions import MiddlewareNotUsed
+
+PROFILE_SUFFIX = '.collapsed'
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    module = frame.f_globals.get('__name__', os.path.basename(code.co_filename))
+    return f"{module}:{code.co_name}"
+
+
+def collapse_stack(frame):
+    """
+    Renders a frame and its callers as a root-first, semicolon-separated stack.
+    """
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class StackSampler(threading.Thread):
+    """
+    Samples the stack of one thread every `interval` seconds until stopped.
+    """
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples[collapse_stack(frame)] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        return self.samples
+
+
+def write_profile(directory, view, samples, max_files):
+    """
+    Writes one request's samples in collapsed-stack format and drops the oldest
+    profiles beyond `max_files`.
+    """
+    os.makedirs(directory, exist_ok=True)
+    stamp = timezone.now().strftime("%Y%m%dT%H%M%S%f")
+    path = os.path.join(directory, f"{view}-{stamp}-{os.getpid()}{PROFILE_SUFFIX}")
+    with open(path, 'w') as handle:
+        for stack, count in samples.items():
+            handle.write(f"{stack} {count}\n")
+
+    profiles = sorted(
+        (entry for entry in os.scandir(directory) if entry.name.endswith(PROFILE_SUFFIX)),
+        key=lambda entry: entry.stat().st_mtime
+    )
+    for entry in profiles[:max(len(profiles) - max_files, 0)]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+    return path
+
+
+def read_profiles(directory, view=None):
+    """
+    Sums the collapsed stacks of every stored profile, optionally for one view.
+    """
+    totals = Counter()
+    if not os.path.isdir(directory):
+        return totals
+    for entry in os.scandir(directory):
+        if not entry.name.endswith(PROFILE_SUFFIX):
+            continue
+        if view and not entry.name.startswith(f"{view}-"):
+            continue
+        with open(entry.path) as handle:
+            for line in handle:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                if stack and count.isdigit():
+                    totals[stack] += int(count)
+    return totals
+
+
+class SamplingProfilerMiddleware:
+    """
+    Samples the call stack of a configurable fraction of requests to selected
+    views (PROFILING in api/settings.py) and stores each profile in a rotating
+    directory. The aggregate_profiles command merges them for flamegraph tools.
+    Keep it last in MIDDLEWARE so sampling starts right before the view runs.
+    """
+    def __init__(self, get_response):
+        config = getattr(settings, 'PROFILING', {})
+        if not config.get('ENABLED'):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.views = set(config.get('VIEWS', ()))
+        self.sample_rate = config.get('SAMPLE_RATE', 0.01)
+        self.interval = config.get('INTERVAL', 0.005)
+        self.directory = str(config.get('DIRECTORY'))
+        self.max_files = config.get('MAX_FILES', 500)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        sampler = getattr(request, '_profiler', None)
+        if sampler is not None:
+            samples = sampler.stop()
+            if samples:
+                write_profile(self.directory, request.resolver_match.url_name, samples, self.max_files)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.resolver_match.url_name not in self.views or random.random() >= self.sample_rate:
+            return None
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        request._profiler = sampler
+        sampler.start()
+        return None
@@ -0,0 +1,71 @@
+from rest_framework.renderers import JSONRenderer, BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+_encoder = JSONEncoder()
+
+
+def _default(obj):
+    # Types the fast encoders do not handle natively, and datetimes (which DRF
+    # formats with millisecond precision and a 'Z' suffix), go through DRF's encoder
+    return _encoder.default(obj)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Drop-in JSONRenderer that encodes with orjson when it is installed and the
+    output would be DRF's compact UTF-8 JSON, and with the stdlib otherwise.
+    The bytes match JSONRenderer's for the same data except for floats outside
+    [1e-4, 1e16): there JSONRenderer switches to exponents (5e-05, 1e+16) and
+    orjson does not or writes them shorter (0.00005, 1e16). NaN and Infinity
+    become null where JSONRenderer raises. Money is sent as strings; the only
+    floats are the attendance rates of the stats endpoints, rounded to four
+    places in [0, 1], where both encoders agree.
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or self.ensure_ascii or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(
+                data, default=_default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+            )
+        except TypeError:
+            # orjson.JSONEncodeError (a TypeError): integers beyond 64 bits,
+            # unsupported key types and the like
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Same strict javascript subset escaping as JSONRenderer
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Renders application/msgpack for clients that ask for it (readers, mobile).
+    Values are converted like the JSON output, so dates stay ISO 8601 strings.
+    Only registered when msgpack is installed.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_default, use_bin_type=True, datetime=False)
@@ -0,0 +1,77 @@
+import hashlib
+from functools import wraps
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+
+REPLICA_ALIAS = 'replica'
+# app_label of the model Django's DatabaseCache uses for its table
+CACHE_APP_LABEL = 'django_cache'
+
+# Set while a view decorated with read_from_replica is running
+_read_from_replica = ContextVar('read_from_replica', default=False)
+
+
+def replica_configured():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+def _pin_key(request):
+    # Token auth runs inside DRF, after middleware, so identify the client by its
+    # Authorization header and fall back to the remote address
+    identity = request.META.get('HTTP_AUTHORIZATION') or request.META.get('REMOTE_ADDR', '')
+    return 'replica-pin:' + hashlib.sha1(identity.encode()).hexdigest()
+
+
+def pin_to_primary(request):
+    """
+    Sends this client's reads to the primary for REPLICA_PIN_SECONDS so it reads
+    its own writes while the replica catches up. The pin lives in the default
+    cache, which must be shared by all workers for it to follow the client.
+    """
+    cache.set(_pin_key(request), True, getattr(settings, 'REPLICA_PIN_SECONDS', 10))
+
+
+def is_pinned(request):
+    return cache.get(_pin_key(request)) is not None
+
+
+def read_from_replica(view):
+    """
+    Decorator for safe, read-only views: their queries go to the replica unless the
+    client wrote recently. Has no effect when no replica database is configured.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not replica_configured() or is_pinned(request):
+            return view(request, *args, **kwargs)
+        token = _read_from_replica.set(True)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _read_from_replica.reset(token)
+    return wrapper
+
+
+class PrimaryReplicaRouter:
+    """
+    Routes reads made inside read_from_replica views to the replica and
+    everything else, including all writes, to the primary.
+    """
+    def db_for_read(self, model, **hints):
+        # The database cache holds the replica pins themselves: never read it from the replica
+        if model._meta.app_label == CACHE_APP_LABEL:
+            return 'default'
+        if _read_from_replica.get() and replica_configured():
+            return REPLICA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
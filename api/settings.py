@@ -1,5 +1,6 @@
 import os
 from pathlib import Path
+from importlib.util import find_spec
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -42,6 +43,9 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.MetricsMiddleware',
+    'api.middleware.CompressionMiddleware',
+    'api.middleware.QueryInstrumentationMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -49,6 +53,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.ReplicaPinningMiddleware',
+    'api.profiling.SamplingProfilerMiddleware',
 ]
 
 ROOT_URLCONF = 'api.urls'
@@ -90,13 +96,64 @@ if str(os.getenv("NODE_ENV"))=="production":
             }            
         }
     }
+    if os.getenv("PGREPLICA_HOST"):
+        DATABASES['replica'] = {
+            **DATABASES['default'],
+            'HOST': os.getenv("PGREPLICA_HOST"),
+            'PORT': os.getenv("PGREPLICA_PORT", os.getenv("PGPORT")),
+            'TEST': {'MIRROR': 'default'},
+        }
 else:
     DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # A file rather than the default shared-cache in-memory database, whose
+        # table locks fail at once instead of waiting: the locking tests run
+        # writers in several threads
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
+    # Local replica testing: copy db.sqlite3 to db_replica.sqlite3 and set SQLITE_REPLICA=1
+    if os.getenv("SQLITE_REPLICA"):
+        DATABASES['replica'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db_replica.sqlite3',
+            'TEST': {'MIRROR': 'default'},
+        }
+
+# Read-only reporting views marked with api.routers.read_from_replica use the
+# 'replica' alias when it is configured; clients that just wrote stay on the
+# primary for REPLICA_PIN_SECONDS
+DATABASE_ROUTERS = ['api.routers.PrimaryReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.getenv("REPLICA_PIN_SECONDS", 10))
+
+# Replica pins, throttle buckets and cached stats must be seen by every worker,
+# so production needs a shared default cache: Redis when REDIS_URL is set (needs
+# the redis package), or a database table named by CACHE_TABLE, which must be
+# created at deploy time with `python manage.py createcachetable`. Without
+# either, each process gets its own in-memory cache, which is only fit for
+# development; `manage.py check --deploy` reports it (home.checks)
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv("REDIS_URL"),
+        }
+    }
+elif os.getenv("CACHE_TABLE"):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': os.getenv("CACHE_TABLE"),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
 
 
 # Password validation
@@ -161,6 +218,113 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # orjson-backed JSON (stdlib fallback); msgpack on request when installed
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ] + (['api.renderers.MessagePackRenderer'] if find_spec('msgpack') else []),
+    # Reverse proxies in front of the app: throttles take the client address from
+    # the X-Forwarded-For entry they appended, never one the client wrote
+    'NUM_PROXIES': int(os.getenv("NUM_PROXIES", 0)),
+}
+
+# Responses at least this many bytes are brotli/gzip compressed when the client accepts it
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+
+# Per-request SQL instrumentation (Server-Timing header + JSON log on 'api.sql')
+SQL_INSTRUMENTATION = {
+    'ENABLED': os.getenv("SQL_INSTRUMENTATION", "0") == "1",
+    'SLOW_QUERY_MS': int(os.getenv("SLOW_QUERY_MS", 100)),
+    'TOP_STATEMENTS': 3,
+    # Identical statements repeated this often in one request are reported as N+1
+    'DUPLICATE_THRESHOLD': 5,
+}
+
+# Prometheus-style metrics served at /metrics (off unless METRICS_ENABLED=1).
+# Scrapers authenticate with METRICS_TOKEN as a bearer token; without a token
+# only ALLOWED_IPS may read them. Under gunicorn set METRICS_MULTIPROC_DIR to a
+# directory shared by the workers (cleared on deploy)
+METRICS = {
+    'ENABLED': os.getenv("METRICS_ENABLED", "0") == "1",
+    'TOKEN': os.getenv("METRICS_TOKEN"),
+    'ALLOWED_IPS': os.getenv("METRICS_ALLOWED_IPS", "127.0.0.1,::1").split(","),
+    'MULTIPROC_DIR': os.getenv("METRICS_MULTIPROC_DIR"),
+    'FLUSH_INTERVAL': 1.0,
+}
+
+# Opt-in sampling profiler: a SAMPLE_RATE fraction of requests to VIEWS get their
+# stack sampled every INTERVAL seconds; merge the results with aggregate_profiles
+PROFILING = {
+    'ENABLED': os.getenv("PROFILING", "0") == "1",
+    'VIEWS': os.getenv("PROFILE_VIEWS", "markAttendance,getAssignments").split(","),
+    'SAMPLE_RATE': float(os.getenv("PROFILE_SAMPLE_RATE", 0.01)),
+    'INTERVAL': 0.005,
+    'DIRECTORY': os.getenv("PROFILE_DIR", BASE_DIR / 'profiles'),
+    'MAX_FILES': 500,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'api': {
+            'handlers': ['console'],
+            'level': os.getenv("API_LOG_LEVEL", "INFO"),
+            'propagate': False,
+        },
+    },
+}
+
+# Attendance older than this many calendar months is moved to AttendanceArchive
+# by the archive_attendance command; detail views read it only with ?history=true
+ATTENDANCE_HOT_MONTHS = int(os.getenv("ATTENDANCE_HOT_MONTHS", 3))
+
+# How long /api/stats/attendance/ results are cached per group_by and date range
+ATTENDANCE_STATS_CACHE_SECONDS = int(os.getenv("ATTENDANCE_STATS_CACHE_SECONDS", 300))
+
+# Server-sent event streams (/api/attendance/stream/, ASGI only): events buffered
+# per client before it is dropped as too slow, and idle keepalive interval
+EVENT_STREAMS = {
+    'BUFFER_SIZE': int(os.getenv("EVENT_STREAM_BUFFER", 100)),
+    'HEARTBEAT_SECONDS': int(os.getenv("EVENT_STREAM_HEARTBEAT", 15)),
+}
+
+# markAttendance limits: tags accepted per request and tags handled per chunk
+ATTENDANCE_SCAN_LIMITS = {
+    'MAX_TAGS': int(os.getenv("SCAN_MAX_TAGS", 500)),
+    'CHUNK_SIZE': int(os.getenv("SCAN_CHUNK_SIZE", 50)),
+}
+
+# Token-bucket throttles (api/throttling.py): RATE tokens per second up to BURST,
+# per client IP (see NUM_PROXIES); a RATE of 0 disables the throttle.
+# 'scans' charges markAttendance one token per tag
+THROTTLES = {
+    'scans': {
+        'RATE': float(os.getenv("SCAN_THROTTLE_RATE", 20)),
+        'BURST': int(os.getenv("SCAN_THROTTLE_BURST", 200)),
+    },
+}
+
+# Load shedding on markAttendance: 503 + Retry-After while the moving average of
+# query latency is above LATENCY_MS, letting one probe request through per PROBE_SECONDS
+LOAD_SHEDDING = {
+    'ENABLED': os.getenv("LOAD_SHEDDING", "True") == "True",
+    'LATENCY_MS': float(os.getenv("LOAD_SHEDDING_LATENCY_MS", 100)),
+    'ALPHA': 0.2,
+    'PROBE_SECONDS': 1.0,
+    'RETRY_AFTER': int(os.getenv("LOAD_SHEDDING_RETRY_AFTER", 2)),
+}
+
+# Idempotency-Key handling on write endpoints: how long outcomes are replayed
+# and after how long a pending attempt is presumed dead and may be taken over
+IDEMPOTENCY = {
+    'TTL_SECONDS': int(os.getenv("IDEMPOTENCY_TTL_SECONDS", 24 * 3600)),
+    'LOCK_SECONDS': int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", 60)),
 }
 
 # CSRF_TRUSTED_ORIGINS = ['','https://*.127.0.0.1']
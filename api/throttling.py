@@ -0,0 +1,200 @@
+import os
+import math
+import time
+import threading
+from functools import wraps
+from contextlib import ExitStack
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import BaseThrottle
+from rest_framework.utils import html
+from api.metrics import REGISTRY, Counter, Gauge
+
+THROTTLED_REQUESTS = REGISTRY.register(Counter(
+    'http_requests_throttled_total', 'Requests refused by a token-bucket throttle.', ('scope',)
+))
+SHED_REQUESTS = REGISTRY.register(Counter(
+    'http_requests_shed_total', 'Requests refused with 503 while the database was overloaded.', ('view',)
+))
+# Each process keeps its own average, so samples are labelled by pid rather than summed
+DB_LATENCY_EWMA = REGISTRY.register(Gauge(
+    'db_query_latency_ewma_seconds', 'Moving average of query latency seen by load-shedding views.', ('pid',)
+))
+
+# Serializes read-modify-write of buckets within this process
+_bucket_lock = threading.Lock()
+
+
+def client_ident(request):
+    """
+    The client address throttles key on: REMOTE_ADDR, or the X-Forwarded-For
+    entry appended by the REST_FRAMEWORK['NUM_PROXIES'] trusted proxies.
+    """
+    return BaseThrottle().get_ident(request)
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Token bucket per client IP: it holds up to BURST tokens, refilled at RATE
+    tokens per second, and a request needs get_cost() tokens from it.
+    Configured by settings.THROTTLES[scope]; a RATE of 0 disables it. The IP is
+    REMOTE_ADDR, or with REST_FRAMEWORK['NUM_PROXIES'] set the address those
+    proxies appended to X-Forwarded-For, so clients cannot pick their bucket.
+    Buckets live in the shared default cache; updates are serialized within a
+    process only, so concurrent requests on different workers may overdraw a
+    bucket by a request each.
+    """
+    scope = None
+
+    def get_config(self):
+        return getattr(settings, 'THROTTLES', {}).get(self.scope, {})
+
+    def get_cost(self, request):
+        return 1
+
+    def get_bucket_keys(self, request):
+        return [f'throttle:{self.scope}:ip:{self.get_ident(request)}']
+
+    def allow_request(self, request, view):
+        config = self.get_config()
+        rate, burst = config.get('RATE', 0), config.get('BURST', 1)
+        if not rate:
+            return True
+
+        cost = min(self.get_cost(request), burst)
+        keys = self.get_bucket_keys(request)
+        now = time.time()
+        with _bucket_lock:
+            levels = {}
+            for key in keys:
+                tokens, updated = cache.get(key) or (burst, now)
+                levels[key] = min(burst, tokens + (now - updated) * rate)
+            shortfall = max(cost - tokens for tokens in levels.values())
+            if shortfall > 0:
+                self.retry_after = shortfall / rate
+                THROTTLED_REQUESTS.inc(scope=self.scope)
+                return False
+            # A bucket untouched for this long is full again and can be forgotten
+            timeout = math.ceil(burst / rate) + 1
+            cache.set_many({key: (tokens - cost, now) for key, tokens in levels.items()}, timeout)
+        return True
+
+    def wait(self):
+        return getattr(self, 'retry_after', None)
+
+
+def scan_tag_ids(data):
+    """
+    The tag_ids list of a markAttendance body, read the way the serializer's
+    ListField reads it: a JSON list, or repeated (or indexed) form fields of a
+    multipart or urlencoded body. Returns None when there is no such list.
+    """
+    if html.is_html_input(data):
+        if 'tag_ids' in data:
+            return data.getlist('tag_ids')
+        return html.parse_html_list(data, prefix='tag_ids', default=None)
+    tag_ids = data.get('tag_ids') if isinstance(data, dict) else None
+    return tag_ids if isinstance(tag_ids, list) else None
+
+
+class ScanThrottle(TokenBucketThrottle):
+    """
+    markAttendance throttle, charged one token per tag in the payload.
+    """
+    scope = 'scans'
+
+    def get_cost(self, request):
+        return max(1, len(scan_tag_ids(request.data) or ()))
+
+
+def throttle(*throttle_classes):
+    """
+    Decorator applying throttles inside the view function, after decorators
+    listed above it (such as @idempotent replays) have had their say; DRF's
+    throttle_classes always run first. Refuses with DRF's usual 429 response.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            waits = []
+            for throttle_class in throttle_classes:
+                instance = throttle_class()
+                if not instance.allow_request(request, None):
+                    waits.append(instance.wait())
+            if waits:
+                known = [wait for wait in waits if wait is not None]
+                raise Throttled(max(known) if known else None)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class LatencyMonitor:
+    """
+    Exponentially weighted moving average of database query latency. While it
+    is above LOAD_SHEDDING['LATENCY_MS'], should_shed() refuses requests except
+    for one probe per PROBE_SECONDS, whose queries let the average recover.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.average = 0.0
+        self.last_probe = 0.0
+
+    def config(self):
+        return getattr(settings, 'LOAD_SHEDDING', {})
+
+    def observe(self, seconds):
+        alpha = self.config().get('ALPHA', 0.2)
+        with self.lock:
+            self.average += alpha * (seconds - self.average)
+            average = self.average
+        DB_LATENCY_EWMA.set(average, pid=os.getpid())
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def should_shed(self):
+        config = self.config()
+        if not config.get('ENABLED', False):
+            return False
+        with self.lock:
+            if self.average * 1000 < config.get('LATENCY_MS', 100):
+                return False
+            now = time.monotonic()
+            if now - self.last_probe >= config.get('PROBE_SECONDS', 1.0):
+                self.last_probe = now
+                return False
+            return True
+
+
+DB_LATENCY = LatencyMonitor()
+
+
+def shed_load(view):
+    """
+    Decorator answering 503 with Retry-After while DB_LATENCY reports overload,
+    so a saturated database drains instead of queueing more work. Queries made
+    by the view feed the latency average.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if DB_LATENCY.should_shed():
+            SHED_REQUESTS.inc(view=view.__name__)
+            return Response(
+                {"error": "The server is overloaded. Retry shortly."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': str(DB_LATENCY.config().get('RETRY_AFTER', 2))}
+            )
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(DB_LATENCY))
+            return view(request, *args, **kwargs)
+    return wrapper
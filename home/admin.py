@@ -1,6 +1,70 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections, DatabaseError
+from django.utils.functional import cached_property
 from home.models import *
 
+# Below this many rows an exact COUNT(*) is cheap enough
+ESTIMATED_COUNT_THRESHOLD = 100000
+
+
+def estimated_row_count(model, using='default'):
+    """
+    Planner statistics row count of a model's table, or None where the database
+    keeps none (SQLite before ANALYZE).
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute("SELECT reltuples FROM pg_class WHERE oid = %s::regclass", [table])
+            elif connection.vendor == 'sqlite':
+                cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+            else:
+                return None
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if not row or row[0] is None:
+        return None
+    # sqlite_stat1 stores the row count as the first number of its stat column
+    estimate = int(float(str(row[0]).split()[0]))
+    return estimate if estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Uses the planner's row estimate for unfiltered changelists of large tables
+    instead of a COUNT(*) over every row. Filtered and searched lists, and
+    tables under ESTIMATED_COUNT_THRESHOLD, still get an exact count.
+    """
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelist settings for tables that grow with every scan: estimated counts,
+    no second unfiltered count, and list_select_related also applied to
+    autocomplete lookups so their labels do not query per row.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        queryset, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if self.list_select_related:
+            queryset = queryset.select_related(*self.list_select_related)
+        return queryset, may_have_duplicates
+
+
 @admin.register(Department)
 class DepartmentAdmin(admin.ModelAdmin):
     list_display = ('name', 'day_salary')
@@ -18,23 +82,40 @@ class FieldAdmin(admin.ModelAdmin):
     search_fields = ('name',)
 
 @admin.register(AssignmentGroup)
-class AssignmentGroupAdmin(admin.ModelAdmin):
-    list_display = ('name', 'supervisor', 'field', 'department', 'end_date', 'is_active')
+class AssignmentGroupAdmin(LargeTableAdmin):
+    list_display = ('name', 'supervisor', 'field', 'department', 'end_date', 'is_active', 'active_employees', 'total_employees')
     list_filter = ('department', 'field', 'is_active')
-    search_fields = ('name', 'supervisor', 'field__name', 'department__name')
+    list_select_related = ('supervisor', 'field', 'department')
+    search_fields = ('name', 'supervisor__name', 'field__name', 'department__name')
+    autocomplete_fields = ('supervisor', 'field', 'department')
+    ordering = ('-id',)
 
 @admin.register(EmployeeAssignment)
-class EmployeeAssignmentAdmin(admin.ModelAdmin):
+class EmployeeAssignmentAdmin(LargeTableAdmin):
     list_display = ('employee', 'assignment_group', 'end_date', 'status')
     list_filter = ('status', )
+    list_select_related = ('employee', 'assignment_group__field', 'assignment_group__department')
     search_fields = ('employee__name', 'assignment_group__name')
+    autocomplete_fields = ('employee', 'assignment_group')
+    ordering = ('-id',)
 
 @admin.register(Attendance)
-class AttendanceAdmin(admin.ModelAdmin):
+class AttendanceAdmin(LargeTableAdmin):
     list_display = ('employee_assignment', 'date', 'attended', 'day_salary', 'created_at')
+    # date is indexed; date_hierarchy is left out as it aggregates dates over the whole table
     list_filter = ('attended', 'date')
+    list_select_related = ('employee_assignment__employee', 'employee_assignment__assignment_group')
     search_fields = ('employee_assignment__employee__name', 'day_salary')
-    date_hierarchy = 'date'
+    autocomplete_fields = ('employee_assignment',)
     readonly_fields = ('created_at', 'updated_at')
 
+@admin.register(AttendanceArchive)
+class AttendanceArchiveAdmin(LargeTableAdmin):
+    list_display = ('employee_assignment', 'date', 'attended', 'day_salary', 'archived_at')
+    list_filter = ('attended',)
+    list_select_related = ('employee_assignment__employee', 'employee_assignment__assignment_group')
+    search_fields = ('employee_assignment__employee__name',)
+    autocomplete_fields = ('employee_assignment',)
+    readonly_fields = ('created_at', 'updated_at', 'archived_at')
+
 # Register all models in a structured and organized manner
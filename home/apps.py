@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def install_search_triggers(sender, using, **kwargs):
+    from home.search import install_search_triggers
+    install_search_triggers(using)
 
 
 class HomeConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'home'
+
+    def ready(self):
+        import home.checks  # noqa: F401
+        import home.signals  # noqa: F401
+        post_migrate.connect(install_search_triggers, sender=self)
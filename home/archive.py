@@ -0,0 +1,90 @@
+import datetime
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from home.models import Attendance, AttendanceArchive
+from home.changes import record_changes, DELETE
+
+# Columns copied verbatim from home_attendance into home_attendancearchive
+ARCHIVE_COLUMNS = (
+    'id', 'employee_assignment_id', 'date', 'attended', 'day_salary',
+    'is_supervisor', 'created_at', 'updated_at'
+)
+# Rows copied and deleted per statement, within SQLite's bound parameter limit
+ARCHIVE_BATCH_SIZE = 500
+
+
+def month_start(value):
+    return value.replace(day=1)
+
+
+def hot_cutoff(today=None):
+    """
+    Returns the first day of the oldest month kept in the hot Attendance table.
+    Everything dated before it belongs to a closed payroll period.
+    """
+    today = today or timezone.now().date()
+    months = getattr(settings, 'ATTENDANCE_HOT_MONTHS', 3)
+    year, month = today.year, today.month - months
+    while month < 1:
+        month += 12
+        year -= 1
+    return datetime.date(year, month, 1)
+
+
+def wants_history(request):
+    """
+    Detail views only read the hot table unless the caller asks for ?history=true.
+    """
+    return request.query_params.get('history', '').lower() == 'true'
+
+
+def archivable_dates(before):
+    return list(
+        Attendance.objects.filter(date__lt=before)
+        .order_by('date')
+        .values_list('date', flat=True)
+        .distinct()
+    )
+
+
+def archive_attendance(before, dry_run=False):
+    """
+    Moves attendance dated before `before` (rounded down to a month boundary so a
+    payroll period is never split) into AttendanceArchive, one day per transaction.
+    Returns a dict with the cutoff used and the number of rows moved per month.
+    """
+    before = month_start(before)
+    moved = {}
+    columns = ', '.join(ARCHIVE_COLUMNS)
+    archive_table = AttendanceArchive._meta.db_table
+    hot_table = Attendance._meta.db_table
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+
+    for day in archivable_dates(before):
+        if dry_run:
+            count = Attendance.objects.filter(date=day).count()
+        else:
+            with transaction.atomic():
+                # Lock the day's rows and fix their ids first, so the copy and the
+                # delete act on exactly the same rows even if scans commit meanwhile
+                ids = list(
+                    Attendance.objects.select_for_update().filter(date=day).values_list('id', flat=True)
+                )
+                with connection.cursor() as cursor:
+                    for start in range(0, len(ids), ARCHIVE_BATCH_SIZE):
+                        batch = ids[start:start + ARCHIVE_BATCH_SIZE]
+                        placeholders = ', '.join(['%s'] * len(batch))
+                        cursor.execute(
+                            f"INSERT INTO {archive_table} ({columns}, archived_at) "
+                            f"SELECT {columns}, %s FROM {hot_table} WHERE id IN ({placeholders})",
+                            [now, *batch]
+                        )
+                        cursor.execute(f"DELETE FROM {hot_table} WHERE id IN ({placeholders})", batch)
+                # Archived rows leave the hot attendance list: feed them as deletes
+                record_changes(Attendance, ids, DELETE)
+                count = len(ids)
+        period = day.strftime("%Y-%m")
+        moved[period] = moved.get(period, 0) + count
+
+    return {"before": before, "moved": moved}
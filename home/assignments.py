@@ -0,0 +1,277 @@
+from collections import Counter
+from django.db import transaction, IntegrityError
+from django.db.models import Value, F, Q, Count, OuterRef, Subquery
+from django.db.models.functions import Concat, Coalesce
+from django.utils import timezone
+from django.core.exceptions import ValidationError
+from home.models import Employee, AssignmentGroup, EmployeeAssignment
+from home.changes import record_changes
+
+ACTIVE_ELSEWHERE = "Employee is already assigned to another active group."
+ALREADY_IN_GROUP = "Employee is already assigned to this group."
+# Partial unique constraint on EmployeeAssignment: one active group per employee
+ACTIVE_CONSTRAINT = 'home_unique_active_assignment'
+
+
+def adjust_group_counters(group_id, total=0, active=0):
+    """
+    Atomically shifts a group's total_employees/active_employees counters.
+    """
+    if total or active:
+        AssignmentGroup.objects.filter(pk=group_id).update(
+            total_employees=F('total_employees') + total,
+            active_employees=F('active_employees') + active
+        )
+        record_changes(AssignmentGroup, [group_id])
+
+
+def recount_groups(group_ids=None):
+    """
+    Recomputes the employee counters of every group (or of `group_ids`) from
+    their assignments and writes only the groups that drifted.
+    Returns the ids of the groups that were corrected.
+    """
+    def count(**filters):
+        return Subquery(
+            EmployeeAssignment.objects.filter(assignment_group=OuterRef('pk'), **filters)
+            .order_by().values('assignment_group').annotate(n=Count('id')).values('n')[:1]
+        )
+
+    groups = AssignmentGroup.objects.all()
+    if group_ids is not None:
+        groups = groups.filter(pk__in=group_ids)
+    actual = groups.annotate(actual_total=count(), actual_active=count(status='active'))
+    drifted = list(
+        actual.filter(
+            ~Q(total_employees=Coalesce(F('actual_total'), 0))
+            | ~Q(active_employees=Coalesce(F('actual_active'), 0))
+        ).values_list('pk', flat=True)
+    )
+    if drifted:
+        AssignmentGroup.objects.filter(pk__in=drifted).update(
+            total_employees=Coalesce(count(), 0),
+            active_employees=Coalesce(count(status='active'), 0)
+        )
+        record_changes(AssignmentGroup, drifted)
+    return drifted
+
+
+def _conflict_message(error):
+    """
+    Tells from the constraint an EmployeeAssignment insert violated whether the
+    employee is active in another group or already in this one. Re-raises any
+    other integrity error.
+    """
+    diag = getattr(error.__cause__, 'diag', None)
+    if diag is not None:
+        # PostgreSQL names the constraint; unique_together ones end in _uniq
+        constraint = diag.constraint_name or ''
+        if constraint == ACTIVE_CONSTRAINT:
+            return ACTIVE_ELSEWHERE
+        if constraint.endswith('_uniq'):
+            return ALREADY_IN_GROUP
+        raise error
+    # SQLite names the columns: "UNIQUE constraint failed: <table>.employee_id"
+    # for the partial index, both columns for unique_together
+    message = str(error)
+    if not message.startswith('UNIQUE constraint failed'):
+        raise error
+    return ALREADY_IN_GROUP if 'assignment_group_id' in message else ACTIVE_ELSEWHERE
+
+
+def assign_employees(group, employee_ids):
+    """
+    Adds employees to `group` as active assignments. Employees already in the
+    group, in any status, are reported up front. The one-active-assignment rule
+    is enforced by the database (home_unique_active_assignment): the whole batch
+    is inserted at once and only when that fails is it retried row by row, each
+    in a savepoint, with the violated constraint naming the error.
+    Returns (assigned employee ids, [{"employee_id", "error"}] for the rest).
+    """
+    failed = []
+    candidates = []
+    for employee_id in employee_ids:
+        try:
+            candidates.append(int(employee_id))
+        except (TypeError, ValueError):
+            failed.append({"employee_id": employee_id, "error": "Invalid employee ID."})
+    # After int() so "5" and 5 count once
+    candidates = list(dict.fromkeys(candidates))
+
+    existing = set(Employee.objects.filter(id__in=candidates).values_list('id', flat=True))
+    in_group = set(
+        EmployeeAssignment.objects.filter(assignment_group=group, employee_id__in=existing)
+        .values_list('employee_id', flat=True)
+    )
+    for employee_id in candidates:
+        if employee_id not in existing:
+            failed.append({"employee_id": employee_id, "error": "Employee not found."})
+        elif employee_id in in_group:
+            failed.append({"employee_id": employee_id, "error": ALREADY_IN_GROUP})
+    candidates = [employee_id for employee_id in candidates if employee_id in existing - in_group]
+    if not candidates:
+        return [], failed
+
+    try:
+        with transaction.atomic():
+            created = EmployeeAssignment.objects.bulk_create([
+                EmployeeAssignment(assignment_group=group, employee_id=employee_id)
+                for employee_id in candidates
+            ])
+            # bulk_create sends no signals; count and log the batch here
+            adjust_group_counters(group.pk, total=len(candidates), active=len(candidates))
+            record_changes(EmployeeAssignment, [assignment.pk for assignment in created])
+        return candidates, failed
+    except IntegrityError:
+        pass
+
+    assigned = []
+    for employee_id in candidates:
+        try:
+            with transaction.atomic():
+                EmployeeAssignment.objects.create(assignment_group=group, employee_id=employee_id)
+            assigned.append(employee_id)
+        except IntegrityError as e:
+            failed.append({"employee_id": employee_id, "error": _conflict_message(e)})
+    return assigned, failed
+
+
+def end_assignment_groups(group_ids, end_date, reason=None):
+    """
+    Ends the active groups among `group_ids` and completes their active employee
+    assignments as of `end_date`, in a fixed number of statements however large
+    the crews are. A reason, when given, is appended to each group's notes.
+    Raises ValidationError, before writing anything, when end_date precedes a
+    group's creation or an employee's assignment date.
+    Returns (ended group ids, number of employee assignments completed).
+    """
+    with transaction.atomic():
+        groups = AssignmentGroup.objects.filter(id__in=group_ids, is_active=True)
+        ended_ids = list(groups.select_for_update().values_list('id', flat=True))
+        if not ended_ids:
+            return [], 0
+
+        early_groups = list(groups.filter(created_date__gt=end_date).values_list('id', flat=True))
+        if early_groups:
+            raise ValidationError(
+                f"End date cannot be before the assignment start date (groups {early_groups})."
+            )
+        active_assignments = EmployeeAssignment.objects.filter(
+            assignment_group_id__in=ended_ids,
+            status='active'
+        )
+        late_employees = list(
+            active_assignments.filter(assigned_date__gt=end_date).values_list('employee__name', flat=True)[:10]
+        )
+        if late_employees:
+            raise ValidationError(
+                f"End date cannot be before assignment date for employees: {', '.join(map(str, late_employees))}"
+            )
+
+        # Every active assignment of these groups is completed below
+        changes = {'is_active': False, 'end_date': end_date, 'active_employees': 0}
+        if reason is not None:
+            timestamp = timezone.now().strftime("%Y-%m-%d %H:%M:%S")
+            changes['notes'] = Concat(
+                Coalesce('notes', Value('')),
+                Value(f"\n[{timestamp}] Assignment ended - Reason: {reason}")
+            )
+        AssignmentGroup.objects.filter(id__in=ended_ids).update(**changes)
+
+        completed_ids = list(active_assignments.values_list('id', flat=True))
+        employees_updated = active_assignments.update(status='completed', end_date=end_date)
+        record_changes(AssignmentGroup, ended_ids)
+        record_changes(EmployeeAssignment, completed_ids)
+    return ended_ids, employees_updated
+
+
+def rollover_assignment_groups(group_ids, season, end_date, names=None, exclude_employee_ids=(), reason=None):
+    """
+    Season rollover: clones the active groups among `group_ids` (same field,
+    department and supervisor) together with their active crews, minus
+    `exclude_employee_ids`, then ends the old groups as of `end_date`, all in
+    one transaction and with bulk statements only. New groups are named
+    `names[old id]` or "<old name> - <season>".
+    Raises ValidationError when a new name is taken or repeated, or the end date
+    is invalid.
+    Returns one dict per rolled over group with the old and new ids, the new
+    name and the number of employees carried over.
+    """
+    names = {int(group_id): name for group_id, name in (names or {}).items()}
+    with transaction.atomic():
+        groups = list(
+            AssignmentGroup.objects.select_for_update()
+            .filter(id__in=group_ids, is_active=True)
+            .select_related('department')
+            .order_by('id')
+        )
+        if not groups:
+            return []
+
+        new_names = {group.id: names.get(group.id) or f"{group.name} - {season}" for group in groups}
+        # The new groups must not clash with each other either
+        repeated = Counter(
+            (new_names[group.id], group.field_id, group.department_id) for group in groups
+        )
+        repeated = sorted({name for (name, _, _), count in repeated.items() if count > 1})
+        if repeated:
+            raise ValidationError(f"New assignment group names {repeated} are given to more than one group.")
+
+        taken = AssignmentGroup.objects.filter(
+            name__in=set(new_names.values()),
+            field_id__in={group.field_id for group in groups},
+            department_id__in={group.department_id for group in groups}
+        ).values_list('name', 'field_id', 'department_id')
+        clashes = set(taken) & {
+            (new_names[group.id], group.field_id, group.department_id) for group in groups
+        }
+        if clashes:
+            raise ValidationError(
+                f"Assignment groups named {sorted(name for name, _, _ in clashes)} already exist."
+            )
+
+        crews = {}
+        for group_id, employee_id in (
+            EmployeeAssignment.objects.filter(assignment_group__in=groups, status='active')
+            .exclude(employee_id__in=exclude_employee_ids)
+            .order_by('id')
+            .values_list('assignment_group_id', 'employee_id')
+        ):
+            crews.setdefault(group_id, []).append(employee_id)
+
+        # Complete the old crews first so no employee is ever active twice
+        end_assignment_groups([group.id for group in groups], end_date, reason)
+
+        new_groups = AssignmentGroup.objects.bulk_create([
+            AssignmentGroup(
+                name=new_names[group.id],
+                field_id=group.field_id,
+                department_id=group.department_id,
+                supervisor_id=group.supervisor_id,
+                day_salary=group.department.day_salary,
+                notes=f"Rolled over from assignment group {group.id} ({group.name}).",
+                total_employees=len(crews.get(group.id, [])),
+                active_employees=len(crews.get(group.id, []))
+            )
+            for group in groups
+        ])
+        new_assignments = EmployeeAssignment.objects.bulk_create(
+            [
+                EmployeeAssignment(assignment_group=new_group, employee_id=employee_id)
+                for group, new_group in zip(groups, new_groups)
+                for employee_id in crews.get(group.id, [])
+            ],
+            batch_size=1000
+        )
+        record_changes(AssignmentGroup, [new_group.pk for new_group in new_groups])
+        record_changes(EmployeeAssignment, [assignment.pk for assignment in new_assignments])
+
+    return [
+        {
+            "old_assignment": group.id,
+            "new_assignment": new_group.id,
+            "name": new_group.name,
+            "employees": len(crews.get(group.id, []))
+        }
+        for group, new_group in zip(groups, new_groups)
+    ]
@@ -0,0 +1,290 @@
+import calendar
+import datetime
+from django.db import connection, transaction
+from django.utils import timezone
+from decimal import Decimal
+from django.db.models import OuterRef, Subquery, Sum, Count, F, Q, Value, Case, When, BigIntegerField, DecimalField
+from django.db.models.functions import Cast, Power, ExtractDay, Replace, TruncWeek, TruncMonth
+from django.db.models.lookups import Regex
+from home.models import Employee, Attendance, AttendanceArchive, AssignmentGroup, EmployeeAssignment
+from home.archive import hot_cutoff
+from home.changes import record_changes
+
+# Day states used by the run-length calendar encoding
+PRESENT, ABSENT, UNMARKED = 'P', 'A', '-'
+
+# Longest date range find_absentees() accepts
+ABSENTEE_MAX_DAYS = 31
+# Rows inserted per statement by materialize_absentees: three parameters each,
+# within SQLite's bound parameter limit
+ABSENTEE_BATCH_SIZE = 300
+
+# attendance_stats() groupings: the key expression and, for entities, the name shown
+_GROUP = 'employee_assignment__assignment_group'
+STATS_GROUPINGS = {
+    'department': (F(f'{_GROUP}__department_id'), F(f'{_GROUP}__department__name')),
+    'field': (F(f'{_GROUP}__field_id'), F(f'{_GROUP}__field__name')),
+    'assignment_group': (F(f'{_GROUP}_id'), F(f'{_GROUP}__name')),
+    'supervisor': (F(f'{_GROUP}__supervisor_id'), F(f'{_GROUP}__supervisor__name')),
+    'day': (F('date'), None),
+    'week': (TruncWeek('date'), None),
+    'month': (TruncMonth('date'), None),
+}
+# day_salary values attendance_stats() sums: plain numbers fitting numeric(14, 2)
+SALARY_PATTERN = r'^ *-?[0-9]{1,12}(\.[0-9]+)? *$'
+
+
+def refresh_last_attendance(employee_ids=None):
+    """
+    Recomputes Employee.last_attended_at / last_assignment from attendance marked
+    present, in a single UPDATE. Limits the update to `employee_ids` when given.
+    Returns the number of employees updated.
+    """
+    latest = Attendance.objects.filter(
+        employee_assignment__employee=OuterRef('pk'),
+        attended=True
+    ).order_by('-created_at')
+
+    employees = Employee.objects.all()
+    if employee_ids is not None:
+        employees = employees.filter(pk__in=employee_ids)
+
+    return employees.update(
+        last_attended_at=Subquery(latest.values('created_at')[:1]),
+        last_assignment=Subquery(latest.values('employee_assignment')[:1])
+    )
+
+
+def month_bounds(month):
+    """
+    Parses 'YYYY-MM' and returns (first day, first day of next month, days in month).
+    Raises ValueError on malformed input.
+    """
+    start = datetime.datetime.strptime(month, "%Y-%m").date()
+    days = calendar.monthrange(start.year, start.month)[1]
+    return start, start + datetime.timedelta(days=days), days
+
+
+def attendance_calendar(month, **filters):
+    """
+    Builds a month's employee x day grid for attendance matching `filters`, as a
+    list of (employee_id, name, tag_id, present, absent) ordered by name. `present`
+    and `absent` are bitsets with bit d-1 set for day d. An employee marked present
+    in one assignment and absent in another on the same day counts as present.
+    Each table is read with one grouped query; the archive only for months that
+    are older than the hot window.
+    """
+    start, end, days = month_bounds(month)
+    # 2^(day - 1); summing distinct powers of two is a portable bitwise OR
+    day_bit = Cast(Power(Value(2), ExtractDay('date') - 1), BigIntegerField())
+    employee = 'employee_assignment__employee'
+    models = [Attendance] + ([AttendanceArchive] if start < hot_cutoff() else [])
+
+    grid = {}
+    for model in models:
+        rows = (
+            model.objects.filter(date__gte=start, date__lt=end, **filters)
+            .values_list(f'{employee}_id', f'{employee}__name', f'{employee}__tag_id')
+            .annotate(
+                present=Sum(day_bit, filter=Q(attended=True), distinct=True),
+                recorded=Sum(day_bit, distinct=True)
+            )
+            .order_by()
+        )
+        for employee_id, name, tag_id, present, recorded in rows:
+            entry = grid.setdefault(employee_id, [name, tag_id, 0, 0])
+            entry[2] |= present or 0
+            entry[3] |= recorded
+
+    return days, sorted(
+        (
+            (employee_id, name, tag_id, present, recorded & ~present)
+            for employee_id, (name, tag_id, present, recorded) in grid.items()
+        ),
+        key=lambda row: (row[1] or '', row[0])
+    )
+
+
+def run_length(present, absent, days):
+    """
+    Run-length encodes a month row as e.g. '3P1A2-25P': counts of consecutive days
+    that are present (P), absent (A) or have no record (-).
+    """
+    runs = []
+    for day in range(days):
+        bit = 1 << day
+        state = PRESENT if present & bit else ABSENT if absent & bit else UNMARKED
+        if runs and runs[-1][1] == state:
+            runs[-1][0] += 1
+        else:
+            runs.append([1, state])
+    return ''.join(f"{count}{state}" for count, state in runs)
+
+
+def attendance_stats(start, end, group_by):
+    """
+    Aggregates attendance dated from `start` to `end` inclusive per STATS_GROUPINGS
+    entry: records, present and absent counts, attendance rate and the salary
+    earned on present days (the records' day_salary snapshots). Each table is
+    read with one grouped query, the archive only when the range reaches into
+    archived months. Rows are ordered by period, or by name for entities.
+    """
+    key, label = STATS_GROUPINGS[group_by]
+    # day_salary is free text: drop thousands separators and sum only values that
+    # are plain numbers, since a failed CAST aborts the whole query on PostgreSQL
+    amount = Replace('day_salary', Value(','), Value(''))
+    salary = Case(
+        When(Regex(amount, SALARY_PATTERN), then=Cast(amount, DecimalField(max_digits=14, decimal_places=2))),
+        default=None
+    )
+    models = [Attendance] + ([AttendanceArchive] if start < hot_cutoff() else [])
+
+    groups = {}
+    for model in models:
+        columns = {'key': key} if label is None else {'key': key, 'label': label}
+        rows = (
+            model.objects.filter(date__gte=start, date__lte=end)
+            .annotate(**columns)
+            .values_list(*columns)
+            .annotate(
+                records=Count('id'),
+                present=Count('id', filter=Q(attended=True)),
+                salary=Sum(salary, filter=Q(attended=True))
+            )
+            .order_by()
+        )
+        for row in rows:
+            group_key, group_label = row[0], row[1] if label is not None else None
+            records, present, earned = row[-3:]
+            entry = groups.setdefault(group_key, [group_label, 0, 0, Decimal(0)])
+            entry[1] += records
+            entry[2] += present
+            entry[3] += earned or 0
+
+    ordered = sorted(
+        groups.items(),
+        key=lambda item: (
+            item[0] is None,
+            item[0] if label is None else ((item[1][0] or ''), item[0])
+        )
+    )
+    return [
+        {
+            "key": group_key,
+            "name": group_label,
+            "records": records,
+            "present": present,
+            "absent": records - present,
+            "rate": round(present / records, 4) if records else None,
+            "salary": str(earned.quantize(Decimal('0.01')))
+        }
+        for group_key, (group_label, records, present, earned) in ordered
+    ]
+
+
+def find_absentees(start, end, group_ids=None):
+    """
+    Returns one (assignment_id, employee_id, employee_name, employee_tag_id,
+    group_id, group_name, day_salary, date) tuple per active assignment and day
+    in [start, end] with no attendance record at all. Computed by a single
+    anti-join of active assignments x days against attendance, ordered by group,
+    date and employee. Raises ValueError for ranges that are reversed, longer
+    than ABSENTEE_MAX_DAYS, in the future or reaching into archived months.
+    """
+    if end < start:
+        raise ValueError("End date cannot be before start date.")
+    if (end - start).days + 1 > ABSENTEE_MAX_DAYS:
+        raise ValueError(f"Date range cannot exceed {ABSENTEE_MAX_DAYS} days.")
+    if end > timezone.now().date():
+        raise ValueError("Cannot detect absences for future dates.")
+    if start < hot_cutoff():
+        raise ValueError("Date range reaches into archived months.")
+
+    days = [start + datetime.timedelta(days=offset) for offset in range((end - start).days + 1)]
+    by_value = {day.isoformat(): day for day in days}
+    # Untyped parameters in VALUES are text on PostgreSQL
+    placeholder = 'CAST(%s AS DATE)' if connection.vendor == 'postgresql' else '%s'
+    params = [connection.ops.adapt_datefield_value(day) for day in days]
+
+    group_filter = ''
+    if group_ids:
+        group_filter = f"AND ea.assignment_group_id IN ({', '.join(['%s'] * len(group_ids))})"
+        params += list(group_ids)
+
+    sql = f"""
+        WITH days (day) AS (VALUES {', '.join(f'({placeholder})' for _ in days)})
+        SELECT ea.id, e.id, e.name, e.tag_id, ag.id, ag.name, ag.day_salary, days.day
+        FROM {EmployeeAssignment._meta.db_table} ea
+        JOIN {AssignmentGroup._meta.db_table} ag ON ag.id = ea.assignment_group_id
+        JOIN {Employee._meta.db_table} e ON e.id = ea.employee_id
+        CROSS JOIN days
+        LEFT JOIN {Attendance._meta.db_table} a
+            ON a.employee_assignment_id = ea.id AND a.date = days.day
+        WHERE ea.status = %s AND ag.is_active = %s AND ea.assigned_date <= days.day
+            {group_filter}
+            AND a.id IS NULL
+        ORDER BY ag.id, days.day, e.id
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params[:len(days)] + ['active', True] + params[len(days):])
+        return [row[:7] + (by_value[str(row[7])[:10]],) for row in cursor.fetchall()]
+
+
+def summarize_absentees(absentees):
+    """
+    Groups find_absentees() rows per assignment group: absence count, distinct
+    employees and absences per date.
+    """
+    groups = {}
+    for _, employee_id, _, _, group_id, group_name, _, day in absentees:
+        summary = groups.setdefault(group_id, {
+            "assignment_group": group_id,
+            "name": group_name,
+            "absences": 0,
+            "employees": set(),
+            "by_date": {}
+        })
+        summary["absences"] += 1
+        summary["employees"].add(employee_id)
+        summary["by_date"][day.isoformat()] = summary["by_date"].get(day.isoformat(), 0) + 1
+    for summary in groups.values():
+        summary["employees"] = len(summary["employees"])
+    return list(groups.values())
+
+
+def materialize_absentees(absentees):
+    """
+    Writes an attended=False record, with the group's day salary snapshot, for
+    every find_absentees() row, ABSENTEE_BATCH_SIZE rows per statement. Rows a
+    scan or another run created in the meantime are skipped by ON CONFLICT DO
+    NOTHING, and RETURNING reports exactly the rows this call inserted.
+    Returns that number.
+    """
+    table = Attendance._meta.db_table
+    # Untyped parameters in VALUES are text on PostgreSQL
+    placeholder = '(%s, CAST(%s AS DATE), %s)' if connection.vendor == 'postgresql' else '(%s, %s, %s)'
+    created = 0
+    for offset in range(0, len(absentees), ABSENTEE_BATCH_SIZE):
+        batch = absentees[offset:offset + ABSENTEE_BATCH_SIZE]
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        params = []
+        for assignment_id, _, _, _, _, _, day_salary, day in batch:
+            params += [assignment_id, connection.ops.adapt_datefield_value(day), day_salary]
+        # WHERE true lets SQLite parse ON CONFLICT after INSERT ... SELECT
+        sql = f"""
+            WITH absent (assignment_id, day, day_salary) AS (VALUES {', '.join([placeholder] * len(batch))})
+            INSERT INTO {table}
+                (employee_assignment_id, date, day_salary, attended, is_supervisor, created_at, updated_at)
+            SELECT absent.assignment_id, absent.day, absent.day_salary, %s, %s, %s, %s
+            FROM absent
+            WHERE true
+            ON CONFLICT (employee_assignment_id, date) DO NOTHING
+            RETURNING id
+        """
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params + [False, False, now, now])
+                ids = [row[0] for row in cursor.fetchall()]
+            record_changes(Attendance, ids)
+        created += len(ids)
+    return created
@@ -0,0 +1,111 @@
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from home.models import Department, Employee, Field, AssignmentGroup, EmployeeAssignment, Attendance, ChangeLog
+
+# Feed name used in ChangeLog.model and in /api/changes/ payloads, per tracked model
+CHANGE_FEEDS = {
+    'departments': Department,
+    'employees': Employee,
+    'fields': Field,
+    'assignments': AssignmentGroup,
+    'employee_assignments': EmployeeAssignment,
+    'attendances': Attendance,
+}
+FEED_NAMES = {model: name for name, model in CHANGE_FEEDS.items()}
+
+UPSERT, DELETE = 'upsert', 'delete'
+
+# pg_advisory_xact_lock key serializing sequence_changes()
+SEQUENCE_LOCK_ID = 4_740_001
+
+
+def record_changes(model, ids, action=UPSERT):
+    """
+    Appends one ChangeLog row per id. Model signals call this for single-row
+    writes; bulk statements, which send no signals, must call it themselves.
+    """
+    ChangeLog.objects.bulk_create(
+        [ChangeLog(model=FEED_NAMES[model], object_id=object_id, action=action) for object_id in ids],
+        batch_size=1000
+    )
+    # Number the rows as soon as they commit, once per transaction. A failure
+    # there is only logged: the write has committed and readers catch up
+    if not any(callback[1] is sequence_changes for callback in connection.run_on_commit):
+        transaction.on_commit(sequence_changes, robust=True)
+
+
+def sequence_changes():
+    """
+    Numbers the committed ChangeLog rows that have no sequence yet, in id order
+    and above every sequence already given out, in one UPDATE. Rows of
+    transactions still open are invisible here and get numbered after they
+    commit, so a client's cursor can never pass a change it has not received.
+    Numbering is serialized (advisory lock on PostgreSQL, the single writer on
+    SQLite) so each run's numbers commit before the next run starts.
+    """
+    pending = ChangeLog.objects.filter(sequence__isnull=True)
+    top = ChangeLog.objects.filter(sequence__isnull=False).order_by('-sequence').values('sequence')[:1]
+    first = pending.order_by('id').values('id')[:1]
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s)", [SEQUENCE_LOCK_ID])
+        return pending.update(sequence=F('id') + Coalesce(Subquery(top), 0) + 1 - Subquery(first))
+
+
+def read_changes(since, limit):
+    """
+    Reads up to `limit` ChangeLog rows after sequence `since` and compacts them
+    to the last action per object. Returns (next cursor, has_more,
+    {feed: [upserted ids]}, {feed: [deleted ids]}).
+    """
+    number_pending_changes()
+    rows = list(
+        ChangeLog.objects.filter(sequence__gt=since)
+        .order_by('sequence')
+        .values_list('sequence', 'model', 'object_id', 'action')[:limit + 1]
+    )
+    has_more = len(rows) > limit
+    cursor = rows[:limit][-1][0] if rows else since
+    latest = {}
+    for _, model, object_id, action in rows[:limit]:
+        latest[model, object_id] = action
+
+    upserts, deletes = {}, {}
+    for (model, object_id), action in latest.items():
+        (upserts if action == UPSERT else deletes).setdefault(model, []).append(object_id)
+    return cursor, has_more, upserts, deletes
+
+
+def number_pending_changes():
+    """
+    Rows are numbered when their transaction commits (record_changes). Readers
+    only number committed rows left behind, e.g. by a worker that died between
+    commit and callback; the check is one probe of the pending-row index.
+    """
+    if ChangeLog.objects.filter(sequence__isnull=True).exists():
+        sequence_changes()
+
+
+def head_cursor():
+    number_pending_changes()
+    return (
+        ChangeLog.objects.filter(sequence__isnull=False)
+        .order_by('-sequence')
+        .values_list('sequence', flat=True)
+        .first()
+    ) or 0
+
+
+def compact_changelog():
+    """
+    Deletes every numbered ChangeLog row superseded by a later numbered row for
+    the same object. Lossless for clients at any cursor: the last action of each
+    object is kept. Returns the number of rows deleted.
+    """
+    latest = ChangeLog.objects.filter(
+        model=OuterRef('model'), object_id=OuterRef('object_id'), sequence__isnull=False
+    ).order_by('-sequence').values('sequence')[:1]
+    deleted, _ = ChangeLog.objects.filter(sequence__lt=Subquery(latest)).delete()
+    return deleted
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Cache backends private to one process: pins, throttle buckets and cached
+# stats kept in them are not seen by the other workers
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend in PROCESS_LOCAL_CACHES:
+        return [Error(
+            f"The default cache ({backend}) is not shared between worker processes.",
+            hint="Set REDIS_URL, or set CACHE_TABLE and run `python manage.py createcachetable`.",
+            id='home.E001',
+        )]
+    return []
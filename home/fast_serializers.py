@@ -0,0 +1,170 @@
+import copy
+from django.db import models
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.fields import empty
+
+# DRF fields whose to_representation is a no-op for values the matching model
+# fields already return from the database
+_PASSTHROUGH = (
+    (serializers.CharField, (models.CharField, models.TextField)),
+    (serializers.IntegerField, (models.IntegerField, models.AutoField)),
+    (serializers.BooleanField, (models.BooleanField,)),
+)
+
+
+class UnsupportedField(ValueError):
+    pass
+
+
+class _PinnedTimezone:
+    """
+    DateTimeField looks the active timezone up for every value. This resolves it
+    once per call on a copy of the field and converts with DRF's own code.
+    """
+    def __init__(self, field):
+        self.field = field
+
+    def bind(self):
+        pinned = copy.copy(self.field)
+        pinned.timezone = self.field.default_timezone()
+        return pinned.to_representation
+
+
+def _resolve_lookup(model, field):
+    """
+    Walks a serializer field's source through the model and returns the
+    values_list() lookup, the model field it ends on and the lookups of the
+    nullable relations it crosses on the way.
+    """
+    if field.source == '*':
+        raise UnsupportedField(f"'{field.field_name}' uses source='*'.")
+
+    nullable_relations = []
+    model_field = None
+    for position, attr in enumerate(field.source_attrs):
+        if model_field is not None:
+            if not model_field.is_relation:
+                raise UnsupportedField(f"'{field.field_name}' does not follow a relation.")
+            if model_field.null:
+                nullable_relations.append('__'.join(field.source_attrs[:position]))
+            model = model_field.related_model
+        try:
+            model_field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            if attr != 'pk':
+                raise UnsupportedField(f"'{field.field_name}' reads '{attr}', which is not a database column.")
+            model_field = model._meta.pk
+        if model_field.many_to_many or model_field.one_to_many:
+            raise UnsupportedField(f"'{field.field_name}' reads a multi-valued relation.")
+
+    return '__'.join(field.source_attrs), model_field, nullable_relations
+
+
+def _converter(field, model_field):
+    if isinstance(field, serializers.PrimaryKeyRelatedField):
+        if field.pk_field is not None:
+            return field.pk_field.to_representation
+        return None
+    if isinstance(field, serializers.RelatedField):
+        raise UnsupportedField(f"'{field.field_name}' needs the related instance.")
+    for field_class, model_classes in _PASSTHROUGH:
+        if type(field) is field_class and isinstance(model_field, model_classes):
+            return None
+    if isinstance(field, serializers.DateTimeField) and not hasattr(field, 'timezone'):
+        return _PinnedTimezone(field)
+    return field.to_representation
+
+
+def compile_serializer(serializer_class):
+    """
+    Precompiles a read-only projection of a ModelSerializer. Returns the
+    values_list() lookups to fetch and a factory for the function turning one
+    fetched tuple into the dict the serializer itself would produce, with the
+    same keys, key order and value formatting.
+    Raises UnsupportedField for method fields, nested serializers and sources
+    that are not plain columns.
+    """
+    serializer = serializer_class()
+    model = serializer.Meta.model
+    lookups = []
+    plan = []
+
+    def column(lookup):
+        if lookup not in lookups:
+            lookups.append(lookup)
+        return lookups.index(lookup)
+
+    for field in serializer._readable_fields:
+        if isinstance(field, (serializers.BaseSerializer, serializers.SerializerMethodField)):
+            raise UnsupportedField(f"'{field.field_name}' is computed per instance.")
+        lookup, model_field, nullable_relations = _resolve_lookup(model, field)
+        plan.append((
+            field.field_name,
+            column(lookup),
+            _converter(field, model_field),
+            tuple(column(relation) for relation in nullable_relations),
+            field,
+        ))
+
+    def row_function():
+        bound = tuple(
+            (name, index, convert.bind() if isinstance(convert, _PinnedTimezone) else convert, relations, field)
+            for name, index, convert, relations, field in plan
+        )
+
+        def to_row(values):
+            row = {}
+            for name, index, convert, relations, field in bound:
+                value = values[index]
+                if value is None and relations and any(values[i] is None for i in relations):
+                    # Mirrors Field.get_attribute() for a missing related object
+                    if field.default is not empty:
+                        value = field.get_default()
+                    elif not field.allow_null:
+                        continue
+                if value is None:
+                    row[name] = None
+                else:
+                    row[name] = convert(value) if convert else value
+            return row
+
+        return to_row
+
+    return tuple(lookups), row_function
+
+
+_compiled = {}
+
+
+def fast_serialize(queryset, serializer_class):
+    """
+    List counterpart of `serializer_class(queryset, many=True).data` for
+    read-only list endpoints. Fetches only the serialized columns as tuples and
+    skips model instantiation and per-field dispatch.
+    """
+    if serializer_class not in _compiled:
+        _compiled[serializer_class] = compile_serializer(serializer_class)
+    lookups, row_function = _compiled[serializer_class]
+    to_row = row_function()
+    return [to_row(values) for values in queryset.values_list(*lookups)]
+
+
+def to_columnar(rows, columns, dimensions):
+    """
+    Dictionary-encodes serialized rows. `dimensions` maps a table name to a key
+    column and the columns that depend only on it: those are stored once per key
+    in the table and dropped from the rows, which become lists under a shared
+    `columns` header.
+    """
+    factored = {column for key, attributes in dimensions.values() for column in attributes}
+    columns = [column for column in columns if column not in factored]
+    result = {'columns': columns}
+    for table, (key, attributes) in dimensions.items():
+        entries = result[table] = {}
+        for row in rows:
+            value = row.get(key)
+            if value not in entries:
+                entries[value] = {attribute: row.get(attribute) for attribute in attributes}
+    result['rows'] = [[row.get(column) for column in columns] for row in rows]
+    return result
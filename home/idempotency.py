@@ -0,0 +1,157 @@
+import json
+import hashlib
+from functools import wraps
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from api.renderers import FastJSONRenderer
+from api.throttling import client_ident
+from home.models import IdempotencyKey
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+READER_HEADER = 'HTTP_X_READER_ID'
+MAX_KEY_LENGTH = 255
+# Responses that may change on a later attempt are not replayed
+NOT_STORED = (
+    status.HTTP_401_UNAUTHORIZED,
+    status.HTTP_403_FORBIDDEN,
+    status.HTTP_409_CONFLICT,
+    status.HTTP_429_TOO_MANY_REQUESTS,
+)
+
+PENDING, DONE = 'pending', 'done'
+
+
+def idempotency_setting(name, default):
+    return getattr(settings, 'IDEMPOTENCY', {}).get(name, default)
+
+
+def record_key(view_name, request, client_key):
+    # Anonymous callers (scan readers) each get their own key space, by client
+    # address and reader, so readers reusing simple keys cannot collide
+    if request.user and request.user.is_authenticated:
+        scope = request.user.pk
+    else:
+        scope = f"anon:{client_ident(request)}:{request.META.get(READER_HEADER, '')}"
+    return hashlib.sha256(f"{view_name}\0{scope}\0{client_key}".encode()).hexdigest()
+
+
+def claim(key, fingerprint):
+    """
+    Inserts the pending record for `key`; the primary key makes the insert the
+    atomic claim. Otherwise returns the existing record, after clearing it and
+    claiming again when it has expired or its attempt is presumed dead.
+    Returns None when claimed.
+    """
+    while True:
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                IdempotencyKey.objects.create(
+                    key=key,
+                    fingerprint=fingerprint,
+                    expires_at=now + timezone.timedelta(seconds=idempotency_setting('TTL_SECONDS', 24 * 3600))
+                )
+            return None
+        except IntegrityError:
+            pass
+        record = IdempotencyKey.objects.filter(key=key).first()
+        if record is None:
+            continue
+        stale = now - timezone.timedelta(seconds=idempotency_setting('LOCK_SECONDS', 60))
+        if record.expires_at <= now or (record.state == PENDING and record.created_at <= stale):
+            IdempotencyKey.objects.filter(key=key, created_at=record.created_at).delete()
+            continue
+        return record
+
+
+def not_stored(response):
+    """
+    Marks `response` as one retries must not be given: the request is run again
+    instead, as for a 5xx. Returns the response.
+    """
+    response.idempotency_store = False
+    return response
+
+
+def replay(record):
+    return Response(
+        json.loads(bytes(record.response)),
+        status=record.status_code,
+        headers={'Idempotent-Replayed': 'true'}
+    )
+
+
+def idempotent(view):
+    """
+    Decorator for write views: a request carrying an Idempotency-Key header runs
+    once per caller and key, and retries get the stored response instead of
+    running the view again. A retry arriving while the first attempt is still
+    running is refused at once with 409 and Retry-After, so no worker sits
+    waiting for it. Reusing a key with a different body is refused with 422.
+    5xx outcomes, raised exceptions and responses passed through not_stored()
+    release the key so the request can be retried for real. List it above @shed_load and @throttle so replays cost no
+    throttle tokens and are answered even while load is shed.
+
+    The guarantee is best-effort: the view commits its own transactions and the
+    outcome is stored afterwards, so a worker dying in between leaves the key
+    pending until IDEMPOTENCY['LOCK_SECONDS'] have passed, after which a retry
+    runs the view again. Views using it must tolerate that second run, as
+    attendance marking does (the record already exists).
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        client_key = request.META.get(HEADER)
+        if not client_key:
+            return view(request, *args, **kwargs)
+        if len(client_key) > MAX_KEY_LENGTH:
+            return Response(
+                {"error": f"Idempotency-Key cannot be longer than {MAX_KEY_LENGTH} characters."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        key = record_key(view.__name__, request, client_key)
+        fingerprint = hashlib.sha256(request.body).hexdigest()
+        record = claim(key, fingerprint)
+        if record is not None:
+            if record.fingerprint != fingerprint:
+                return Response(
+                    {"error": "This Idempotency-Key was already used for a different request."},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                )
+            if record.state == DONE:
+                return replay(record)
+            return Response(
+                {"error": "A request with this Idempotency-Key is still being processed."},
+                status=status.HTTP_409_CONFLICT,
+                headers={'Retry-After': '1'}
+            )
+
+        released = IdempotencyKey.objects.filter(key=key, state=PENDING)
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception:
+            released.delete()
+            raise
+        if (response.status_code >= 500 or response.status_code in NOT_STORED
+                or getattr(response, 'data', None) is None
+                or not getattr(response, 'idempotency_store', True)):
+            released.delete()
+            return response
+        released.update(
+            state=DONE,
+            status_code=response.status_code,
+            response=FastJSONRenderer().render(response.data)
+        )
+        return response
+    return wrapper
+
+
+def purge_idempotency_keys():
+    """
+    Deletes expired records. Returns the number deleted.
+    """
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
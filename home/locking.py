@@ -0,0 +1,62 @@
+from contextlib import contextmanager
+from django.db import connection, transaction
+from home.models import Employee
+
+
+@contextmanager
+def _write_transaction():
+    """
+    Opens a transaction holding SQLite's database write lock from its first
+    statement, as BEGIN IMMEDIATE does: SQLite has no row locks, so writers in
+    every process and thread queue on this lock (up to the busy timeout) instead
+    of SELECT ... FOR UPDATE. Django 5.0 always opens transactions with a plain
+    BEGIN, so the lock is taken by a write that matches no rows.
+
+    This only behaves like BEGIN IMMEDIATE when it opens the outermost
+    transaction. Nested in an atomic block that has already read, it becomes a
+    savepoint: the read snapshot is older than the lock, and SQLite refuses the
+    upgrade with "database is locked" at once if another writer has committed
+    since then, without waiting for the busy timeout. Callers take these locks
+    outside any other transaction (the test suite's own wrapping transaction has
+    no concurrent writers).
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f"UPDATE {Employee._meta.db_table} SET id = id WHERE 0 = 1")
+        yield
+
+
+@contextmanager
+def employee_lock(employee_id):
+    """
+    Opens a transaction in which no other attendance write for the same employee can
+    run. On PostgreSQL the employee row is locked with SELECT ... FOR UPDATE; on
+    backends without row locks the database write lock is held instead.
+    Yields the (locked) Employee.
+    """
+    if connection.features.has_select_for_update:
+        with transaction.atomic():
+            yield Employee.objects.select_for_update().get(pk=employee_id)
+    else:
+        with _write_transaction():
+            yield Employee.objects.get(pk=employee_id)
+
+
+@contextmanager
+def assignments_lock(assignments):
+    """
+    Opens a transaction holding the employee lock of every employee behind
+    `assignments` (an EmployeeAssignment queryset). Yields the assignments with
+    their employees, read under the lock in a single query; rows are locked in
+    employee order so concurrent crew writes cannot deadlock.
+    """
+    assignments = assignments.select_related('employee').order_by('employee_id')
+    if connection.features.has_select_for_update:
+        with transaction.atomic():
+            if connection.features.has_select_for_update_of:
+                yield list(assignments.select_for_update(of=('employee',)))
+            else:
+                yield list(assignments.select_for_update())
+    else:
+        with _write_transaction():
+            yield list(assignments)
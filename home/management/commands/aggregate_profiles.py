@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.profiling import read_profiles
+
+class Command(BaseCommand):
+    help = 'Merge sampled request profiles into one collapsed-stack file for flamegraph tools.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--view', help='Only include profiles of this view, e.g. markAttendance.')
+        parser.add_argument('--output', default='profile.collapsed', help='File to write the merged stacks to.')
+        parser.add_argument(
+            '--directory',
+            default=str(settings.PROFILING['DIRECTORY']),
+            help='Directory the profiler writes to. Defaults to PROFILING["DIRECTORY"].'
+        )
+
+    def handle(self, *args, **options):
+        totals = read_profiles(options['directory'], options['view'])
+        if not totals:
+            self.stdout.write(self.style.WARNING('No profiles found.'))
+            return
+
+        with open(options['output'], 'w') as handle:
+            for stack, count in totals.most_common():
+                handle.write(f"{stack} {count}\n")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {len(totals)} stacks ({sum(totals.values())} samples) to {options['output']}."
+        ))
@@ -0,0 +1,38 @@
+from django.utils import timezone
+from django.core.management.base import BaseCommand, CommandError
+from home.archive import hot_cutoff, archive_attendance
+
+class Command(BaseCommand):
+    help = 'Move attendance of closed payroll periods (calendar months) into the archive table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--before',
+            help='Archive attendance dated before this month (YYYY-MM-DD, rounded down to the 1st). '
+                 'Defaults to keeping ATTENDANCE_HOT_MONTHS months hot.'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report what would be archived without moving any rows.'
+        )
+
+    def handle(self, *args, **options):
+        if options['before']:
+            try:
+                before = timezone.datetime.strptime(options['before'], "%Y-%m-%d").date()
+            except ValueError:
+                raise CommandError('Invalid date format. Use YYYY-MM-DD')
+        else:
+            before = hot_cutoff()
+
+        result = archive_attendance(before, dry_run=options['dry_run'])
+        verb = 'Would archive' if options['dry_run'] else 'Archived'
+
+        for period, count in result['moved'].items():
+            self.stdout.write(f'{verb} {count} attendance records for {period}.')
+
+        total = sum(result['moved'].values())
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {total} attendance records dated before {result['before']:%Y-%m-%d}."
+        ))
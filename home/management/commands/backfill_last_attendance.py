@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from home.attendance import refresh_last_attendance
+
+class Command(BaseCommand):
+    help = 'Recompute each employee\'s last attendance pointer used by the 8-hour rule.'
+
+    def handle(self, *args, **kwargs):
+        updated = refresh_last_attendance()
+        self.stdout.write(self.style.SUCCESS(f'Updated the last attendance of {updated} employees.'))
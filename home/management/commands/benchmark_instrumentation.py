@@ -0,0 +1,72 @@
+import logging
+import os
+import statistics
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from rest_framework.test import APIClient
+
+DEFAULT_PATHS = ['/api/attendances/', '/api/employees/', '/api/assignments/', '/api/stats/attendance/']
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure the overhead of QueryInstrumentationMiddleware: replay GET requests through the '
+        'full middleware stack with SQL instrumentation on and off and compare median latencies.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', action='append', dest='paths', help='Path to request (repeatable).')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per path and configuration.')
+        parser.add_argument('--warmup', type=int, default=10, help='Unmeasured requests per path first.')
+
+    def client(self, user, enabled, path):
+        # The middleware chain is built on the first request, under these settings
+        with override_settings(SQL_INSTRUMENTATION={'ENABLED': enabled, 'SLOW_QUERY_MS': 100}):
+            client = APIClient()
+            client.force_authenticate(user)
+            client.get(path)
+        return client
+
+    def handle(self, *args, **options):
+        user = get_user_model().objects.filter(is_superuser=True).first()
+        if user is None:
+            raise CommandError('No superuser found. Create one with createsuperuser first.')
+
+        # Log lines are formatted and written as in production, to /dev/null
+        api_logger = logging.getLogger('api')
+        handlers = api_logger.handlers
+        sink = open(os.devnull, 'w')
+        api_logger.handlers = [logging.StreamHandler(sink)]
+        try:
+            paths = options['paths'] or DEFAULT_PATHS
+            clients = {enabled: self.client(user, enabled, paths[0]) for enabled in (False, True)}
+            overheads = []
+            for path in paths:
+                timings = {False: [], True: []}
+                for enabled, client in clients.items():
+                    for _ in range(options['warmup']):
+                        client.get(path)
+                # Alternate configurations so drift affects both alike
+                for _ in range(options['requests']):
+                    for enabled, client in clients.items():
+                        started = time.perf_counter()
+                        response = client.get(path)
+                        timings[enabled].append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    raise CommandError(f'{path} returned {response.status_code}.')
+
+                base, instrumented = statistics.median(timings[False]), statistics.median(timings[True])
+                overheads.append(instrumented / base - 1)
+                self.stdout.write(
+                    f"{path}: {base * 1000:.2f}ms without, {instrumented * 1000:.2f}ms with instrumentation "
+                    f"({(instrumented - base) * 1000:+.2f}ms, {(instrumented / base - 1) * 100:+.1f}%)."
+                )
+        finally:
+            api_logger.handlers = handlers
+            sink.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Median overhead across paths: {statistics.median(overheads) * 100:+.1f}%."
+        ))
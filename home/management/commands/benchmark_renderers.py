@@ -0,0 +1,62 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from api.renderers import FastJSONRenderer, MessagePackRenderer, orjson, msgpack
+from home.models import *
+from home.serializers import *
+from home.fast_serializers import fast_serialize
+
+class Command(BaseCommand):
+    help = (
+        'Render real list payloads with DRF\'s JSONRenderer and the configured fast renderers: '
+        'check the JSON is byte-identical and compare encode time and size.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50000, help='Maximum rows per payload.')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per renderer; the best one is reported.')
+
+    def best_of(self, repeat, func):
+        best, result = None, None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        payloads = {
+            'attendances': fast_serialize(Attendance.objects.order_by('-id')[:rows], AttendanceSerializer),
+            'employees': fast_serialize(Employee.objects.order_by('-id')[:rows], EmployeeSerializer),
+            'assignments': AssignmentGroupSerializer(
+                AssignmentGroup.objects.prefetch_related('employee_assignments__employee')
+                .select_related('department', 'field', 'supervisor').order_by('-id')[:rows],
+                many=True
+            ).data,
+        }
+        self.stdout.write(
+            f"orjson: {'available' if orjson else 'not installed, stdlib fallback'}; "
+            f"msgpack: {'available' if msgpack else 'not installed'}."
+        )
+
+        reference, fast = JSONRenderer(), FastJSONRenderer()
+        mismatched = []
+        for name, data in payloads.items():
+            base_time, expected = self.best_of(options['repeat'], lambda: reference.render(data))
+            fast_time, output = self.best_of(options['repeat'], lambda: fast.render(data))
+            if output != expected:
+                mismatched.append(name)
+            line = (
+                f"{name}: {len(data)} rows, {len(expected):,} bytes; json {base_time * 1000:.1f}ms, "
+                f"fast json {fast_time * 1000:.1f}ms ({base_time / fast_time:.1f}x)"
+            )
+            if msgpack:
+                pack_time, packed = self.best_of(options['repeat'], lambda: MessagePackRenderer().render(data))
+                line += f", msgpack {pack_time * 1000:.1f}ms / {len(packed):,} bytes"
+            self.stdout.write(line + '.')
+
+        if mismatched:
+            raise CommandError(f"Fast JSON output differs for: {', '.join(mismatched)}")
+        self.stdout.write(self.style.SUCCESS('Fast JSON output is byte-identical.'))
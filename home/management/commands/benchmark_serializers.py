@@ -0,0 +1,70 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from home.models import *
+from home.serializers import *
+from home.fast_serializers import fast_serialize
+
+TARGETS = {
+    'departments': (Department, DepartmentSerializer),
+    'employees': (Employee, EmployeeSerializer),
+    'fields': (Field, FieldSerializer),
+    'attendances': (Attendance, AttendanceSerializer),
+}
+
+class Command(BaseCommand):
+    help = (
+        'Compare DRF serializers with the fast list path on the configured database: '
+        'check the rendered JSON is byte-identical and report rows per second.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50000, help='Maximum rows serialized per list.')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per path; the best one is reported.')
+        parser.add_argument('--only', choices=sorted(TARGETS), help='Benchmark a single list.')
+
+    def best_of(self, repeat, func):
+        best, result = None, None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    def handle(self, *args, **options):
+        renderer = JSONRenderer()
+        targets = [options['only']] if options['only'] else sorted(TARGETS)
+        mismatched = []
+
+        for name in targets:
+            model, serializer_class = TARGETS[name]
+            queryset = model.objects.order_by('-id')[:options['rows']]
+            if name == 'attendances':
+                slow_queryset = queryset.select_related(
+                    'employee_assignment__employee', 'employee_assignment__assignment_group__department'
+                )
+            else:
+                slow_queryset = queryset
+
+            slow, slow_data = self.best_of(
+                options['repeat'], lambda: serializer_class(slow_queryset, many=True).data
+            )
+            fast, fast_data = self.best_of(
+                options['repeat'], lambda: fast_serialize(queryset, serializer_class)
+            )
+
+            rows = len(fast_data)
+            if renderer.render(slow_data) != renderer.render(fast_data):
+                mismatched.append(name)
+            if not rows:
+                self.stdout.write(f"{name}: no rows.")
+                continue
+            self.stdout.write(
+                f"{name}: {rows} rows, serializer {rows / slow:,.0f} rows/s, "
+                f"fast path {rows / fast:,.0f} rows/s ({slow / fast:.1f}x)."
+            )
+
+        if mismatched:
+            raise CommandError(f"Fast path output differs for: {', '.join(mismatched)}")
+        self.stdout.write(self.style.SUCCESS('Fast path output is byte-identical.'))
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from home.changes import compact_changelog
+
+class Command(BaseCommand):
+    help = 'Delete change log entries superseded by a later entry for the same object.'
+
+    def handle(self, *args, **options):
+        deleted = compact_changelog()
+        self.stdout.write(self.style.SUCCESS(f'Removed {deleted} superseded change log entries.'))
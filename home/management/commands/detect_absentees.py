@@ -0,0 +1,47 @@
+import datetime
+from django.utils import timezone
+from django.core.management.base import BaseCommand, CommandError
+from home.attendance import find_absentees, summarize_absentees, materialize_absentees
+
+class Command(BaseCommand):
+    help = (
+        'Find active assignments without any attendance record for each day of a date range '
+        '(yesterday by default) and optionally record them as absent. Meant to run daily.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day to check (YYYY-MM-DD). Defaults to yesterday.')
+        parser.add_argument('--end', help='Last day to check (YYYY-MM-DD). Defaults to --start.')
+        parser.add_argument('--group', type=int, action='append', help='Limit to this assignment group (repeatable).')
+        parser.add_argument('--materialize', action='store_true', help='Write attended=False records for the absentees.')
+
+    def handle(self, *args, **options):
+        try:
+            start = (
+                datetime.datetime.strptime(options['start'], "%Y-%m-%d").date() if options['start']
+                else timezone.now().date() - datetime.timedelta(days=1)
+            )
+            end = datetime.datetime.strptime(options['end'], "%Y-%m-%d").date() if options['end'] else start
+        except ValueError:
+            raise CommandError('Invalid date format. Use YYYY-MM-DD')
+
+        try:
+            absentees = find_absentees(start, end, options['group'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        for summary in summarize_absentees(absentees):
+            self.stdout.write(
+                f"Group {summary['assignment_group']} ({summary['name']}): {summary['absences']} absences "
+                f"by {summary['employees']} employees."
+            )
+
+        if options['materialize']:
+            created = materialize_absentees(absentees)
+            self.stdout.write(self.style.SUCCESS(
+                f"Recorded {created} absences from {start:%Y-%m-%d} to {end:%Y-%m-%d}."
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Found {len(absentees)} absences from {start:%Y-%m-%d} to {end:%Y-%m-%d}."
+            ))
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from home.idempotency import purge_idempotency_keys
+
+class Command(BaseCommand):
+    help = 'Delete stored Idempotency-Key outcomes that have expired.'
+
+    def handle(self, *args, **options):
+        deleted = purge_idempotency_keys()
+        self.stdout.write(self.style.SUCCESS(f'Removed {deleted} expired idempotency keys.'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from home.search import search_backend, rebuild_search_index
+
+class Command(BaseCommand):
+    help = 'Rebuild the employee search index (SQLite FTS5 shadow table).'
+
+    def handle(self, *args, **kwargs):
+        backend = search_backend()
+        if backend != 'fts5':
+            self.stdout.write(self.style.WARNING(
+                f'Search backend is "{backend}"; there is no shadow table to rebuild.'
+            ))
+            return
+
+        indexed = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} employees.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from home.assignments import recount_groups
+
+class Command(BaseCommand):
+    help = 'Recompute the total/active employee counters of assignment groups and repair any drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--group', type=int, action='append', help='Only recount this assignment group (repeatable).')
+
+    def handle(self, *args, **options):
+        drifted = recount_groups(options['group'])
+        for group_id in drifted:
+            self.stdout.write(f'Corrected the employee counters of group {group_id}.')
+        self.stdout.write(self.style.SUCCESS(f'{len(drifted)} groups had drifted counters.'))
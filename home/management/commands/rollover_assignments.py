@@ -0,0 +1,56 @@
+import time
+from django.utils import timezone
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from home.models import AssignmentGroup
+from home.assignments import rollover_assignment_groups
+
+class Command(BaseCommand):
+    help = (
+        'Season rollover: clone assignment groups with their active crews into new groups '
+        'named "<old name> - <season>" and end the old groups, in one transaction.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('season', help='Season label appended to the new group names.')
+        parser.add_argument('--group', type=int, action='append', help='Assignment group to roll over (repeatable).')
+        parser.add_argument('--all', action='store_true', help='Roll over every active assignment group.')
+        parser.add_argument('--end-date', help='End date of the old groups (YYYY-MM-DD). Defaults to today.')
+        parser.add_argument('--exclude-employee', type=int, action='append', default=[],
+                            help='Employee not carried over to the new crews (repeatable).')
+
+    def handle(self, *args, **options):
+        if bool(options['group']) == options['all']:
+            raise CommandError('Pass either --group (one or more) or --all.')
+        group_ids = options['group'] or list(
+            AssignmentGroup.objects.filter(is_active=True).values_list('id', flat=True)
+        )
+
+        if options['end_date']:
+            try:
+                end_date = timezone.datetime.strptime(options['end_date'], "%Y-%m-%d").date()
+            except ValueError:
+                raise CommandError('Invalid date format. Use YYYY-MM-DD')
+        else:
+            end_date = timezone.now().date()
+
+        started = time.perf_counter()
+        try:
+            rolled_over = rollover_assignment_groups(
+                group_ids, options['season'], end_date,
+                exclude_employee_ids=options['exclude_employee'],
+                reason=f"Season rollover {options['season']}"
+            )
+        except ValidationError as e:
+            raise CommandError(" ".join(e.messages))
+        elapsed = time.perf_counter() - started
+
+        for group in rolled_over:
+            self.stdout.write(
+                f"Group {group['old_assignment']} -> {group['new_assignment']} "
+                f"({group['name']}): {group['employees']} employees."
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Rolled over {len(rolled_over)} groups and "
+            f"{sum(group['employees'] for group in rolled_over)} employees in {elapsed:.2f}s."
+        ))
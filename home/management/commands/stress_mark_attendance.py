@@ -0,0 +1,94 @@
+import random
+import threading
+import time
+from django.db import connection
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.core.management.base import BaseCommand, CommandError
+from home.models import *
+from home.serializers import AttendanceMarkSerializer
+
+class Command(BaseCommand):
+    help = (
+        'Fire concurrent markAttendance scans from several threads against the configured '
+        'database and verify that no employee gets more than one attendance record.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16, help='Number of concurrent scanner threads.')
+        parser.add_argument('--scans', type=int, default=50, help='Scans fired by each thread.')
+        parser.add_argument('--tags', type=int, default=10, help='Number of distinct badges to scan repeatedly.')
+        parser.add_argument('--keep', action='store_true', help='Keep the attendance records created by the run.')
+
+    def handle(self, *args, **options):
+        date = timezone.now().date()
+        # Badges with a record for the day are skipped: the run only ever creates
+        # records, so removing them afterwards leaves existing attendance untouched
+        tag_ids = list(
+            EmployeeAssignment.objects.filter(status='active', employee__tag_id__isnull=False)
+            .exclude(employee__supervised_groups__is_active=True)
+            .exclude(attendances__date=date)
+            .values_list('employee__tag_id', flat=True)[:options['tags']]
+        )
+        if not tag_ids:
+            raise CommandError(
+                'No active employee assignments with tag IDs and no attendance today found. '
+                'Create assignment groups first.'
+            )
+
+        baseline_id = Attendance.objects.aggregate(last=Max('id'))['last'] or 0
+        outcomes = {'marked': 0, 'rejected': 0}
+        # Only these records are removed afterwards; real scans written meanwhile stay
+        created_ids = []
+        outcomes_lock = threading.Lock()
+        barrier = threading.Barrier(options['threads'])
+
+        def scanner():
+            try:
+                barrier.wait()
+                for _ in range(options['scans']):
+                    serializer = AttendanceMarkSerializer(
+                        data={'tag_ids': [random.choice(tag_ids)], 'date': date}
+                    )
+                    serializer.is_valid(raise_exception=True)
+                    result = serializer.save()
+                    with outcomes_lock:
+                        created_ids.extend(record.id for record in result['attendance_records'])
+                        outcomes['marked'] += len(result['attendance_records'])
+                        outcomes['rejected'] += len(result['errors'])
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=scanner) for _ in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        created = Attendance.objects.filter(
+            id__gt=baseline_id, employee_assignment__employee__tag_id__in=tag_ids
+        )
+        duplicates = list(
+            created.values('employee_assignment__employee__tag_id')
+            .annotate(records=Count('id'))
+            .filter(records__gt=1)
+        )
+
+        total = options['threads'] * options['scans']
+        self.stdout.write(
+            f"{total} scans of {len(tag_ids)} badges in {elapsed:.2f}s "
+            f"({total / elapsed:.0f} scans/s): {outcomes['marked']} marked, {outcomes['rejected']} rejected."
+        )
+
+        if not options['keep']:
+            Attendance.objects.filter(id__in=created_ids).delete()
+
+        if duplicates:
+            for row in duplicates:
+                self.stdout.write(self.style.ERROR(
+                    f"Tag {row['employee_assignment__employee__tag_id']} was marked {row['records']} times."
+                ))
+            raise CommandError('Duplicate attendance detected.')
+        self.stdout.write(self.style.SUCCESS('No duplicate attendance records.'))
@@ -0,0 +1,43 @@
+from django.db import migrations
+
+TRIGRAM_COLUMNS = ('name', 'phone_number', 'nid')
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for column in TRIGRAM_COLUMNS:
+            schema_editor.execute(
+                f"CREATE INDEX IF NOT EXISTS home_employee_{column}_trgm "
+                f"ON home_employee USING gin ({column} gin_trgm_ops)"
+            )
+    elif connection.vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS home_employee_search "
+            "USING fts5(name, phone_number, nid, tokenize='trigram')"
+        )
+        schema_editor.execute(
+            "INSERT INTO home_employee_search (rowid, name, phone_number, nid) "
+            "SELECT id, name, phone_number, nid FROM home_employee"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        for column in TRIGRAM_COLUMNS:
+            schema_editor.execute(f"DROP INDEX IF EXISTS home_employee_{column}_trgm")
+    elif connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS home_employee_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0017_alter_employee_address_alter_employee_email_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.0.4 on 2026-10-19 03:50
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0018_employee_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('attended', models.BooleanField(default=False)),
+                ('day_salary', models.CharField(blank=True, max_length=255, null=True)),
+                ('is_supervisor', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['date'], name='home_attendance_date_idx'),
+        ),
+        migrations.AddField(
+            model_name='attendancearchive',
+            name='employee_assignment',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_attendances', to='home.employeeassignment'),
+        ),
+        migrations.AddIndex(
+            model_name='attendancearchive',
+            index=models.Index(fields=['date'], name='home_attarchive_date_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.4 on 2026-10-19 03:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_last_attendance(apps, schema_editor):
+    Employee = apps.get_model('home', 'Employee')
+    Attendance = apps.get_model('home', 'Attendance')
+    latest = Attendance.objects.filter(
+        employee_assignment__employee=models.OuterRef('pk'),
+        attended=True
+    ).order_by('-created_at')
+    Employee.objects.update(
+        last_attended_at=models.Subquery(latest.values('created_at')[:1]),
+        last_assignment=models.Subquery(latest.values('employee_assignment')[:1])
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0019_attendance_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='employee',
+            name='last_assignment',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='home.employeeassignment'),
+        ),
+        migrations.AddField(
+            model_name='employee',
+            name='last_attended_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_last_attendance, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.4 on 2026-10-19 03:54
+
+from django.db import migrations, models
+
+
+def snapshot_day_salary(apps, schema_editor):
+    AssignmentGroup = apps.get_model('home', 'AssignmentGroup')
+    Department = apps.get_model('home', 'Department')
+    AssignmentGroup.objects.update(
+        day_salary=models.Subquery(
+            Department.objects.filter(pk=models.OuterRef('department_id')).values('day_salary')[:1]
+        )
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0020_employee_last_attendance'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assignmentgroup',
+            name='day_salary',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.RunPython(snapshot_day_salary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.0.4 on 2026-10-19 04:10
+
+from django.db import migrations, models
+
+
+def check_active_assignments(apps, schema_editor):
+    # Refuse to add the constraint over existing violations and list them instead
+    EmployeeAssignment = apps.get_model('home', 'EmployeeAssignment')
+    duplicates = list(
+        EmployeeAssignment.objects.filter(status='active')
+        .values('employee_id')
+        .annotate(groups=models.Count('id'))
+        .filter(groups__gt=1)
+        .order_by('employee_id')
+        .values_list('employee_id', flat=True)
+    )
+    if duplicates:
+        assignments = EmployeeAssignment.objects.filter(
+            status='active', employee_id__in=duplicates
+        ).order_by('employee_id', 'id').values_list('employee_id', 'id', 'assignment_group_id')
+        details = '\n'.join(
+            f"  employee {employee_id}: assignment {assignment_id} in group {group_id}"
+            for employee_id, assignment_id, group_id in assignments
+        )
+        raise RuntimeError(
+            f"{len(duplicates)} employees have more than one active assignment. Complete or "
+            f"suspend the extra assignments before migrating:\n{details}"
+        )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0021_assignmentgroup_day_salary'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_active_assignments, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='employeeassignment',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'active')), fields=('employee',), name='home_unique_active_assignment', violation_error_message='Employee is already assigned to another active group'),
+        ),
+    ]
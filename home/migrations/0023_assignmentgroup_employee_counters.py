@@ -0,0 +1,40 @@
+# Generated by Django 5.0.4 on 2026-10-19 04:12
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_employees(apps, schema_editor):
+    AssignmentGroup = apps.get_model('home', 'AssignmentGroup')
+    EmployeeAssignment = apps.get_model('home', 'EmployeeAssignment')
+
+    def count(**filters):
+        return Coalesce(models.Subquery(
+            EmployeeAssignment.objects.filter(assignment_group=models.OuterRef('pk'), **filters)
+            .order_by().values('assignment_group').annotate(n=models.Count('id')).values('n')[:1]
+        ), 0)
+
+    AssignmentGroup.objects.update(
+        total_employees=count(),
+        active_employees=count(status='active')
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0022_employeeassignment_unique_active'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assignmentgroup',
+            name='active_employees',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='assignmentgroup',
+            name='total_employees',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_employees, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,12 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # Used to run createcachetable; the cache table is now a deploy step
+    # (see CACHES in api/settings.py), so this migration does nothing
+
+    dependencies = [
+        ('home', '0025_idempotencykey'),
+    ]
+
+    operations = []
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.4 on 2026-10-19 04:42
+
+from django.db import migrations, models
+
+
+def number_existing_changes(apps, schema_editor):
+    # Rows already in the log are committed: their id stays their cursor value
+    ChangeLog = apps.get_model('home', 'ChangeLog')
+    ChangeLog.objects.update(sequence=models.F('id'))
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0026_cache_table'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='changelog',
+            name='sequence',
+            field=models.BigIntegerField(blank=True, null=True, unique=True),
+        ),
+        migrations.RunPython(number_existing_changes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='changelog',
+            index=models.Index(condition=models.Q(('sequence__isnull', True)), fields=['id'], name='home_changelog_pending_idx'),
+        ),
+    ]
@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
@@ -10,6 +11,14 @@ class Department(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if not adding:
+                # Refresh the salary snapshot held by this department's groups
+                AssignmentGroup.objects.filter(department=self).update(day_salary=self.day_salary)
+
 class Employee(models.Model):
     name = models.CharField(max_length=255, null=True, blank=True)
     email = models.CharField(max_length=255, unique=True, null=True, blank=True)
@@ -18,6 +27,15 @@ class Employee(models.Model):
     tag_id = models.CharField(max_length=255, unique=True, null=True, blank=True)
     nid = models.CharField(max_length=255, unique=True, null=True, blank=True)
     rssb_number = models.CharField(max_length=255, unique=True, null=True, blank=True)
+    # Projection of the latest attendance marked present, kept current by Attendance.save
+    last_attended_at = models.DateTimeField(null=True, blank=True)
+    last_assignment = models.ForeignKey(
+        'EmployeeAssignment',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
 
     def __str__(self):
         return self.name
@@ -38,9 +56,36 @@ class AssignmentGroup(models.Model):
     end_date = models.DateField(null=True, blank=True)
     is_active = models.BooleanField(default=True)
     notes = models.TextField(null=True, blank=True)
+    # Snapshot of department.day_salary, refreshed by Department.save
+    day_salary = models.CharField(max_length=255, null=True, blank=True)
+    # Employee assignment counters, maintained with F() updates (see home/signals.py
+    # and home/assignments.py); recount_groups repairs drift
+    total_employees = models.IntegerField(default=0, editable=False)
+    active_employees = models.IntegerField(default=0, editable=False)
+
+    COUNTER_FIELDS = ('total_employees', 'active_employees')
 
     def __str__(self):
         return f"{self.name} - {self.field.name} ({self.department.name})"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'department_id' in field_names:
+            instance._department_on_load = values[field_names.index('department_id')]
+        return instance
+
+    def save(self, *args, **kwargs):
+        if self._state.adding or self.department_id != getattr(self, '_department_on_load', None):
+            self.day_salary = self.department.day_salary
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # Never write back in-memory counters over concurrent F() updates
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+        self._department_on_load = self.department_id
     
     def clean(self):
         if self.end_date and self.end_date < self.created_date:
@@ -73,22 +118,54 @@ class EmployeeAssignment(models.Model):
 
     class Meta:
         unique_together = ['assignment_group', 'employee']
+        constraints = [
+            # An employee can only be in one active group at a time
+            models.UniqueConstraint(
+                fields=['employee'],
+                condition=Q(status='active'),
+                name='home_unique_active_assignment',
+                violation_error_message=_("Employee is already assigned to another active group")
+            ),
+        ]
 
     def __str__(self):
         return f"{self.employee.name} in {self.assignment_group.name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored group and status so the group counters can be adjusted on save
+        if 'assignment_group_id' in field_names and 'status' in field_names:
+            instance._group_on_load = values[field_names.index('assignment_group_id')]
+            instance._status_on_load = values[field_names.index('status')]
+        return instance
+
     def clean(self):
         if self.end_date and self.end_date < self.assigned_date:
             raise ValidationError(_("End date cannot be before assignment date"))
-        
-        # Check if employee is already assigned to another active group
-        if self.status == 'active':
-            active_assignments = EmployeeAssignment.objects.filter(
-                employee=self.employee,
-                status='active'
-            ).exclude(id=self.id)
-            if active_assignments.exists():
-                raise ValidationError(_("Employee is already assigned to another active group"))
+
+class AttendanceQuerySet(models.QuerySet):
+    def delete(self):
+        """
+        Deletes the records, then recomputes the last-attendance pointer of the
+        employees who lost a present record, in one UPDATE for the whole batch.
+        """
+        from home.attendance import refresh_last_attendance
+
+        employee_ids = list(
+            EmployeeAssignment.objects.filter(
+                attendances__in=self.filter(attended=True)
+            ).values_list('employee_id', flat=True).distinct()
+        )
+        with transaction.atomic():
+            result = super().delete()
+            if employee_ids:
+                refresh_last_attendance(employee_ids)
+        return result
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
 
 class Attendance(models.Model):
     employee_assignment = models.ForeignKey(
@@ -103,18 +180,46 @@ class Attendance(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = AttendanceQuerySet.as_manager()
+
     class Meta:
         unique_together = ['employee_assignment', 'date']
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['date'], name='home_attendance_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.employee_assignment.employee.name} - {self.date}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored flag so save() can tell when a record flips to attended
+        if 'attended' in field_names:
+            instance._attended_on_load = values[field_names.index('attended')]
+        return instance
+
     def save(self, *args, **kwargs):
         # Get day salary from department if not set
         if not self.day_salary:
-            self.day_salary = self.employee_assignment.assignment_group.department.day_salary
-        super().save(*args, **kwargs)
+            self.day_salary = self.employee_assignment.assignment_group.day_salary
+
+        adding = self._state.adding
+        marks_presence = self.attended and (adding or not getattr(self, '_attended_on_load', True))
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if marks_presence:
+                attended_at = self.created_at if adding else timezone.now()
+                # Only move the employee's pointer forward
+                Employee.objects.filter(
+                    Q(last_attended_at__isnull=True) | Q(last_attended_at__lt=attended_at),
+                    pk=self.employee_assignment.employee_id
+                ).update(
+                    last_attended_at=attended_at,
+                    last_assignment_id=self.employee_assignment_id
+                )
+        self._attended_on_load = self.attended
 
     def clean(self):
         # Ensure attendance is only marked for active assignments
@@ -123,4 +228,88 @@ class Attendance(models.Model):
         
         # Ensure attendance is not marked for future dates
         if self.date > timezone.now().date():
-            raise ValidationError(_("Cannot mark attendance for future dates"))
\ No newline at end of file
+            raise ValidationError(_("Cannot mark attendance for future dates"))
+
+class AttendanceArchive(models.Model):
+    """
+    Cold storage for attendance of closed payroll periods (calendar months).
+    Rows keep their original Attendance id and are moved here by the
+    archive_attendance management command.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    employee_assignment = models.ForeignKey(
+        'EmployeeAssignment',
+        on_delete=models.CASCADE,
+        related_name='archived_attendances'
+    )
+    date = models.DateField()
+    attended = models.BooleanField(default=False)
+    day_salary = models.CharField(max_length=255, null=True, blank=True)
+    is_supervisor = models.BooleanField(default=False)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-date']
+        indexes = [
+            models.Index(fields=['date'], name='home_attarchive_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.employee_assignment.employee.name} - {self.date} (archived)"
+
+class ChangeLog(models.Model):
+    """
+    Append-only feed of writes to the home models, read by /api/changes/. Written
+    by home/signals.py and by the bulk write paths through home.changes.record_changes;
+    compact_changelog drops superseded rows. The sequence, numbered only once the
+    row is committed (home.changes.sequence_changes), is the sync cursor.
+    """
+    ACTIONS = (
+        ('upsert', 'Upsert'),
+        ('delete', 'Delete')
+    )
+
+    model = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTIONS)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sequence = models.BigIntegerField(null=True, blank=True, unique=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'object_id'], name='home_changelog_object_idx'),
+            models.Index(fields=['id'], condition=Q(sequence__isnull=True), name='home_changelog_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.action} {self.model} {self.object_id}"
+
+class IdempotencyKey(models.Model):
+    """
+    Outcome of a write request sent with an Idempotency-Key header, replayed to
+    retries of the same request until it expires (see home/idempotency.py).
+    """
+    STATES = (
+        ('pending', 'Pending'),
+        ('done', 'Done')
+    )
+
+    # SHA-256 of the view, the caller and the client's key
+    key = models.CharField(max_length=64, primary_key=True)
+    # SHA-256 of the request body, so a key reused for another payload is refused
+    fingerprint = models.CharField(max_length=64)
+    state = models.CharField(max_length=10, choices=STATES, default='pending')
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.BinaryField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at'], name='home_idempotency_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.state})"
@@ -0,0 +1,178 @@
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import Q
+from home.models import Employee
+
+# Columns covered by the employee search index
+SEARCH_COLUMNS = ('name', 'phone_number', 'nid')
+
+# FTS5 shadow table kept in sync with home_employee on SQLite by SEARCH_TRIGGERS
+SEARCH_TABLE = 'home_employee_search'
+
+# FTS5 trigram queries need at least three characters to use the index
+MIN_TRIGRAM_LENGTH = 3
+
+_fts_tables = {}
+
+
+def search_backend():
+    """
+    Returns the search strategy available on the current database:
+    'postgresql' (pg_trgm GIN indexes), 'fts5' (SQLite shadow table) or 'like'.
+    """
+    if connection.vendor == 'postgresql':
+        return 'postgresql'
+    if connection.vendor == 'sqlite':
+        if connection.alias not in _fts_tables:
+            _fts_tables[connection.alias] = SEARCH_TABLE in connection.introspection.table_names()
+        if _fts_tables[connection.alias]:
+            return 'fts5'
+    return 'like'
+
+
+def _like_pattern(query):
+    escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+
+def _search_postgresql(query, limit):
+    pattern = _like_pattern(query)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT id
+            FROM home_employee
+            WHERE name %% %s
+               OR name ILIKE %s
+               OR phone_number ILIKE %s
+               OR nid ILIKE %s
+            ORDER BY GREATEST(
+                similarity(COALESCE(name, ''), %s),
+                similarity(COALESCE(phone_number, ''), %s),
+                similarity(COALESCE(nid, ''), %s)
+            ) DESC, id DESC
+            LIMIT %s
+            """,
+            [query, pattern, pattern, pattern, query, query, query, limit]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _search_fts5(query, limit):
+    with connection.cursor() as cursor:
+        if len(query) >= MIN_TRIGRAM_LENGTH:
+            phrase = '"' + query.replace('"', '""') + '"'
+            cursor.execute(
+                f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s "
+                f"ORDER BY rank, rowid DESC LIMIT %s",
+                [phrase, limit]
+            )
+        else:
+            # Too short for trigrams: fall back to a scan of the (small) shadow table
+            pattern = _like_pattern(query)
+            cursor.execute(
+                f"SELECT rowid FROM {SEARCH_TABLE} "
+                f"WHERE name LIKE %s ESCAPE '\\' OR phone_number LIKE %s ESCAPE '\\' "
+                f"OR nid LIKE %s ESCAPE '\\' ORDER BY rowid DESC LIMIT %s",
+                [pattern, pattern, pattern, limit]
+            )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _search_like(query, limit):
+    condition = Q()
+    for column in SEARCH_COLUMNS:
+        condition |= Q(**{f"{column}__icontains": query})
+    return list(
+        Employee.objects.filter(condition).order_by('-id').values_list('id', flat=True)[:limit]
+    )
+
+
+def search_employee_ids(query, limit=20):
+    """
+    Returns up to `limit` employee ids matching `query` on name, phone number or NID,
+    best matches first.
+    """
+    query = (query or '').strip()
+    if not query:
+        return []
+
+    backend = search_backend()
+    if backend == 'postgresql':
+        return _search_postgresql(query, limit)
+    if backend == 'fts5':
+        return _search_fts5(query, limit)
+    return _search_like(query, limit)
+
+
+def search_employees(query, limit=20):
+    """
+    Returns the matching Employee instances in ranked order.
+    """
+    ids = search_employee_ids(query, limit)
+    employees = Employee.objects.in_bulk(ids)
+    return [employees[pk] for pk in ids if pk in employees]
+
+
+# Triggers that keep the shadow table in step with every write to home_employee,
+# including bulk_create, QuerySet.update() and raw SQL that send no model signals.
+# The update trigger must not cover id: home.locking takes SQLite's write lock
+# with "SET id = id", which has to stay a plain write with no FTS5 reads first
+SEARCH_TRIGGERS = {
+    'home_employee_search_insert': (
+        f"AFTER INSERT ON home_employee BEGIN "
+        f"INSERT INTO {SEARCH_TABLE} (rowid, name, phone_number, nid) "
+        f"VALUES (new.id, new.name, new.phone_number, new.nid); END"
+    ),
+    'home_employee_search_update': (
+        f"AFTER UPDATE OF name, phone_number, nid ON home_employee BEGIN "
+        f"DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id; "
+        f"INSERT INTO {SEARCH_TABLE} (rowid, name, phone_number, nid) "
+        f"VALUES (new.id, new.name, new.phone_number, new.nid); END"
+    ),
+    'home_employee_search_delete': (
+        f"AFTER DELETE ON home_employee BEGIN "
+        f"DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id; END"
+    ),
+}
+
+
+def install_search_triggers(using=None):
+    """
+    Creates any missing or outdated shadow-table triggers and returns their names.
+    SQLite drops triggers when a migration rebuilds home_employee, so this runs
+    after every migrate; the index is rebuilt whenever a trigger was (re)created.
+    """
+    db = connections[using or DEFAULT_DB_ALIAS]
+    if db.vendor != 'sqlite' or SEARCH_TABLE not in db.introspection.table_names():
+        return []
+    with db.cursor() as cursor:
+        cursor.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'home_employee'")
+        existing = dict(cursor.fetchall())
+        missing = [
+            name for name, body in SEARCH_TRIGGERS.items()
+            if existing.get(name) != f"CREATE TRIGGER {name} {body}"
+        ]
+        for name in missing:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+            cursor.execute(f"CREATE TRIGGER {name} {SEARCH_TRIGGERS[name]}")
+    if missing:
+        rebuild_search_index(using)
+    return missing
+
+
+def rebuild_search_index(using=None):
+    """
+    Repopulates the SQLite shadow table from home_employee and returns the number
+    of indexed rows. The triggers keep it current; this repairs a drifted index.
+    """
+    db = connections[using or DEFAULT_DB_ALIAS]
+    if db.vendor != 'sqlite' or SEARCH_TABLE not in db.introspection.table_names():
+        return 0
+    with db.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, name, phone_number, nid) "
+            f"SELECT id, name, phone_number, nid FROM home_employee"
+        )
+        cursor.execute(f"SELECT COUNT(*) FROM {SEARCH_TABLE}")
+        return cursor.fetchone()[0]
@@ -1,6 +1,9 @@
 from home.models import *
+from home.locking import employee_lock, assignments_lock
+from home.changes import record_changes
 from account.models import *
 from rest_framework import serializers
+from django.db.models import Min, Q, Case, When, Value
 from django.contrib.auth.models import Permission
 
 class PermissionSerializer(serializers.ModelSerializer):
@@ -99,17 +102,10 @@ class AssignmentGroupSerializer(serializers.ModelSerializer):
 class AssignmentGroupDetailSerializer(AssignmentGroupSerializer):
     """Detailed serializer for retrieving assignment group information"""
     employee_assignments = EmployeeAssignmentSerializer(many=True, read_only=True)
-    total_employees = serializers.SerializerMethodField()
-    active_employees = serializers.SerializerMethodField()
 
     class Meta(AssignmentGroupSerializer.Meta):
         fields = AssignmentGroupSerializer.Meta.fields + ['total_employees', 'active_employees']
-
-    def get_total_employees(self, obj):
-        return obj.employee_assignments.count()
-
-    def get_active_employees(self, obj):
-        return obj.employee_assignments.filter(status='active').count()
+        read_only_fields = AssignmentGroupSerializer.Meta.read_only_fields + ['total_employees', 'active_employees']
 
 class AttendanceSerializer(serializers.ModelSerializer):
     employee_id = serializers.CharField(source='employee_assignment.employee.id', read_only=True)
@@ -142,6 +138,17 @@ class AttendanceSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['day_salary']
 
+class AttendanceArchiveSerializer(AttendanceSerializer):
+    """Read-only serializer for archived attendance, same shape as AttendanceSerializer"""
+    class Meta(AttendanceSerializer.Meta):
+        model = AttendanceArchive
+
+
+class ScanRejected(Exception):
+    """A tag that resolved correctly but cannot be marked; `reason` feeds the scan metrics."""
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason
 
 class AttendanceMarkSerializer(serializers.Serializer):
     tag_ids = serializers.ListField(
@@ -149,23 +156,55 @@ class AttendanceMarkSerializer(serializers.Serializer):
         required=True,
         allow_empty=False
     )
-    date = serializers.DateField(required=False, default=timezone.now().date())
+    date = serializers.DateField(required=False, default=timezone.localdate)
+
+    def resolve_tags(self, tag_ids):
+        """
+        Resolves every tag in a fixed number of queries. Returns a dict mapping each
+        known tag to (employee_assignment, is_supervisor); supervisor tags win over
+        employee tags, as before. Assignments come with their employee and group
+        (carrying the day salary snapshot) and the group's department preloaded.
+        """
+        related = ('employee', 'assignment_group__department')
+        supervised_groups = {
+            group.supervisor.tag_id: group
+            for group in AssignmentGroup.objects.filter(
+                supervisor__tag_id__in=tag_ids, is_active=True
+            ).select_related('supervisor')
+        }
+        # Supervisor attendance is attached to the first assignment of their group
+        first_assignments = EmployeeAssignment.objects.filter(
+            assignment_group__in=supervised_groups.values()
+        ).values('assignment_group').annotate(first_id=Min('id')).values('first_id')
+        group_assignments = {
+            assignment.assignment_group_id: assignment
+            for assignment in EmployeeAssignment.objects.filter(
+                id__in=first_assignments
+            ).select_related(*related)
+        } if supervised_groups else {}
+        employee_assignments = {
+            assignment.employee.tag_id: assignment
+            for assignment in EmployeeAssignment.objects.filter(
+                employee__tag_id__in=tag_ids, status='active'
+            ).select_related(*related)
+        }
+
+        resolved = {}
+        for tag_id in tag_ids:
+            if tag_id in supervised_groups:
+                resolved[tag_id] = (group_assignments.get(supervised_groups[tag_id].id), True)
+            elif tag_id in employee_assignments:
+                resolved[tag_id] = (employee_assignments[tag_id], False)
+        return resolved
 
     def validate_tag_ids(self, value):
         if not value:
             raise serializers.ValidationError("At least one tag_id is required.")
 
-        # Validate each tag_id individually
+        self._resolved_tags = self.resolve_tags(value)
         for tag_id in value:
-            try:
-                # Check if it's a supervisor
-                AssignmentGroup.objects.get(supervisor__tag_id=tag_id, is_active=True)
-            except AssignmentGroup.DoesNotExist:
-                # If not a supervisor, check if it's an employee
-                try:
-                    EmployeeAssignment.objects.get(employee__tag_id=tag_id, status='active')
-                except EmployeeAssignment.DoesNotExist:
-                    raise serializers.ValidationError(f"No active assignment found for tag ID {tag_id}")
+            if tag_id not in self._resolved_tags:
+                raise serializers.ValidationError(f"No active assignment found for tag ID {tag_id}")
         return value
 
     def create(self, validated_data):
@@ -173,59 +212,198 @@ class AttendanceMarkSerializer(serializers.Serializer):
         date = validated_data.get('date')
         attendance_records = []
         errors = {}
+        error_reasons = {}
+        resolved_tags = getattr(self, '_resolved_tags', None) or self.resolve_tags(tag_ids)
 
         for tag_id in tag_ids:
             try:
                 # Determine if the tag belongs to a supervisor or an employee
-                try:
-                    assignment_group = AssignmentGroup.objects.get(supervisor__tag_id=tag_id, is_active=True)
-                    employee_assignment = EmployeeAssignment.objects.filter(assignment_group=assignment_group).first()
-                    is_supervisor = True
-                except AssignmentGroup.DoesNotExist:
-                    employee_assignment = EmployeeAssignment.objects.get(employee__tag_id=tag_id, status='active')
-                    is_supervisor = False
-
-                # Enforce the 8-hour rule
-                # Get the most recent attendance record for this employee (across all assignments)
-                last_attendance = Attendance.objects.filter(
-                    employee_assignment__employee=employee_assignment.employee
-                ).order_by('-created_at').first()
-                now = timezone.now()
-                if last_attendance and (now - last_attendance.created_at).total_seconds() < 8 * 3600:
-                    if last_attendance.employee_assignment != employee_assignment:
-                        raise Exception(
-                            f"Employee with tag ID {tag_id} has attended in a different assignment less than 8 hours ago."
-                        )
-                    else:
-                        raise Exception(
-                            f"Attendance for employee with tag ID {tag_id} has already been marked within the last 8 hours."
-                        )
+                employee_assignment, is_supervisor = resolved_tags[tag_id]
+                if employee_assignment is None:
+                    raise ScanRejected(
+                        'empty_group',
+                        f"No employees are assigned to the group supervised by tag ID {tag_id}."
+                    )
 
-                # Check if attendance already exists for the given date
-                existing_attendance = Attendance.objects.filter(
-                    employee_assignment=employee_assignment,
-                    date=date
-                ).first()
-                if existing_attendance:
-                    if existing_attendance.attended:
-                        raise Exception(
-                            f"Attendance has already been marked for tag ID {tag_id} on this date."
-                        )
-                    # Update the attendance if not marked yet
-                    existing_attendance.attended = True
-                    existing_attendance.save()
-                    attendance_records.append(existing_attendance)
-                else:
-                    # Create a new attendance record
-                    attendance = Attendance.objects.create(
+                # Hold the employee lock from the 8-hour check until the write commits,
+                # so concurrent scans of the same badge cannot both pass the check
+                with employee_lock(employee_assignment.employee_id) as employee:
+                    # Enforce the 8-hour rule
+                    # The locked employee row carries its most recent attendance (across all assignments)
+                    now = timezone.now()
+                    if employee.last_attended_at and (now - employee.last_attended_at).total_seconds() < 8 * 3600:
+                        if employee.last_assignment_id != employee_assignment.id:
+                            raise ScanRejected(
+                                'different_assignment',
+                                f"Employee with tag ID {tag_id} has attended in a different assignment less than 8 hours ago."
+                            )
+                        else:
+                            raise ScanRejected(
+                                'within_8_hours',
+                                f"Attendance for employee with tag ID {tag_id} has already been marked within the last 8 hours."
+                            )
+
+                    # Check if attendance already exists for the given date
+                    existing_attendance = Attendance.objects.filter(
                         employee_assignment=employee_assignment,
-                        date=date,
-                        attended=True,
-                        is_supervisor=is_supervisor
-                    )
-                    attendance_records.append(attendance)
+                        date=date
+                    ).first()
+                    if existing_attendance:
+                        if existing_attendance.attended:
+                            raise ScanRejected(
+                                'already_marked',
+                                f"Attendance has already been marked for tag ID {tag_id} on this date."
+                            )
+                        # Update the attendance if not marked yet
+                        existing_attendance.employee_assignment = employee_assignment
+                        existing_attendance.attended = True
+                        existing_attendance.save()
+                        attendance_records.append(existing_attendance)
+                    else:
+                        # Create a new attendance record
+                        attendance = Attendance.objects.create(
+                            employee_assignment=employee_assignment,
+                            date=date,
+                            attended=True,
+                            day_salary=employee_assignment.assignment_group.day_salary,
+                            is_supervisor=is_supervisor
+                        )
+                        attendance_records.append(attendance)
             except Exception as e:
                 # Record the error for this specific tag_id without stopping the loop
                 errors[tag_id] = str(e)
+                error_reasons[tag_id] = getattr(e, 'reason', 'error')
+
+        return {"attendance_records": attendance_records, "errors": errors, "error_reasons": error_reasons}
+
+class CrewAttendanceSerializer(serializers.Serializer):
+    """
+    Marks a whole crew's day at once. The group is picked by its supervisor's tag
+    or by id. Give either `present` or `absent` as employee IDs; every other active
+    member of the group gets the opposite. The supervisor is not marked.
+    """
+    supervisor_tag_id = serializers.CharField(required=False)
+    assignment_group = serializers.IntegerField(required=False)
+    present = serializers.ListField(child=serializers.IntegerField(), required=False)
+    absent = serializers.ListField(child=serializers.IntegerField(), required=False)
+    date = serializers.DateField(required=False, default=timezone.localdate)
+
+    def validate(self, data):
+        if ('supervisor_tag_id' in data) == ('assignment_group' in data):
+            raise serializers.ValidationError("Provide either supervisor_tag_id or assignment_group.")
+        if ('present' in data) == ('absent' in data):
+            raise serializers.ValidationError("Provide either a present or an absent list.")
+
+        if 'supervisor_tag_id' in data:
+            group = AssignmentGroup.objects.filter(
+                supervisor__tag_id=data['supervisor_tag_id'], is_active=True
+            ).first()
+            if not group:
+                raise serializers.ValidationError(
+                    f"No active group is supervised by tag ID {data['supervisor_tag_id']}."
+                )
+        else:
+            group = AssignmentGroup.objects.filter(id=data['assignment_group'], is_active=True).first()
+            if not group:
+                raise serializers.ValidationError("Active assignment group not found.")
+
+        listed = set(data.get('present', data.get('absent')))
+        members = set(
+            EmployeeAssignment.objects.filter(assignment_group=group, status='active')
+            .values_list('employee_id', flat=True)
+        )
+        unknown = sorted(listed - members)
+        if unknown:
+            raise serializers.ValidationError(
+                f"Employees {unknown} are not active members of group {group.id}."
+            )
+
+        data['group'] = group
+        data['present_ids'] = listed if 'present' in data else members - listed
+        return data
+
+    def create(self, validated_data):
+        group = validated_data['group']
+        date = validated_data['date']
+        present_ids = validated_data['present_ids']
+        errors = {}
+        error_reasons = {}
+
+        def reject(employee_id, reason, message):
+            errors[employee_id] = message
+            error_reasons[employee_id] = reason
+
+        members = EmployeeAssignment.objects.filter(assignment_group=group, status='active')
+        with assignments_lock(members) as assignments:
+            now = timezone.now()
+            existing = {
+                attendance.employee_assignment_id: attendance
+                for attendance in Attendance.objects.filter(employee_assignment__in=assignments, date=date)
+            }
+
+            new_records, flipped, marked = [], [], {}
+            for assignment in assignments:
+                employee = assignment.employee
+                attendance = existing.get(assignment.id)
+                if employee.id not in present_ids:
+                    if attendance is None:
+                        new_records.append(Attendance(
+                            employee_assignment=assignment, date=date, attended=False,
+                            day_salary=group.day_salary
+                        ))
+                    continue
+
+                # Enforce the 8-hour rule from the pointers read under the lock
+                if employee.last_attended_at and (now - employee.last_attended_at).total_seconds() < 8 * 3600:
+                    if employee.last_assignment_id != assignment.id:
+                        reject(employee.id, 'different_assignment',
+                               f"Employee {employee.id} has attended in a different assignment less than 8 hours ago.")
+                    else:
+                        reject(employee.id, 'within_8_hours',
+                               f"Attendance for employee {employee.id} has already been marked within the last 8 hours.")
+                    continue
+
+                if attendance is None:
+                    new_records.append(Attendance(
+                        employee_assignment=assignment, date=date, attended=True,
+                        day_salary=group.day_salary
+                    ))
+                elif attendance.attended:
+                    reject(employee.id, 'already_marked',
+                           f"Attendance has already been marked for employee {employee.id} on this date.")
+                    continue
+                else:
+                    flipped.append(attendance.id)
+                marked[employee.id] = assignment.id
+
+            Attendance.objects.bulk_create(new_records)
+            if flipped:
+                Attendance.objects.filter(id__in=flipped).update(attended=True, updated_at=now)
+            changed_ids = [record.pk for record in new_records] + flipped
+            record_changes(Attendance, changed_ids)
+            if marked:
+                # Move every marked employee's pointer forward in one UPDATE
+                Employee.objects.filter(
+                    Q(last_attended_at__isnull=True) | Q(last_attended_at__lt=now),
+                    pk__in=marked
+                ).update(
+                    last_attended_at=now,
+                    last_assignment_id=Case(
+                        *[When(pk=employee_id, then=Value(assignment_id))
+                          for employee_id, assignment_id in marked.items()]
+                    )
+                )
+
+            attendance_records = list(
+                Attendance.objects.filter(employee_assignment__in=assignments, date=date)
+                .select_related('employee_assignment__employee', 'employee_assignment__assignment_group__department')
+            )
 
-        return {"attendance_records": attendance_records, "errors": errors}
+        return {
+            "group": group,
+            "attendance_records": attendance_records,
+            "marked": len(marked),
+            "changed_ids": set(changed_ids),
+            "errors": errors,
+            "error_reasons": error_reasons
+        }
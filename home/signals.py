@@ -0,0 +1,71 @@
+from django.dispatch import receiver
+from django.db.models.signals import post_save, post_delete
+from home.models import Employee, EmployeeAssignment, Attendance
+from home.attendance import refresh_last_attendance
+from home.assignments import adjust_group_counters
+from home.changes import CHANGE_FEEDS, DELETE, record_changes
+
+@receiver(post_delete, sender=Attendance)
+def refresh_employee_last_attendance(sender, instance, origin=None, **kwargs):
+    # Only single-record deletes: QuerySet deletes refresh their whole batch in
+    # AttendanceQuerySet.delete, cascades from assignments are handled by
+    # refresh_pointer_of_deleted_assignment, cascades from employees need nothing
+    if not instance.attended or not isinstance(origin, Attendance):
+        return
+    refresh_last_attendance(
+        EmployeeAssignment.objects.filter(pk=instance.employee_assignment_id).values('employee_id')
+    )
+
+@receiver(post_save, sender=Attendance)
+def refresh_employee_last_attendance_on_absence(sender, instance, created, raw=False, **kwargs):
+    # A record flipped from present to absent may be the one the pointer refers to.
+    # Attendance.save updates _attended_on_load only after this signal
+    if raw or created or instance.attended or not getattr(instance, '_attended_on_load', True):
+        return
+    refresh_last_attendance([instance.employee_assignment.employee_id])
+
+@receiver(post_delete, sender=EmployeeAssignment)
+def refresh_pointer_of_deleted_assignment(sender, instance, **kwargs):
+    # SET_NULL cleared last_assignment but kept last_attended_at: recompute both
+    # from the attendance left, if the pointer referred to this assignment
+    if Employee.objects.filter(
+        pk=instance.employee_id, last_assignment__isnull=True, last_attended_at__isnull=False
+    ).exists():
+        refresh_last_attendance([instance.employee_id])
+
+@receiver(post_save, sender=EmployeeAssignment)
+def update_group_counters(sender, instance, created, raw=False, **kwargs):
+    # Fixtures load with raw=True; recount_groups covers them afterwards
+    if raw:
+        return
+    is_active = instance.status == 'active'
+    if created:
+        adjust_group_counters(instance.assignment_group_id, total=1, active=int(is_active))
+    else:
+        old_group = getattr(instance, '_group_on_load', instance.assignment_group_id)
+        was_active = getattr(instance, '_status_on_load', instance.status) == 'active'
+        if old_group != instance.assignment_group_id:
+            adjust_group_counters(old_group, total=-1, active=-int(was_active))
+            adjust_group_counters(instance.assignment_group_id, total=1, active=int(is_active))
+        else:
+            adjust_group_counters(instance.assignment_group_id, active=int(is_active) - int(was_active))
+    instance._group_on_load = instance.assignment_group_id
+    instance._status_on_load = instance.status
+
+@receiver(post_delete, sender=EmployeeAssignment)
+def decrement_group_counters(sender, instance, **kwargs):
+    was_active = getattr(instance, '_status_on_load', instance.status) == 'active'
+    adjust_group_counters(
+        getattr(instance, '_group_on_load', instance.assignment_group_id),
+        total=-1, active=-int(was_active)
+    )
+
+def record_upsert(sender, instance, **kwargs):
+    record_changes(sender, [instance.pk])
+
+def record_delete(sender, instance, **kwargs):
+    record_changes(sender, [instance.pk], DELETE)
+
+for model in CHANGE_FEEDS.values():
+    post_save.connect(record_upsert, sender=model)
+    post_delete.connect(record_delete, sender=model)
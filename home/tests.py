@@ -1,3 +1,966 @@
-from django.test import TestCase
+import os
+import asyncio
+import sys
+import json
+import uuid
+import shutil
+import tempfile
+import subprocess
+import time
+import threading
+import datetime
+from urllib.parse import urlencode
+from decimal import Decimal
+from django.db import IntegrityError, connection, transaction
+from django.urls import reverse
+from django.test.utils import CaptureQueriesContext
+from unittest import mock, skipIf
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.authtoken.models import Token
+from api.events import BROKER, EVENT_SUBSCRIBERS, EventBroker, event_stream, format_event
+from api.metrics import RETIRED_FILE, Counter, Gauge, Registry
+from api.renderers import FastJSONRenderer
+from api.throttling import DB_LATENCY, DB_LATENCY_EWMA
+from home.models import *
+from home.serializers import *
+from home.attendance import ABSENTEE_BATCH_SIZE, attendance_stats, find_absentees, materialize_absentees
+from home.assignments import (
+    ACTIVE_ELSEWHERE, ALREADY_IN_GROUP, _conflict_message, assign_employees, rollover_assignment_groups
+)
+from home.changes import DELETE, UPSERT, compact_changelog, head_cursor, read_changes, record_changes
+from home.checks import check_shared_cache
+from home.fast_serializers import fast_serialize
+from home.idempotency import DONE, PENDING, idempotent, record_key
+from home.search import SEARCH_TRIGGERS, install_search_triggers, search_backend, search_employee_ids
 
-# Create your tests here.
+
+class FastJSONRendererParityTests(TestCase):
+    """
+    FastJSONRenderer must produce the same bytes as DRF's JSONRenderer.
+    """
+    def assertSameBytes(self, data, accepted_media_type=None):
+        self.assertEqual(
+            FastJSONRenderer().render(data, accepted_media_type),
+            JSONRenderer().render(data, accepted_media_type)
+        )
+
+    def test_scalars_and_containers(self):
+        self.assertSameBytes({
+            "int": 7, "negative": -12, "zero": 0, "bool": True, "none": None,
+            "float": 0.1, "large_float": 123456789.125, "small_float": 0.0005,
+            "string": "plain", "empty": "", "list": [1, "two", [3]], "tuple": (1, 2),
+            "nested": {"a": {"b": {"c": []}}},
+        })
+
+    def test_unicode_and_javascript_line_separators(self):
+        self.assertSameBytes({
+            "name": "Mukamana Émérance", "emoji": "\U0001F600", "quote": 'say "hi"\n',
+            "separators": "a\u2028b\u2029c", "control": "\x00\x1f",
+        })
+
+    def test_types_encoded_through_drf(self):
+        self.assertSameBytes({
+            "decimal": Decimal("5000.50"),
+            "datetime": datetime.datetime(2024, 5, 17, 8, 30, 15, 123456, tzinfo=datetime.timezone.utc),
+            "naive_datetime": datetime.datetime(2024, 5, 17, 8, 30, 15),
+            "date": datetime.date(2024, 5, 17),
+            "time": datetime.time(8, 30, 15, 500000),
+            "timedelta": datetime.timedelta(hours=8),
+            "uuid": uuid.UUID("12345678-1234-5678-1234-567812345678"),
+            "set": {1},
+        })
+
+    def test_floats(self):
+        self.assertSameBytes({
+            # Every attendance rate the stats endpoints can produce
+            "rates": [round(present / 10000, 4) for present in range(10001)],
+            "thirds": [round(1 / 3, 4), round(2 / 3, 4)],
+            "ordinary": [0.1 + 0.2, 1.5, -2.25, 1e-4, 9999999999999998.0, 123456.789],
+        })
+
+    def test_attendance_stats(self):
+        department = Department.objects.create(name='Harvest', day_salary='5000')
+        field = Field.objects.create(name='North', address='Kigali')
+        supervisor = Employee.objects.create(name='Supervisor', tag_id='sup-1')
+        group = AssignmentGroup.objects.create(
+            name='Crew', field=field, department=department, supervisor=supervisor
+        )
+        today = timezone.localdate()
+        for n in range(3):
+            assignment = EmployeeAssignment.objects.create(
+                assignment_group=group, employee=Employee.objects.create(name=f'Worker {n}', tag_id=f't-{n}')
+            )
+            Attendance.objects.create(employee_assignment=assignment, date=today, attended=n > 0)
+
+        rows = attendance_stats(today, today, 'assignment_group')
+        self.assertEqual(rows[0]["rate"], 0.6667)
+        self.assertSameBytes({"rows": rows})
+
+    def test_integer_keys_and_wide_integers(self):
+        self.assertSameBytes({1: "one", "big": 2 ** 70, "negative_big": -(2 ** 64)})
+
+    def test_indented_output(self):
+        self.assertSameBytes({"a": [1, {"b": None}]}, 'application/json; indent=2')
+
+    def test_serialized_attendance(self):
+        department = Department.objects.create(name='Harvest', day_salary='5000')
+        field = Field.objects.create(name='North', address='Kigali')
+        supervisor = Employee.objects.create(name='Supervisor', tag_id='sup-1')
+        group = AssignmentGroup.objects.create(
+            name='Crew', field=field, department=department, supervisor=supervisor
+        )
+        for index in range(3):
+            employee = Employee.objects.create(name=f'Worker {index}', tag_id=f'tag-{index}')
+            assignment = EmployeeAssignment.objects.create(assignment_group=group, employee=employee)
+            Attendance.objects.create(
+                employee_assignment=assignment, date=timezone.now().date(), attended=bool(index % 2)
+            )
+
+        self.assertSameBytes(AttendanceSerializer(Attendance.objects.all(), many=True).data)
+        self.assertSameBytes(fast_serialize(Attendance.objects.all(), AttendanceSerializer))
+        self.assertSameBytes(
+            AssignmentGroupSerializer(AssignmentGroup.objects.all(), many=True).data
+        )
+
+
+# The manifest is only built by collectstatic
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class AdminQueryCountTests(TestCase):
+    """
+    Admin changelists and autocomplete lookups run a fixed number of queries,
+    however many rows the page shows.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        department = Department.objects.create(name='Seed department', day_salary='5000')
+        field = Field.objects.create(name='Seed field', address='Seed')
+        people = Employee.objects.bulk_create(
+            Employee(name=f'Seed employee {i}', tag_id=f'seed-{i}') for i in range(150)
+        )
+        groups = [
+            AssignmentGroup.objects.create(
+                name=f'Seed group {i}', field=field, department=department, supervisor=people[i]
+            )
+            for i in range(3)
+        ]
+        assignments = EmployeeAssignment.objects.bulk_create(
+            EmployeeAssignment(assignment_group=groups[i % len(groups)], employee=person)
+            for i, person in enumerate(people)
+        )
+        today = timezone.now().date()
+        Attendance.objects.bulk_create(
+            Attendance(
+                employee_assignment=assignment, date=today - datetime.timedelta(days=day),
+                attended=bool((assignment.id + day) % 4), day_salary='5000'
+            )
+            for assignment in assignments for day in range(2)
+        )
+        now = timezone.now()
+        AttendanceArchive.objects.bulk_create(
+            AttendanceArchive(
+                id=10 ** 6 + assignment.id, employee_assignment=assignment, date=today - datetime.timedelta(days=120),
+                attended=True, day_salary='5000', created_at=now, updated_at=now
+            )
+            for assignment in assignments
+        )
+        cls.admin = get_user_model().objects.create_superuser('admin@example.com', 'Admin', None, 'password')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def assertPageQueries(self, queries, name, params=None):
+        with self.assertNumQueries(queries):
+            response = self.client.get(reverse(name), params or {})
+        self.assertEqual(response.status_code, 200)
+
+    def test_assignment_group_changelist(self):
+        self.assertPageQueries(7, 'admin:home_assignmentgroup_changelist')
+
+    def test_employee_assignment_changelist(self):
+        self.assertPageQueries(5, 'admin:home_employeeassignment_changelist')
+        self.assertPageQueries(4, 'admin:home_employeeassignment_changelist', {'status__exact': 'active'})
+
+    def test_attendance_changelist(self):
+        self.assertPageQueries(5, 'admin:home_attendance_changelist')
+        self.assertPageQueries(4, 'admin:home_attendance_changelist', {'attended__exact': '1', 'q': 'Seed'})
+
+    def test_attendance_archive_changelist(self):
+        self.assertPageQueries(5, 'admin:home_attendancearchive_changelist')
+
+    def test_autocomplete(self):
+        self.assertPageQueries(4, 'admin:autocomplete', {
+            'app_label': 'home', 'model_name': 'attendance', 'field_name': 'employee_assignment', 'term': 'Seed',
+        })
+        self.assertPageQueries(5, 'admin:autocomplete', {
+            'app_label': 'home', 'model_name': 'employeeassignment', 'field_name': 'assignment_group', 'term': '',
+        })
+
+
+class EmployeeSearchIndexTests(TestCase):
+    """
+    The search index must follow writes that bypass model signals.
+    """
+    def assertFound(self, query, employee):
+        self.assertIn(employee.pk, search_employee_ids(query))
+
+    def assertNotFound(self, query, employee):
+        self.assertNotIn(employee.pk, search_employee_ids(query))
+
+    def test_bulk_create_update_and_delete(self):
+        [employee] = Employee.objects.bulk_create([Employee(name='Uwimana Claudine', tag_id='S-1')])
+        self.assertFound('Claudine', employee)
+
+        Employee.objects.filter(pk=employee.pk).update(name='Mukamana Odette', phone_number='0788123456')
+        self.assertFound('Odette', employee)
+        self.assertFound('8123', employee)
+        self.assertNotFound('Claudine', employee)
+
+        Employee.objects.filter(pk=employee.pk).delete()
+        self.assertNotFound('Odette', employee)
+
+    def test_raw_sql(self):
+        employee = Employee.objects.create(name='Habimana Eric', tag_id='S-2')
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE home_employee SET nid = %s WHERE id = %s", ['1199880012345678', employee.pk])
+        self.assertFound('9988001', employee)
+
+    def test_missing_triggers_are_recreated(self):
+        employee = Employee.objects.create(name='Niyonsaba Alice', tag_id='S-3')
+        if search_backend() != 'fts5':
+            self.skipTest('SQLite FTS5 only')
+        with connection.cursor() as cursor:
+            for name in SEARCH_TRIGGERS:
+                cursor.execute(f"DROP TRIGGER {name}")
+            cursor.execute("UPDATE home_employee SET name = 'Iradukunda Alice' WHERE id = %s", [employee.pk])
+
+        self.assertEqual(install_search_triggers(), list(SEARCH_TRIGGERS))
+        self.assertFound('Iradukunda', employee)
+        self.assertEqual(install_search_triggers(), [])
+
+
+class SharedCacheCheckTests(TestCase):
+    def test_process_local_cache_fails_deploy_check(self):
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertEqual([error.id for error in check_shared_cache(None)], ['home.E001'])
+
+    def test_shared_caches_pass(self):
+        for backend, location in (
+            ('django.core.cache.backends.redis.RedisCache', 'redis://localhost:6379'),
+            ('django.core.cache.backends.db.DatabaseCache', 'api_cache'),
+        ):
+            with override_settings(CACHES={'default': {'BACKEND': backend, 'LOCATION': location}}):
+                self.assertEqual(check_shared_cache(None), [])
+
+
+@skipIf(connection.vendor == 'sqlite' and connection.is_in_memory_db(), 'needs a file-backed test database')
+class ConcurrentScanTests(TransactionTestCase):
+    """
+    Concurrent scans of one badge must mark it once: employee_lock serialises them.
+    """
+    THREADS = 6
+
+    def setUp(self):
+        department = Department.objects.create(name='Harvest', day_salary='5000')
+        field = Field.objects.create(name='North', address='Musanze')
+        supervisor = Employee.objects.create(name='Supervisor', tag_id='SUP-1')
+        group = AssignmentGroup.objects.create(
+            name='Crew', field=field, department=department, supervisor=supervisor
+        )
+        self.employee = Employee.objects.create(name='Worker', tag_id='TAG-1')
+        EmployeeAssignment.objects.create(assignment_group=group, employee=self.employee)
+
+    def scan(self, barrier, results):
+        try:
+            serializer = AttendanceMarkSerializer(data={'tag_ids': ['TAG-1']})
+            serializer.is_valid(raise_exception=True)
+            barrier.wait()
+            results.append(serializer.save())
+        finally:
+            connection.close()
+
+    def test_same_badge_is_marked_once(self):
+        barrier = threading.Barrier(self.THREADS)
+        results = []
+        threads = [threading.Thread(target=self.scan, args=(barrier, results)) for _ in range(self.THREADS)]
+        real_now = timezone.now
+
+        def slow_now():
+            # Widen the window between the 8-hour check and the write
+            time.sleep(0.05)
+            return real_now()
+
+        with mock.patch.object(timezone, 'now', slow_now):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(results), self.THREADS)
+        self.assertEqual(sum(len(result['attendance_records']) for result in results), 1)
+        self.assertEqual(
+            sorted(reason for result in results for reason in result['error_reasons'].values()),
+            ['within_8_hours'] * (self.THREADS - 1)
+        )
+        self.assertEqual(Attendance.objects.filter(employee_assignment__employee=self.employee).count(), 1)
+
+
+class AttendanceDeleteTests(TestCase):
+    """
+    Deleting present records moves employees' last-attendance pointers back.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        department = Department.objects.create(name='Harvest', day_salary='5000')
+        field = Field.objects.create(name='North', address='Musanze')
+        supervisor = Employee.objects.create(name='Supervisor', tag_id='SUP-1')
+        group = AssignmentGroup.objects.create(
+            name='Crew', field=field, department=department, supervisor=supervisor
+        )
+        cls.employees = [Employee.objects.create(name=f'Worker {n}', tag_id=f'TAG-{n}') for n in range(4)]
+        cls.today = timezone.localdate()
+        for employee in cls.employees:
+            assignment = EmployeeAssignment.objects.create(assignment_group=group, employee=employee)
+            for days in (2, 1):
+                Attendance.objects.create(
+                    employee_assignment=assignment, date=cls.today - datetime.timedelta(days=days), attended=True
+                )
+
+    def latest_marks(self):
+        return dict(Employee.objects.filter(
+            pk__in=[employee.pk for employee in self.employees]
+        ).values_list('pk', 'last_attended_at'))
+
+    def test_queryset_delete_refreshes_pointers_once(self):
+        kept = dict(Attendance.objects.filter(date=self.today - datetime.timedelta(days=2)).values_list(
+            'employee_assignment__employee_id', 'created_at'
+        ))
+        with CaptureQueriesContext(connection) as context:
+            Attendance.objects.filter(date=self.today - datetime.timedelta(days=1)).delete()
+
+        refreshes = [query for query in context.captured_queries if query['sql'].startswith('UPDATE "home_employee"')]
+        self.assertEqual(len(refreshes), 1)
+        self.assertEqual(self.latest_marks(), kept)
+
+    def test_instance_delete_refreshes_pointer(self):
+        employee = self.employees[0]
+        latest = Attendance.objects.filter(employee_assignment__employee=employee).order_by('-date')
+        older = latest[1]
+        latest[0].delete()
+        self.assertEqual(self.latest_marks()[employee.pk], older.created_at)
+
+
+class MetricsMultiprocessTests(TestCase):
+    """
+    Snapshots of exited workers are folded once into the retired totals.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings_override = override_settings(METRICS={'MULTIPROC_DIR': self.directory})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.registry = Registry()
+        self.requests = self.registry.register(Counter('requests_total', 'Requests.', ['view']))
+        self.in_flight = self.registry.register(Gauge('in_flight', 'Requests in flight.'))
+
+    def write_worker(self, pid, requests, in_flight):
+        snapshot = {
+            'requests_total': {**self.requests.snapshot(), 'samples': [[['home'], requests]]},
+            'in_flight': {**self.in_flight.snapshot(), 'samples': [[[], in_flight]]},
+        }
+        with open(os.path.join(self.directory, f'metrics-{pid}.json'), 'w') as handle:
+            json.dump(snapshot, handle)
+
+    def samples(self, name):
+        return {tuple(labels): value for labels, value in self.registry.collect()[name]['samples']}
+
+    def test_dead_worker_counters_are_kept_and_gauges_dropped(self):
+        exited = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'], capture_output=True)
+        dead_pid = int(exited.stdout)
+        self.write_worker(dead_pid, requests=5, in_flight=3)
+        self.requests.inc(2, view='home')
+        self.in_flight.inc()
+
+        for _ in range(2):
+            self.assertEqual(self.samples('requests_total'), {('home',): 7})
+            self.assertEqual(self.samples('in_flight'), {(): 1})
+        self.assertFalse(os.path.exists(os.path.join(self.directory, f'metrics-{dead_pid}.json')))
+        self.assertTrue(os.path.exists(os.path.join(self.directory, RETIRED_FILE)))
+
+    def test_live_worker_snapshots_are_merged(self):
+        self.write_worker(os.getppid(), requests=4, in_flight=2)
+        self.requests.inc(view='home')
+        self.assertEqual(self.samples('requests_total'), {('home',): 5})
+        self.assertEqual(self.samples('in_flight'), {(): 2})
+
+
+class CrewAttendanceTests(TestCase):
+    url = '/api/mark-attendance/crew/'
+
+    @classmethod
+    def setUpTestData(cls):
+        department = Department.objects.create(name='Harvest', day_salary='5000')
+        field = Field.objects.create(name='North', address='Musanze')
+        cls.supervisor = Employee.objects.create(
+            name='Supervisor', tag_id='SUP-1', email='supervisor@example.com', phone_number='0788000001'
+        )
+        cls.group = AssignmentGroup.objects.create(
+            name='Crew', field=field, department=department, supervisor=cls.supervisor
+        )
+        other_supervisor = Employee.objects.create(name='Other', tag_id='SUP-2', email='other@example.com')
+        cls.other_group = AssignmentGroup.objects.create(
+            name='Other crew', field=field, department=department, supervisor=other_supervisor
+        )
+        cls.workers = [Employee.objects.create(name=f'Worker {n}', tag_id=f'TAG-{n}') for n in range(3)]
+        cls.assignments = [
+            EmployeeAssignment.objects.create(assignment_group=cls.group, employee=worker)
+            for worker in cls.workers
+        ]
+        User = get_user_model()
+        cls.admin = User.objects.create_superuser('admin@example.com', 'Admin', '0788000000', 'pw')
+        cls.supervisor_user = User.objects.create_user('Supervisor@Example.com', 'Supervisor', '0788000009', 'pw')
+        cls.other_user = User.objects.create_user('other@example.com', 'Other', '0788000010', 'pw')
+        cls.plain_user = User.objects.create_user('plain@example.com', 'Plain', '0788000011', 'pw')
+
+    def post(self, user, data):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.post(self.url, data, format='json')
+
+    def states(self):
+        return dict(
+            Attendance.objects.filter(date=timezone.localdate())
+            .values_list('employee_assignment__employee_id', 'attended')
+        )
+
+    def test_present_list_flips_absent_records_and_reports_changes(self):
+        first, second, third = self.workers
+        absent = Attendance.objects.create(
+            employee_assignment=self.assignments[0], date=timezone.localdate(), attended=False
+        )
+
+        serializer = CrewAttendanceSerializer(data={
+            'assignment_group': self.group.id, 'present': [first.id, second.id]
+        })
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        result = serializer.save()
+
+        self.assertEqual(self.states(), {first.id: True, second.id: True, third.id: False})
+        self.assertEqual(Attendance.objects.get(pk=absent.pk).attended, True)
+        self.assertEqual(result['marked'], 2)
+        self.assertEqual(
+            result['changed_ids'],
+            set(Attendance.objects.filter(date=timezone.localdate()).values_list('id', flat=True))
+        )
+        self.assertNotIn(self.supervisor.id, self.states())
+
+        # A second call changes nothing: marked members fall under the 8-hour rule
+        serializer = CrewAttendanceSerializer(data={'assignment_group': self.group.id, 'absent': [third.id]})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        result = serializer.save()
+        self.assertEqual(result['changed_ids'], set())
+        self.assertEqual(result['error_reasons'], {first.id: 'within_8_hours', second.id: 'within_8_hours'})
+
+    def test_absent_list_marks_everyone_else(self):
+        first, second, third = self.workers
+        response = self.post(self.admin, {'supervisor_tag_id': 'SUP-1', 'absent': [third.id]})
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['marked'], 2)
+        self.assertEqual(self.states(), {first.id: True, second.id: True, third.id: False})
+
+    def test_supervisor_can_mark_own_group_only(self):
+        response = self.post(self.supervisor_user, {'assignment_group': self.group.id, 'present': []})
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(set(self.states().values()), {False})
+
+        response = self.post(self.supervisor_user, {'assignment_group': self.other_group.id, 'present': []})
+        self.assertEqual(response.status_code, 403)
+        response = self.post(self.other_user, {'assignment_group': self.group.id, 'present': []})
+        self.assertEqual(response.status_code, 403)
+        response = self.post(self.plain_user, {'assignment_group': self.group.id, 'present': []})
+        self.assertEqual(response.status_code, 403)
+
+
+class MaterializeAbsenteesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        department = Department.objects.create(name='Harvest', day_salary='5000')
+        field = Field.objects.create(name='North', address='Musanze')
+        supervisor = Employee.objects.create(name='Supervisor', tag_id='SUP-1')
+        cls.group = AssignmentGroup.objects.create(
+            name='Crew', field=field, department=department, supervisor=supervisor
+        )
+        employees = Employee.objects.bulk_create([Employee(name=f'Worker {n}', tag_id=f'TAG-{n}') for n in range(70)])
+        EmployeeAssignment.objects.bulk_create([
+            EmployeeAssignment(assignment_group=cls.group, employee=employee) for employee in employees
+        ])
+        EmployeeAssignment.objects.update(assigned_date=timezone.localdate() - datetime.timedelta(days=30))
+
+    def test_batches_and_counts_only_its_own_inserts(self):
+        end = timezone.localdate()
+        start = end - datetime.timedelta(days=9)
+        absentees = find_absentees(start, end)
+        self.assertEqual(len(absentees), 700)
+        self.assertGreater(len(absentees), ABSENTEE_BATCH_SIZE * 2)
+
+        # Records written by a scan or another run after detection are not counted
+        taken = absentees[::100]
+        for assignment_id, _, _, _, _, _, _, day in taken:
+            Attendance.objects.create(employee_assignment_id=assignment_id, date=day, attended=False)
+        logged = ChangeLog.objects.filter(model='attendances').count()
+
+        with CaptureQueriesContext(connection) as context:
+            created = materialize_absentees(absentees)
+
+        self.assertEqual(created, 700 - len(taken))
+        self.assertEqual(Attendance.objects.filter(date__gte=start, attended=False).count(), 700)
+        self.assertEqual(ChangeLog.objects.filter(model='attendances').count() - logged, created)
+        inserts = [query for query in context.captured_queries if 'ON CONFLICT' in query['sql']]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(find_absentees(start, end), [])
+        self.assertEqual(materialize_absentees(absentees), 0)
+
+
+class RolloverTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        department = Department.objects.create(name='Harvest', day_salary='5000')
+        field = Field.objects.create(name='North', address='Musanze')
+        cls.groups = []
+        for n in range(2):
+            supervisor = Employee.objects.create(name=f'Supervisor {n}', tag_id=f'SUP-{n}')
+            group = AssignmentGroup.objects.create(
+                name=f'Crew {n}', field=field, department=department, supervisor=supervisor
+            )
+            worker = Employee.objects.create(name=f'Worker {n}', tag_id=f'TAG-{n}')
+            EmployeeAssignment.objects.create(assignment_group=group, employee=worker)
+            cls.groups.append(group)
+
+    def test_repeated_new_names_are_rejected_before_writing(self):
+        first, second = self.groups
+        for names in ({first.id: 'Crew 2025', second.id: 'Crew 2025'}, {first.id: 'Crew 1 - 2025'}):
+            with self.assertRaisesMessage(ValidationError, 'more than one group'):
+                rollover_assignment_groups([first.id, second.id], '2025', timezone.localdate(), names=names)
+        self.assertEqual(AssignmentGroup.objects.count(), 2)
+        self.assertEqual(EmployeeAssignment.objects.filter(status='active').count(), 2)
+
+    def test_rollover(self):
+        first, second = self.groups
+        rolled = rollover_assignment_groups([first.id, second.id], '2025', timezone.localdate())
+        self.assertEqual([group['name'] for group in rolled], ['Crew 0 - 2025', 'Crew 1 - 2025'])
+        self.assertEqual(
+            sorted(EmployeeAssignment.objects.filter(status='active').values_list('assignment_group__name', flat=True)),
+            ['Crew 0 - 2025', 'Crew 1 - 2025']
+        )
+
+
+class AssignEmployeesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        department = Department.objects.create(name='Harvest', day_salary='5000')
+        field = Field.objects.create(name='North', address='Musanze')
+        cls.group, cls.other_group = [
+            AssignmentGroup.objects.create(
+                name=f'Crew {n}', field=field, department=department,
+                supervisor=Employee.objects.create(name=f'Supervisor {n}', tag_id=f'SUP-{n}')
+            )
+            for n in range(2)
+        ]
+        cls.free, cls.busy, cls.returning, cls.finished_elsewhere = [
+            Employee.objects.create(name=f'Worker {n}', tag_id=f'TAG-{n}') for n in range(4)
+        ]
+        EmployeeAssignment.objects.create(assignment_group=cls.other_group, employee=cls.busy)
+        EmployeeAssignment.objects.create(assignment_group=cls.group, employee=cls.returning, status='completed')
+        EmployeeAssignment.objects.create(
+            assignment_group=cls.other_group, employee=cls.finished_elsewhere, status='completed'
+        )
+
+    def test_errors_name_the_violated_constraint(self):
+        assigned, failed = assign_employees(self.group, [
+            self.free.id, str(self.free.id), self.busy.id, self.returning.id,
+            self.finished_elsewhere.id, 'x', 999999
+        ])
+
+        self.assertEqual(assigned, [self.free.id, self.finished_elsewhere.id])
+        self.assertEqual(failed, [
+            {"employee_id": 'x', "error": "Invalid employee ID."},
+            {"employee_id": self.returning.id, "error": ALREADY_IN_GROUP},
+            {"employee_id": 999999, "error": "Employee not found."},
+            {"employee_id": self.busy.id, "error": ACTIVE_ELSEWHERE},
+        ])
+        self.assertEqual(
+            EmployeeAssignment.objects.filter(assignment_group=self.group, status='active').count(), 2
+        )
+
+    def test_conflict_message_from_database_errors(self):
+        EmployeeAssignment.objects.create(assignment_group=self.group, employee=self.free)
+        for group, status_value, message in (
+            (self.other_group, 'active', ACTIVE_ELSEWHERE),
+            (self.group, 'completed', ALREADY_IN_GROUP),
+        ):
+            with self.assertRaises(IntegrityError) as raised, transaction.atomic():
+                EmployeeAssignment.objects.create(assignment_group=group, employee=self.free, status=status_value)
+            self.assertEqual(_conflict_message(raised.exception), message)
+
+
+class ChangeFeedTests(TransactionTestCase):
+    def record(self, model, ids, action=UPSERT):
+        # Two writes in one transaction: numbered by a single UPDATE on commit
+        with CaptureQueriesContext(connection) as context:
+            with transaction.atomic():
+                record_changes(model, ids, action)
+                record_changes(model, ids, action)
+        numbering = [query for query in context.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(numbering), 1)
+
+    def test_rows_are_numbered_on_commit_and_reads_do_not_write(self):
+        self.record(Department, [1, 2])
+        self.assertFalse(ChangeLog.objects.filter(sequence__isnull=True).exists())
+
+        with CaptureQueriesContext(connection) as context:
+            cursor, has_more, upserts, deletes = read_changes(0, 100)
+            head_cursor()
+        self.assertFalse([query for query in context.captured_queries if query['sql'].startswith('UPDATE')])
+        self.assertEqual((cursor, has_more, upserts, deletes), (4, False, {'departments': [1, 2]}, {}))
+
+    def test_cursor_order_and_rows_left_unnumbered(self):
+        self.record(Department, [1])
+        cursor, _, _, _ = read_changes(0, 100)
+
+        # A row committed without its callback (worker died) is numbered by the next read
+        ChangeLog.objects.create(model='fields', object_id=7, action=UPSERT)
+        self.record(Department, [2], DELETE)
+        self.assertEqual(ChangeLog.objects.filter(sequence__isnull=True).count(), 0)
+
+        next_cursor, has_more, upserts, deletes = read_changes(cursor, 1)
+        self.assertEqual((has_more, upserts, deletes), (True, {'fields': [7]}, {}))
+        last_cursor, has_more, upserts, deletes = read_changes(next_cursor, 100)
+        self.assertEqual((has_more, upserts, deletes), (False, {}, {'departments': [2]}))
+        self.assertEqual(last_cursor, head_cursor())
+        self.assertEqual(
+            list(ChangeLog.objects.order_by('sequence').values_list('model', 'object_id')),
+            [('departments', 1), ('departments', 1), ('fields', 7), ('departments', 2), ('departments', 2)]
+        )
+
+    def test_compaction_keeps_the_last_action_per_object(self):
+        self.record(Department, [1, 2])
+        self.record(Department, [1], DELETE)
+        before = read_changes(0, 100)
+
+        self.assertEqual(compact_changelog(), 4)
+        self.assertEqual(
+            list(ChangeLog.objects.order_by('sequence').values_list('object_id', 'action')),
+            [(2, UPSERT), (1, DELETE)]
+        )
+        self.assertEqual(read_changes(0, 100), before)
+
+
+class EventBrokerTests(SimpleTestCase):
+    async def deliveries(self):
+        # publish hands frames to the loop with call_soon_threadsafe
+        await asyncio.sleep(0)
+
+    async def test_topic_fan_out_delivers_each_frame_once(self):
+        broker = EventBroker()
+        both = broker.subscribe(['attendance', 'attendance:group:1'])
+        group = broker.subscribe(['attendance:group:1'])
+        other = broker.subscribe(['attendance:group:2'])
+
+        broker.publish([(['attendance', 'attendance:group:1'], b'first'), (['attendance'], b'second')])
+        await self.deliveries()
+
+        self.assertEqual([both.queue.get_nowait() for _ in range(both.queue.qsize())], [b'first', b'second'])
+        self.assertEqual([group.queue.get_nowait() for _ in range(group.queue.qsize())], [b'first'])
+        self.assertTrue(other.queue.empty())
+
+    async def test_publish_from_another_thread(self):
+        broker = EventBroker()
+        subscription = broker.subscribe(['attendance'])
+        thread = threading.Thread(target=broker.publish, args=([(['attendance'], b'frame')],))
+        thread.start()
+        thread.join()
+        self.assertEqual(await asyncio.wait_for(subscription.queue.get(), 1), b'frame')
+
+    async def test_overflow_drops_the_buffer_and_ends_the_stream(self):
+        broker = EventBroker()
+        subscription = broker.subscribe(['attendance'], maxsize=2)
+        broker.publish([(['attendance'], frame) for frame in (b'1', b'2', b'3', b'4')])
+        await self.deliveries()
+
+        self.assertTrue(subscription.overflowed)
+        self.assertEqual(subscription.queue.qsize(), 1)
+        self.assertIsNone(subscription.queue.get_nowait())
+        subscription.offer(b'5')
+        self.assertTrue(subscription.queue.empty())
+
+    async def test_unsubscribe(self):
+        broker = EventBroker()
+        first = broker.subscribe(['attendance', 'attendance:group:1'])
+        second = broker.subscribe(['attendance'])
+        broker.unsubscribe(first)
+        self.assertEqual(broker.topics, {'attendance': {second}})
+        broker.unsubscribe(second)
+        self.assertFalse(broker.has_subscribers())
+        subscribers = EVENT_SUBSCRIBERS.samples[()]
+        broker.unsubscribe(second)
+        self.assertEqual(EVENT_SUBSCRIBERS.samples[()], subscribers)
+
+        broker.publish([(['attendance'], b'frame')])
+        await self.deliveries()
+        self.assertTrue(first.queue.empty() and second.queue.empty())
+
+    async def test_event_stream_yields_frames_then_unsubscribes(self):
+        stream = event_stream(['attendance:test'], retry_ms=1000)
+        self.assertEqual(await anext(stream), b'retry: 1000\n\n')
+        BROKER.publish([(['attendance:test'], format_event('attendance', b'{"id": 1}', 1))])
+        self.assertEqual(await anext(stream), b'id: 1\nevent: attendance\ndata: {"id": 1}\n\n')
+        await stream.aclose()
+        self.assertNotIn('attendance:test', BROKER.topics)
+
+
+class StreamAttendanceTests(TestCase):
+    url = '/api/attendance/stream/'
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        admin = User.objects.create_superuser('admin@example.com', 'Admin', '0788000000', 'pw')
+        user = User.objects.create_user('user@example.com', 'User', '0788000001', 'pw')
+        cls.admin_token = Token.objects.create(user=admin).key
+        cls.user_token = Token.objects.create(user=user).key
+
+    def test_wsgi_requests_are_not_served(self):
+        response = self.client.get(self.url, headers={'Authorization': f'Token {self.admin_token}'})
+        self.assertEqual(response.status_code, 501)
+
+    async def test_credentials_are_required(self):
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.get(self.url, headers={'Authorization': 'Token invalid'})
+        self.assertEqual(response.status_code, 401)
+
+    async def test_admins_only(self):
+        response = await self.async_client.get(self.url, headers={'Authorization': f'Token {self.user_token}'})
+        self.assertEqual(response.status_code, 403)
+
+    async def test_admin_stream(self):
+        response = await self.async_client.get(
+            self.url, {'group': 'x'}, headers={'Authorization': f'Token {self.admin_token}'}
+        )
+        self.assertEqual(response.status_code, 400)
+
+        response = await self.async_client.get(
+            self.url, {'group': '1'}, headers={'Authorization': f'Token {self.admin_token}'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = response.streaming_content
+        self.assertEqual(await anext(stream), b'retry: 3000\n\n')
+        [subscription] = BROKER.topics['attendance:group:1']
+        # Closing the response's wrapper does not close event_stream itself; the
+        # loop does at shutdown. Unsubscribing first makes that a no-op
+        await stream.aclose()
+        BROKER.unsubscribe(subscription)
+        self.assertNotIn('attendance:group:1', BROKER.topics)
+
+
+IDEMPOTENT_CALLS = []
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+@idempotent
+def idempotentView(request):
+    IDEMPOTENT_CALLS.append(request.data)
+    if request.data.get('fail'):
+        return Response({"error": "Failed."}, status=500)
+    return Response({"calls": len(IDEMPOTENT_CALLS)}, status=201)
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        IDEMPOTENT_CALLS.clear()
+        self.factory = APIRequestFactory()
+
+    def post(self, data, key='key-1', **extra):
+        request = self.factory.post('/', data, format='json', HTTP_IDEMPOTENCY_KEY=key, **extra)
+        return idempotentView(request)
+
+    def record(self, key='key-1', **extra):
+        request = self.factory.post('/', {}, format='json', **extra)
+        request.user = AnonymousUser()
+        return IdempotencyKey.objects.get(key=record_key('idempotentView', request, key))
+
+    def test_claim_and_replay(self):
+        first = self.post({'tag': 'a'})
+        self.assertEqual((first.status_code, first.data), (201, {"calls": 1}))
+        self.assertEqual(self.record().state, DONE)
+
+        retry = self.post({'tag': 'a'})
+        retry.render()
+        self.assertEqual((retry.status_code, retry.data), (201, {"calls": 1}))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(len(IDEMPOTENT_CALLS), 1)
+
+        # Another key, or no key at all, runs the view again
+        self.assertEqual(self.post({'tag': 'a'}, key='key-2').data, {"calls": 2})
+        self.assertEqual(idempotentView(self.factory.post('/', {'tag': 'a'}, format='json')).data, {"calls": 3})
+
+    def test_different_body_is_refused(self):
+        self.post({'tag': 'a'})
+        response = self.post({'tag': 'b'})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(len(IDEMPOTENT_CALLS), 1)
+
+    def test_pending_retry_is_refused_at_once(self):
+        self.post({'tag': 'a'})
+        IdempotencyKey.objects.update(state=PENDING, status_code=None, response=None)
+        started = time.perf_counter()
+        response = self.post({'tag': 'a'})
+        self.assertLess(time.perf_counter() - started, 1)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(len(IDEMPOTENT_CALLS), 1)
+
+    def test_expired_and_stale_records_run_again(self):
+        self.post({'tag': 'a'})
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+        self.assertEqual(self.post({'tag': 'a'}).data, {"calls": 2})
+
+        # A pending attempt older than LOCK_SECONDS is presumed dead
+        IdempotencyKey.objects.update(state=PENDING, created_at=timezone.now() - timezone.timedelta(minutes=5))
+        self.assertEqual(self.post({'tag': 'a'}).data, {"calls": 3})
+        self.assertEqual(self.record().state, DONE)
+
+    def test_failures_release_the_key(self):
+        self.assertEqual(self.post({'fail': True}).status_code, 500)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.post({'fail': True}).status_code, 500)
+        self.assertEqual(len(IDEMPOTENT_CALLS), 2)
+
+    def test_anonymous_readers_have_separate_keys(self):
+        self.post({'tag': 'a'}, HTTP_X_READER_ID='gate-1')
+        response = self.post({'tag': 'a'}, HTTP_X_READER_ID='gate-2')
+        self.assertEqual(response.data, {"calls": 2})
+        self.assertEqual(self.record(HTTP_X_READER_ID='gate-2').state, DONE)
+
+    def test_long_keys_are_refused(self):
+        self.assertEqual(self.post({'tag': 'a'}, key='k' * 256).status_code, 400)
+        self.assertEqual(len(IDEMPOTENT_CALLS), 0)
+
+
+@override_settings(
+    ATTENDANCE_SCAN_LIMITS={'MAX_TAGS': 4, 'CHUNK_SIZE': 2},
+    THROTTLES={'scans': {'RATE': 0.001, 'BURST': 10}},
+)
+class MarkAttendanceLimitTests(TestCase):
+    url = '/api/mark-attendance/'
+
+    @classmethod
+    def setUpTestData(cls):
+        department = Department.objects.create(name='Harvest', day_salary='5000')
+        field = Field.objects.create(name='North', address='Musanze')
+        supervisor = Employee.objects.create(name='Supervisor', tag_id='SUP-1')
+        group = AssignmentGroup.objects.create(
+            name='Crew', field=field, department=department, supervisor=supervisor
+        )
+        cls.tags = [f'TAG-{number}' for number in range(1, 6)]
+        for tag_id in cls.tags:
+            employee = Employee.objects.create(name=tag_id, tag_id=tag_id)
+            EmployeeAssignment.objects.create(assignment_group=group, employee=employee)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def post(self, content_type, tag_ids, **extra):
+        if content_type == 'urlencoded':
+            return self.client.post(
+                self.url, urlencode({'tag_ids': tag_ids}, doseq=True),
+                content_type='application/x-www-form-urlencoded', **extra
+            )
+        return self.client.post(self.url, {'tag_ids': tag_ids}, format=content_type, **extra)
+
+    def test_tag_cap_and_throttle_cost_for_every_content_type(self):
+        for content_type in ('json', 'multipart', 'urlencoded'):
+            with self.subTest(content_type=content_type):
+                cache.clear()
+                Attendance.objects.all().delete()
+                # Five tags go over the cap but still cost five of the ten tokens
+                response = self.post(content_type, self.tags)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('At most 4 tag IDs', response.json()['tag_ids'][0])
+
+                response = self.post(content_type, self.tags[:3])
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()['attendances']), 3)
+
+                response = self.post(content_type, self.tags[2:])
+                self.assertEqual(response.status_code, 429)
+                self.assertIn('Retry-After', response)
+
+    def test_overloaded_database_sheds_scans(self):
+        average, last_probe = DB_LATENCY.average, DB_LATENCY.last_probe
+        self.addCleanup(setattr, DB_LATENCY, 'average', average)
+        self.addCleanup(setattr, DB_LATENCY, 'last_probe', last_probe)
+        with override_settings(LOAD_SHEDDING={'ENABLED': True, 'LATENCY_MS': 100, 'RETRY_AFTER': 3}):
+            DB_LATENCY.average, DB_LATENCY.last_probe = 1.0, time.monotonic()
+            response = self.post('json', self.tags[:1])
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], '3')
+            self.assertFalse(Attendance.objects.exists())
+
+            # One probe per PROBE_SECONDS gets through, and its queries feed the average
+            DB_LATENCY.last_probe = 0.0
+            self.assertEqual(self.post('json', self.tags[:1]).status_code, 200)
+        self.assertLess(DB_LATENCY.average, 1.0)
+        self.assertEqual(DB_LATENCY_EWMA.samples[(str(os.getpid()),)], DB_LATENCY.average)
+
+    def test_chunks_commit_on_their_own(self):
+        create = AttendanceMarkSerializer.create
+        calls = []
+
+        def failing_create(serializer, validated_data):
+            calls.append(validated_data['tag_ids'])
+            if len(calls) == 2:
+                raise RuntimeError('Chunk failed.')
+            return create(serializer, validated_data)
+
+        with mock.patch.object(AttendanceMarkSerializer, 'create', failing_create):
+            response = self.post('json', self.tags[:4], HTTP_IDEMPOTENCY_KEY='scan-1')
+        self.assertEqual(calls, [self.tags[:2], self.tags[2:4]])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Chunk failed.')
+        self.assertEqual(len(response.json()['attendances']), 2)
+        # The first chunk stays marked, and the error is not replayed to a retry
+        self.assertEqual(
+            sorted(Attendance.objects.values_list('employee_assignment__employee__tag_id', flat=True)),
+            self.tags[:2]
+        )
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        response = self.post('json', self.tags[:4], HTTP_IDEMPOTENCY_KEY='scan-1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['attendances']), 2)
+        self.assertEqual(set(response.json()['errors']), set(self.tags[:2]))
+        self.assertEqual(Attendance.objects.count(), 4)
+
+
+class GaugeTests(SimpleTestCase):
+    def test_set_replaces_the_sample(self):
+        gauge = Gauge('test_gauge', 'Test.', ('pid',))
+        gauge.set(0.5, pid=1)
+        gauge.inc(pid=1)
+        gauge.set(0.25, pid=1)
+        self.assertEqual(gauge.samples, {('1',): 0.25})
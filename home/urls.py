@@ -19,10 +19,12 @@ urlpatterns = [
     path('departments/', getDepartments, name='getDepartments'),
     path('department/create/', createDepartment, name='createDepartment'),
     path('department/<int:department_id>/', getDepartmentDetail, name='getDepartmentDetail'),
+    path('department/<int:department_id>/calendar/', getDepartmentCalendar, name='getDepartmentCalendar'),
     path('department/<int:department_id>/update/', updateDepartment, name='updateDepartment'),
     path('department/<int:department_id>/delete/', deleteDepartment, name='deleteDepartment'),
 
     path('employees/', getEmployees, name='getEmployees'),
+    path('employees/search/', searchEmployees, name='searchEmployees'),
     path('employee/create/', createEmployee, name='createEmployee'),
     path('employee/<int:employee_id>/', getEmployeeDetail, name='getEmployeeDetail'),
     path('employee/<int:employee_id>/update/', updateEmployee, name='updateEmployee'),
@@ -36,7 +38,10 @@ urlpatterns = [
 
     path('assignments/', getAssignments, name='getAssignments'),
     path('assignment/create/', createAssignment, name='createAssignment'),
+    path('assignments/end/', endAssignments, name='endAssignments'),
+    path('assignments/rollover/', rolloverAssignments, name='rolloverAssignments'),
     path('assignment/<int:assignment_id>/', getAssignmentDetail, name='getAssignmentDetail'),
+    path('assignment/<int:assignment_id>/calendar/', getAssignmentCalendar, name='getAssignmentCalendar'),
     path('assignment/<int:assignment_id>/update/', updateAssignment, name='updateAssignment'),
     path('assignment/<int:assignment_id>/delete/', deleteAssignment, name='deleteAssignment'),
     path('assignment/<int:assignment_id>/end/', endAssignment, name='endAssignment'),
@@ -47,5 +52,13 @@ urlpatterns = [
     path('attendance/<int:attendance_id>/', getAttendanceDetail, name='getAttendanceDetail'),
     path('attendance/<int:attendance_id>/update/', updateAttendance, name='updateAttendance'),
     path('attendance/<int:attendance_id>/delete/', deleteAttendance, name='deleteAttendance'),
+    path('attendance/absentees/', getAbsentees, name='getAbsentees'),
+    path('attendance/absentees/materialize/', materializeAbsentees, name='materializeAbsentees'),
     path('mark-attendance/', markAttendance, name='markAttendance'),
+    path('mark-attendance/crew/', markCrewAttendance, name='markCrewAttendance'),
+    path('attendance/stream/', streamAttendance, name='streamAttendance'),
+
+    path('stats/attendance/', getAttendanceStats, name='getAttendanceStats'),
+
+    path('changes/', getChanges, name='getChanges'),
 ]  + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)+ static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
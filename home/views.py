@@ -1,4 +1,29 @@
 from home.serializers import *
+from home.search import search_employees
+from home.assignments import assign_employees, end_assignment_groups, rollover_assignment_groups
+from home.archive import wants_history
+from home.attendance import (
+    attendance_calendar, run_length, find_absentees, summarize_absentees, materialize_absentees,
+    attendance_stats, STATS_GROUPINGS
+)
+from home.fast_serializers import fast_serialize, to_columnar
+from home.changes import read_changes, head_cursor
+from home.idempotency import idempotent, not_stored
+from api.routers import read_from_replica
+from api.renderers import FastJSONRenderer
+from api.throttling import ScanThrottle, scan_tag_ids, shed_load, throttle
+from api.events import BROKER, event_stream, format_event
+from api.metrics import (
+    count_queries, ATTENDANCE_SCANS, ATTENDANCE_SCAN_ERRORS, ATTENDANCE_QUERIES_PER_SCAN
+)
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from asgiref.sync import sync_to_async
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
 from django.db import transaction
 from django.db.models import Count, Q
 from rest_framework.views import APIView
@@ -9,6 +34,103 @@ from rest_framework import generics, permissions, status
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.decorators import api_view, permission_classes
 
+# Columns of AttendanceSerializer that ?shape=columnar stores once per employee/department
+ATTENDANCE_DIMENSIONS = {
+    'employees': ('employee_id', ('employee_name', 'employee_tag_id')),
+    'departments': ('department_id', ('department_name',)),
+}
+
+# How /api/changes/ serializes each feed's upserts: queryset, serializer and
+# whether the fast list path applies (AssignmentGroupDetailSerializer nests crews)
+CHANGE_FEED_SERIALIZERS = {
+    'departments': (Department.objects.all(), DepartmentSerializer, True),
+    'employees': (Employee.objects.all(), EmployeeSerializer, True),
+    'fields': (Field.objects.all(), FieldSerializer, True),
+    'assignments': (
+        AssignmentGroup.objects.select_related('field', 'department', 'supervisor')
+        .prefetch_related('employee_assignments__employee'),
+        AssignmentGroupDetailSerializer, False
+    ),
+    'employee_assignments': (EmployeeAssignment.objects.all(), EmployeeAssignmentSerializer, True),
+    'attendances': (Attendance.objects.all(), AttendanceSerializer, True),
+}
+
+# Largest page /api/changes/ returns
+CHANGES_MAX_LIMIT = 5000
+
+def attendance_shape(request, data):
+    """
+    Returns serialized attendance as is, or dictionary-encoded (see to_columnar)
+    when the request asks for ?shape=columnar.
+    """
+    if request.query_params.get('shape') == 'columnar':
+        return to_columnar(data, list(AttendanceSerializer().fields), ATTENDANCE_DIMENSIONS)
+    return data
+
+def publish_attendance(records, data):
+    """
+    Pushes marked attendance (model instances and their AttendanceSerializer
+    data) to open /api/attendance/stream/ clients, once the surrounding
+    transaction commits. Each event goes out on the all-attendance topic and
+    on its assignment group's and department's topics.
+    """
+    if not records or not BROKER.has_subscribers():
+        return
+    renderer = FastJSONRenderer()
+    events = []
+    for record, item in zip(records, data):
+        group = record.employee_assignment.assignment_group
+        payload = renderer.render({**item, "assignment_group": group.id})
+        topics = ('attendance', f'attendance:group:{group.id}', f'attendance:department:{group.department_id}')
+        events.append((topics, format_event('attendance', payload, record.id)))
+    transaction.on_commit(lambda: BROKER.publish(events))
+
+def attendance_history_data(request, **filters):
+    """
+    Serializes attendance matching `filters`, newest first. Only the hot table is
+    read unless the request asks for ?history=true, in which case archived rows
+    (always older) are appended. ?shape=columnar returns the columnar form.
+    """
+    attendance_history = Attendance.objects.filter(**filters).order_by('-date')
+    data = fast_serialize(attendance_history, AttendanceSerializer)
+    if wants_history(request):
+        archived_history = AttendanceArchive.objects.filter(**filters).order_by('-date')
+        data += fast_serialize(archived_history, AttendanceArchiveSerializer)
+    return attendance_shape(request, data)
+
+def attendance_calendar_data(request, **filters):
+    """
+    Builds the calendar payload for ?month=YYYY-MM (default: current month) and
+    ?encoding=bitset|rle (default: bitset). Each row is [employee_id, name, tag_id]
+    followed by the present and absent bitsets (bit d-1 is day d) or by one
+    run-length string. Raises ValueError on invalid parameters.
+    """
+    month = request.query_params.get('month') or timezone.now().strftime("%Y-%m")
+    encoding = request.query_params.get('encoding', 'bitset')
+    if encoding not in ('bitset', 'rle'):
+        raise ValueError("Invalid encoding. Use 'bitset' or 'rle'.")
+    try:
+        days, grid = attendance_calendar(month, **filters)
+    except ValueError:
+        raise ValueError("Invalid month format. Use YYYY-MM")
+
+    if encoding == 'bitset':
+        columns = ['employee_id', 'name', 'tag_id', 'present', 'absent']
+        rows = [list(row) for row in grid]
+    else:
+        columns = ['employee_id', 'name', 'tag_id', 'days']
+        rows = [
+            [employee_id, name, tag_id, run_length(present, absent, days)]
+            for employee_id, name, tag_id, present, absent in grid
+        ]
+    return {
+        "month": month,
+        "days": days,
+        "encoding": encoding,
+        "columns": columns,
+        "rows": rows
+    }
+
 class PermissionListView(generics.ListAPIView):
     """
     View to list all permissions. Accessible only to users with appropriate permissions or superusers.
@@ -267,8 +389,7 @@ def getDepartments(request):
                 {"error": "You do not have permission to view this resource."},
                 status=status.HTTP_403_FORBIDDEN
             )
-        serializer = DepartmentSerializer(departments, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(fast_serialize(departments, DepartmentSerializer), status=status.HTTP_200_OK)
     except Exception as e:
         return Response(
             {"error": str(e)},
@@ -309,6 +430,7 @@ def createDepartment(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@read_from_replica
 def getDepartmentDetail(request, department_id):
     """
     Function-based view to retrieve details of a specific department by ID,
@@ -327,15 +449,15 @@ def getDepartmentDetail(request, department_id):
         department_serializer = DepartmentSerializer(department)
 
         # Retrieve the attendance history for the department by filtering through assignment groups
-        attendance_history = Attendance.objects.filter(
+        attendance_history = attendance_history_data(
+            request,
             employee_assignment__assignment_group__department=department
-        ).order_by('-date')
-        attendance_serializer = AttendanceSerializer(attendance_history, many=True)
+        )
 
         # Combine the department details and attendance history in the response
         return Response({
             "department": department_serializer.data,
-            "attendance_history": attendance_serializer.data
+            "attendance_history": attendance_history
         }, status=status.HTTP_200_OK)
 
     except Exception as e:
@@ -344,6 +466,40 @@ def getDepartmentDetail(request, department_id):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@read_from_replica
+def getDepartmentCalendar(request, department_id):
+    """
+    Function-based view to retrieve a department's monthly attendance calendar:
+    an employee x day matrix for ?month=YYYY-MM, bitset or run-length encoded.
+    """
+    try:
+        department = Department.objects.filter(id=department_id).first()
+        if not department:
+            return Response(
+                {"error": "Department not found"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        try:
+            calendar_data = attendance_calendar_data(
+                request,
+                employee_assignment__assignment_group__department=department
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "department": department.id,
+            **calendar_data
+        }, status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response(
+            {"error": str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated])
 def updateDepartment(request, department_id):
@@ -422,8 +578,50 @@ def getEmployees(request):
                 {"error": "You do not have permission to view this resource."},
                 status=status.HTTP_403_FORBIDDEN
             )
+        return Response(fast_serialize(employees, EmployeeSerializer), status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response(
+            {"error": str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def searchEmployees(request):
+    """
+    Function-based view to search employees by partial name, phone number or NID.
+    Results are ranked by the database search index (trigram on PostgreSQL, FTS5 on SQLite).
+    Query parameters:
+        q: search text (required)
+        limit: maximum number of results, defaults to 20 and is capped at 100
+    """
+    try:
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response(
+                {"error": "The 'q' query parameter is required."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), 100)
+        except ValueError:
+            return Response(
+                {"error": "Invalid limit. Use a positive integer."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if limit < 1:
+            return Response(
+                {"error": "Invalid limit. Use a positive integer."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        employees = search_employees(query, limit)
         serializer = EmployeeSerializer(employees, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response({
+            "count": len(employees),
+            "results": serializer.data
+        }, status=status.HTTP_200_OK)
     except Exception as e:
         return Response(
             {"error": str(e)},
@@ -432,6 +630,7 @@ def getEmployees(request):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def createEmployee(request):
     """
     Function-based view to create a new employee.
@@ -464,6 +663,7 @@ def createEmployee(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@read_from_replica
 def getEmployeeDetail(request, employee_id):
     """
     Function-based view to retrieve details of a specific employee by ID,
@@ -482,15 +682,15 @@ def getEmployeeDetail(request, employee_id):
         employee_serializer = EmployeeSerializer(employee)
 
         # Retrieve the attendance history for the employee by filtering through their assignments
-        attendance_history = Attendance.objects.filter(
+        attendance_history = attendance_history_data(
+            request,
             employee_assignment__employee=employee
-        ).order_by('-date')
-        attendance_serializer = AttendanceSerializer(attendance_history, many=True)
+        )
 
         # Combine the employee details and attendance history in the response
         return Response({
             "employee": employee_serializer.data,
-            "attendance_history": attendance_serializer.data
+            "attendance_history": attendance_history
         }, status=status.HTTP_200_OK)
 
     except Exception as e:
@@ -577,8 +777,7 @@ def getFields(request):
                 {"error": "You do not have permission to view this resource."},
                 status=status.HTTP_403_FORBIDDEN
             )
-        serializer = FieldSerializer(fields, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(fast_serialize(fields, FieldSerializer), status=status.HTTP_200_OK)
     except Exception as e:
         return Response(
             {"error": str(e)},
@@ -619,6 +818,7 @@ def createField(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@read_from_replica
 def getFieldDetail(request, field_id):
     """
     Function-based view to retrieve details of a specific field by ID,
@@ -637,15 +837,15 @@ def getFieldDetail(request, field_id):
         field_serializer = FieldSerializer(field)
 
         # Retrieve the attendance history for the field by filtering through assignment groups
-        attendance_history = Attendance.objects.filter(
+        attendance_history = attendance_history_data(
+            request,
             employee_assignment__assignment_group__field=field
-        ).order_by('-date')
-        attendance_serializer = AttendanceSerializer(attendance_history, many=True)
+        )
 
         # Combine the field details and attendance history in the response
         return Response({
             "field": field_serializer.data,
-            "attendance_history": attendance_serializer.data
+            "attendance_history": attendance_history
         }, status=status.HTTP_200_OK)
 
     except Exception as e:
@@ -719,6 +919,7 @@ def deleteField(request, field_id):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@read_from_replica
 def getAssignments(request):
     """
     Function-based view to list all assignment groups with detailed information.
@@ -749,14 +950,10 @@ def getAssignments(request):
             is_active = is_active.lower() == 'true'
             assignments = assignments.filter(is_active=is_active)
 
-        # Annotate with employee counts
-        assignments = assignments.annotate(
-            total_employees=Count('employee_assignments'),
-            active_employees=Count(
-                'employee_assignments',
-                filter=Q(employee_assignments__status='active')
-            )
-        ).order_by('-id')
+        # Employee counts are maintained on the group itself
+        assignments = assignments.select_related(
+            'field', 'department', 'supervisor'
+        ).prefetch_related('employee_assignments__employee').order_by('-id')
 
         serializer = AssignmentGroupDetailSerializer(assignments, many=True)
         return Response({
@@ -771,6 +968,7 @@ def getAssignments(request):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def createAssignment(request):
     """
     Function-based view to create a new assignment group.
@@ -794,23 +992,11 @@ def createAssignment(request):
 
         assignment_group = group_serializer.save()
 
-        # If employees were provided, assign them to the group
+        # If employees were provided, assign them to the group; employees already
+        # active in another group are reported per employee
         employees = request.data.get('employees', [])
-        successful_assignments = []
-        failed_assignments = []
-
-        for employee_id in employees:
-            try:
-                EmployeeAssignment.objects.create(
-                    assignment_group=assignment_group,
-                    employee_id=employee_id
-                )
-                successful_assignments.append(employee_id)
-            except Exception as e:
-                failed_assignments.append({
-                    "employee_id": employee_id,
-                    "error": str(e)
-                })
+        successful_assignments, failed_assignments = assign_employees(assignment_group, employees)
+        assignment_group.refresh_from_db(fields=AssignmentGroup.COUNTER_FIELDS)
 
         updated_serializer = AssignmentGroupDetailSerializer(assignment_group)
         response_data = {
@@ -837,6 +1023,7 @@ def createAssignment(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@read_from_replica
 def getAssignmentDetail(request, assignment_id):
     """
     Function-based view to retrieve detailed information about a specific assignment group,
@@ -864,11 +1051,10 @@ def getAssignmentDetail(request, assignment_id):
         assignment_data = assignment_serializer.data
 
         # Retrieve the attendance history for this assignment group
-        attendance_records = Attendance.objects.filter(
+        assignment_data['attendance_history'] = attendance_history_data(
+            request,
             employee_assignment__assignment_group=assignment
-        ).order_by('-date')
-        attendance_serializer = AttendanceSerializer(attendance_records, many=True)
-        assignment_data['attendance_history'] = attendance_serializer.data
+        )
 
         return Response(assignment_data, status=status.HTTP_200_OK)
     except Exception as e:
@@ -877,6 +1063,47 @@ def getAssignmentDetail(request, assignment_id):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@read_from_replica
+def getAssignmentCalendar(request, assignment_id):
+    """
+    Function-based view to retrieve an assignment group's monthly attendance
+    calendar: an employee x day matrix for ?month=YYYY-MM, bitset or run-length encoded.
+    Only superusers or users with the 'Admin' role can view assignment details.
+    """
+    try:
+        if not (request.user.is_superuser or request.user.role == 'Admin'):
+            return Response(
+                {"error": "You do not have permission to view this assignment."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        assignment = AssignmentGroup.objects.filter(id=assignment_id).first()
+        if assignment is None:
+            return Response(
+                {"error": "Assignment not found"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        try:
+            calendar_data = attendance_calendar_data(
+                request,
+                employee_assignment__assignment_group=assignment
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "assignment_group": assignment.id,
+            **calendar_data
+        }, status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response(
+            {"error": str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated])
 def updateAssignment(request, assignment_id):
@@ -928,23 +1155,19 @@ def updateAssignment(request, assignment_id):
                         employee_id__in=employees_to_remove
                     ).delete()
 
-                # Add new employees
+                # Add new employees; employees already active in another group are reported
                 employees_to_add = new_employee_ids - current_employee_ids
-                for employee_id in employees_to_add:
-                    try:
-                        EmployeeAssignment.objects.create(
-                            assignment_group=assignment,
-                            employee_id=employee_id
-                        )
-                    except Exception as e:
-                        # Log error or handle as needed; here we simply print it
-                        print(f"Error adding employee {employee_id}: {str(e)}")
+                _, failed_assignments = assign_employees(assignment, list(employees_to_add))
+                assignment.refresh_from_db(fields=AssignmentGroup.COUNTER_FIELDS)
 
             updated_serializer = AssignmentGroupDetailSerializer(assignment)
-            return Response({
+            response_data = {
                 "message": "Assignment updated successfully",
                 "assignment": updated_serializer.data
-            }, status=status.HTTP_200_OK)
+            }
+            if 'employees' in request.data:
+                response_data["failed_assignments"] = failed_assignments
+            return Response(response_data, status=status.HTTP_200_OK)
     except Exception as e:
         return Response(
             {"error": str(e)},
@@ -1035,57 +1258,196 @@ def endAssignment(request, assignment_id):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        with transaction.atomic():
-            assignment.end_date = end_date
-            assignment.is_active = False
+        try:
+            _, employees_updated = end_assignment_groups(
+                [assignment.id], end_date, request.data.get('reason') if 'reason' in request.data else None
+            )
+        except ValidationError as e:
+            return Response(
+                {"error": " ".join(e.messages)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        assignment = AssignmentGroup.objects.select_related(
+            'field', 'department', 'supervisor'
+        ).prefetch_related('employee_assignments__employee').get(id=assignment.id)
+        updated_serializer = AssignmentGroupDetailSerializer(assignment)
+        response_data = {
+            "message": "Assignment ended successfully",
+            "end_date": end_date.strftime("%Y-%m-%d"),
+            "employees_updated": employees_updated,
+            "assignment": updated_serializer.data
+        }
+        if 'reason' in request.data:
+            response_data["reason"] = request.data['reason']
+
+        return Response(response_data, status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response(
+            {"error": str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
 
-            # Append reason to notes if provided
-            if 'reason' in request.data:
-                current_notes = assignment.notes or ""
-                timestamp = timezone.now().strftime("%Y-%m-%d %H:%M:%S")
-                new_note = f"\n[{timestamp}] Assignment ended - Reason: {request.data['reason']}"
-                assignment.notes = current_notes + new_note
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def endAssignments(request):
+    """
+    Function-based view to end many assignment groups at once, e.g. at the close of a season.
+    Only superusers or users with the 'Admin' role can end assignments.
+    Expected payload:
+    {
+        "assignment_ids": [1, 2, 3],
+        "end_date": "YYYY-MM-DD",  # Optional, defaults to current date
+        "reason": "String"         # Optional, reason for ending the assignments
+    }
+    Groups that do not exist or are already ended are reported as skipped.
+    """
+    try:
+        if not (request.user.is_superuser or request.user.role == 'Admin'):
+            return Response(
+                {"error": "You do not have permission to end assignments."},
+                status=status.HTTP_403_FORBIDDEN
+            )
 
+        assignment_ids = request.data.get('assignment_ids')
+        if not isinstance(assignment_ids, list) or not assignment_ids:
+            return Response(
+                {"error": "assignment_ids must be a non-empty list."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            assignment_ids = [int(assignment_id) for assignment_id in assignment_ids]
+        except (TypeError, ValueError):
+            return Response(
+                {"error": "assignment_ids must contain assignment IDs."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        end_date_str = request.data.get('end_date')
+        if end_date_str:
             try:
-                assignment.clean()
-                assignment.save()
-            except ValidationError as e:
+                end_date = timezone.datetime.strptime(end_date_str, "%Y-%m-%d").date()
+            except ValueError:
                 return Response(
-                    {"error": str(e)},
+                    {"error": "Invalid date format. Use YYYY-MM-DD"},
                     status=status.HTTP_400_BAD_REQUEST
                 )
+        else:
+            end_date = timezone.now().date()
 
-            active_assignments = EmployeeAssignment.objects.filter(
-                assignment_group=assignment,
-                status='active'
-            )
-            for emp_assignment in active_assignments:
-                emp_assignment.end_date = end_date
-                emp_assignment.status = 'completed'
-                try:
-                    emp_assignment.clean()
-                except ValidationError as e:
-                    return Response(
-                        {"error": f"Error updating employee {emp_assignment.employee.name}: {str(e)}"},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-            if active_assignments:
-                EmployeeAssignment.objects.bulk_update(
-                    active_assignments,
-                    ['end_date', 'status']
+        try:
+            ended_ids, employees_updated = end_assignment_groups(
+                assignment_ids, end_date, request.data.get('reason') if 'reason' in request.data else None
+            )
+        except ValidationError as e:
+            return Response(
+                {"error": " ".join(e.messages)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        response_data = {
+            "message": "Assignments ended successfully",
+            "end_date": end_date.strftime("%Y-%m-%d"),
+            "assignments_ended": ended_ids,
+            "employees_updated": employees_updated,
+            "skipped": sorted(set(assignment_ids) - set(ended_ids))
+        }
+        if 'reason' in request.data:
+            response_data["reason"] = request.data['reason']
+
+        return Response(response_data, status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response(
+            {"error": str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def rolloverAssignments(request):
+    """
+    Function-based view for the season rollover: clones assignment groups with their
+    active crews into new groups and ends the old ones, in a single transaction.
+    Only superusers or users with the 'Admin' role can roll assignments over.
+    Expected payload:
+    {
+        "assignment_ids": [1, 2, 3],
+        "season": "String",           # New groups are named "<old name> - <season>"
+        "names": {"1": "String"},     # Optional, explicit names per old group ID
+        "exclude_employees": [4, 5],  # Optional, employees not carried over
+        "end_date": "YYYY-MM-DD",     # Optional, end date of the old groups, defaults to current date
+        "reason": "String"            # Optional, appended to the old groups' notes
+    }
+    """
+    try:
+        if not (request.user.is_superuser or request.user.role == 'Admin'):
+            return Response(
+                {"error": "You do not have permission to roll assignments over."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        assignment_ids = request.data.get('assignment_ids')
+        exclude_employees = request.data.get('exclude_employees', [])
+        names = request.data.get('names', {})
+        if not isinstance(assignment_ids, list) or not assignment_ids:
+            return Response(
+                {"error": "assignment_ids must be a non-empty list."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not isinstance(exclude_employees, list) or not isinstance(names, dict):
+            return Response(
+                {"error": "exclude_employees must be a list and names an object."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            assignment_ids = [int(assignment_id) for assignment_id in assignment_ids]
+            exclude_employees = [int(employee_id) for employee_id in exclude_employees]
+            names = {int(assignment_id): str(name) for assignment_id, name in names.items()}
+        except (TypeError, ValueError):
+            return Response(
+                {"error": "assignment_ids, exclude_employees and names must use numeric IDs."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        season = str(request.data.get('season', '')).strip()
+        if not season and not set(assignment_ids) <= set(names):
+            return Response(
+                {"error": "season is required unless every group has an explicit name."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        end_date_str = request.data.get('end_date')
+        if end_date_str:
+            try:
+                end_date = timezone.datetime.strptime(end_date_str, "%Y-%m-%d").date()
+            except ValueError:
+                return Response(
+                    {"error": "Invalid date format. Use YYYY-MM-DD"},
+                    status=status.HTTP_400_BAD_REQUEST
                 )
+        else:
+            end_date = timezone.now().date()
 
-            updated_serializer = AssignmentGroupDetailSerializer(assignment)
-            response_data = {
-                "message": "Assignment ended successfully",
-                "end_date": end_date.strftime("%Y-%m-%d"),
-                "employees_updated": active_assignments.count(),
-                "assignment": updated_serializer.data
-            }
-            if 'reason' in request.data:
-                response_data["reason"] = request.data['reason']
+        try:
+            rolled_over = rollover_assignment_groups(
+                assignment_ids, season, end_date,
+                names=names,
+                exclude_employee_ids=exclude_employees,
+                reason=request.data.get('reason', f"Season rollover {season}".strip())
+            )
+        except ValidationError as e:
+            return Response(
+                {"error": " ".join(e.messages)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-            return Response(response_data, status=status.HTTP_200_OK)
+        return Response({
+            "message": "Assignments rolled over successfully",
+            "end_date": end_date.strftime("%Y-%m-%d"),
+            "assignments": rolled_over,
+            "employees_assigned": sum(group["employees"] for group in rolled_over),
+            "skipped": sorted(set(assignment_ids) - {group["old_assignment"] for group in rolled_over})
+        }, status=status.HTTP_200_OK)
     except Exception as e:
         return Response(
             {"error": str(e)},
@@ -1122,7 +1484,7 @@ def getAssignmentEndInfo(request, assignment_id):
         response_data = {
             "can_end": assignment.is_active,
             "is_active": assignment.is_active,
-            "active_employees": active_assignments.count(),
+            "active_employees": assignment.active_employees,
             "active_employee_list": [
                 {
                     "id": assign.employee.id,
@@ -1148,15 +1510,21 @@ def getAssignmentEndInfo(request, assignment_id):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@read_from_replica
 def getAttendances(request):
     """
     Function-based view to list all attendances.
     Returns detailed information including related employee and department data.
+    Archived attendance is included only with ?history=true; ?shape=columnar
+    factors the repeated employee and department fields into lookup tables.
     """
     try:
         attendances = Attendance.objects.all().order_by('-id')
-        serializer = AttendanceSerializer(attendances, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        data = fast_serialize(attendances, AttendanceSerializer)
+        if wants_history(request):
+            archived = AttendanceArchive.objects.all().order_by('-id')
+            data += fast_serialize(archived, AttendanceArchiveSerializer)
+        return Response(attendance_shape(request, data), status=status.HTTP_200_OK)
     except Exception as e:
         return Response({"error": str(e)},
                         status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -1185,13 +1553,19 @@ def createAttendance(request):
 def getAttendanceDetail(request, attendance_id):
     """
     Function-based view to retrieve detailed information of a specific attendance record.
+    Falls back to the archive for records of closed payroll periods.
     """
     try:
         attendance = Attendance.objects.filter(id=attendance_id).first()
-        if not attendance:
+        if attendance:
+            serializer = AttendanceSerializer(attendance)
+            return Response(serializer.data, status=status.HTTP_200_OK)
+
+        archived = AttendanceArchive.objects.filter(id=attendance_id).first()
+        if not archived:
             return Response({"error": "Attendance not found"},
                             status=status.HTTP_404_NOT_FOUND)
-        serializer = AttendanceSerializer(attendance)
+        serializer = AttendanceArchiveSerializer(archived)
         return Response(serializer.data, status=status.HTTP_200_OK)
     except Exception as e:
         return Response({"error": str(e)},
@@ -1240,27 +1614,437 @@ def deleteAttendance(request, attendance_id):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@idempotent
+@shed_load
+@throttle(ScanThrottle)
 def markAttendance(request):
     """
     Function-based view to mark attendance for a list of tag IDs.
     Processes each tag ID individually so that an error with one does not affect others.
     Detailed error messages are provided for each failed tag, and successful records are returned.
     Enforces that attendance for a specific employee in a given assignment can only be marked after 8 hours.
-    """
-    serializer = AttendanceMarkSerializer(data=request.data)
-    if serializer.is_valid():
+    At most ATTENDANCE_SCAN_LIMITS['MAX_TAGS'] tags are accepted per request; they are
+    validated up front and then processed in chunks of CHUNK_SIZE. Every tag commits on
+    its own, so a large batch holds no lock or transaction open until its last tag.
+    Readers are throttled per client IP (429), and requests are shed with 503 while the
+    database is slow.
+    """
+    limits = getattr(settings, 'ATTENDANCE_SCAN_LIMITS', {})
+    tag_ids = scan_tag_ids(request.data)
+    if tag_ids is not None and len(tag_ids) > limits.get('MAX_TAGS', 500):
+        ATTENDANCE_SCANS.inc(outcome='invalid_batch')
+        return Response(
+            {"tag_ids": [f"At most {limits.get('MAX_TAGS', 500)} tag IDs can be marked per request."]},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    if tag_ids:
+        chunk_size = limits.get('CHUNK_SIZE', 50)
+        extra = {'date': request.data['date']} if 'date' in request.data else {}
+        serializers = [
+            AttendanceMarkSerializer(data={**extra, 'tag_ids': tag_ids[start:start + chunk_size]})
+            for start in range(0, len(tag_ids), chunk_size)
+        ]
+    else:
+        # Malformed bodies get the serializer's own errors
+        serializers = [AttendanceMarkSerializer(data=request.data)]
+    with count_queries() as queries:
+        invalid = next((serializer for serializer in serializers if not serializer.is_valid()), None)
+    if invalid is None:
+        attendance_records, errors, error_reasons = [], {}, {}
         try:
-            result = serializer.save()
-            attendance_records = result.get("attendance_records", [])
-            errors = result.get("errors", {})
+            with count_queries(queries):
+                for serializer in serializers:
+                    result = serializer.save()
+                    attendance_records += result.get("attendance_records", [])
+                    errors.update(result.get("errors", {}))
+                    error_reasons.update(result.get("error_reasons", {}))
+        except Exception as e:
+            # Scans of the chunks before the failing one are committed: report them,
+            # and have a retry with the same Idempotency-Key run again, not replay this
             detailed_data = AttendanceSerializer(attendance_records, many=True).data
+            publish_attendance(attendance_records, detailed_data)
+            return not_stored(Response({
+                "error": str(e),
+                "attendances": detailed_data,
+                "errors": errors
+            }, status=status.HTTP_400_BAD_REQUEST))
+
+        try:
+            ATTENDANCE_SCANS.inc(len(attendance_records), outcome='marked')
+            ATTENDANCE_SCANS.inc(len(errors), outcome='rejected')
+            for reason in error_reasons.values():
+                ATTENDANCE_SCAN_ERRORS.inc(reason=reason)
+            ATTENDANCE_QUERIES_PER_SCAN.observe(queries.count / len(tag_ids))
+
+            detailed_data = AttendanceSerializer(attendance_records, many=True).data
+            publish_attendance(attendance_records, detailed_data)
             response_data = {
                 "message": "Attendance processed successfully.",
                 "attendances": detailed_data,
                 "errors": errors
             }
             return Response(response_data, status=status.HTTP_200_OK)
+        except Exception as e:
+            return not_stored(Response({"error": str(e)},
+                                       status=status.HTTP_400_BAD_REQUEST))
+    ATTENDANCE_SCANS.inc(outcome='invalid_batch')
+    return Response(invalid.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+def supervised_groups(user):
+    """
+    Returns the active groups supervised by `user`. Users and employees are
+    separate records, so a user is taken to be the supervising employee when
+    they share an email address or a phone number.
+    """
+    match = Q()
+    if user.email:
+        match |= Q(supervisor__email__iexact=user.email)
+    if user.phone_number:
+        match |= Q(supervisor__phone_number=user.phone_number)
+    if not match:
+        return AssignmentGroup.objects.none()
+    return AssignmentGroup.objects.filter(match, is_active=True)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def markCrewAttendance(request):
+    """
+    Function-based view to mark a whole crew's attendance for a day in one call.
+    The group is selected by supervisor_tag_id or assignment_group; either a
+    present or an absent list of employee IDs is given and the rest of the active
+    crew gets the opposite. The day is written in a single transaction, including
+    explicit attended=False rows, and the 8-hour rule is checked for all members
+    at once. Members rejected by the 8-hour rule are reported in errors.
+    Admins can mark any crew, supervisors their own group. The supervisor is not
+    marked here; their own tag is scanned through markAttendance.
+    """
+    is_admin = request.user.is_superuser or request.user.role == 'Admin'
+    forbidden = Response(
+        {"error": "You do not have permission to mark crew attendance."},
+        status=status.HTTP_403_FORBIDDEN
+    )
+    if not is_admin and not supervised_groups(request.user).exists():
+        return forbidden
+    serializer = CrewAttendanceSerializer(data=request.data)
+    if serializer.is_valid():
+        group = serializer.validated_data["group"]
+        if not is_admin and not supervised_groups(request.user).filter(pk=group.pk).exists():
+            return forbidden
+        try:
+            result = serializer.save()
+            attendances = AttendanceSerializer(result["attendance_records"], many=True).data
+            changed = [
+                (record, item) for record, item in zip(result["attendance_records"], attendances)
+                if record.id in result["changed_ids"]
+            ]
+            publish_attendance([record for record, _ in changed], [item for _, item in changed])
+            return Response({
+                "message": "Crew attendance processed successfully.",
+                "assignment_group": result["group"].id,
+                "date": serializer.validated_data["date"],
+                "marked": result["marked"],
+                "attendances": attendances,
+                "errors": result["errors"]
+            }, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({"error": str(e)},
                             status=status.HTTP_400_BAD_REQUEST)
-    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+def absentee_range(params):
+    """
+    Reads start/end (YYYY-MM-DD; end defaults to start, start to yesterday) and
+    repeated group ids from query or body parameters. Raises ValueError.
+    """
+    try:
+        start_str = params.get('start')
+        start = (
+            timezone.datetime.strptime(start_str, "%Y-%m-%d").date() if start_str
+            else timezone.now().date() - timezone.timedelta(days=1)
+        )
+        end_str = params.get('end')
+        end = timezone.datetime.strptime(end_str, "%Y-%m-%d").date() if end_str else start
+    except (TypeError, ValueError):
+        raise ValueError("Invalid date format. Use YYYY-MM-DD")
+    if hasattr(params, 'getlist'):
+        groups = params.getlist('group')
+    else:
+        groups = params.get('group') or []
+        groups = groups if isinstance(groups, list) else [groups]
+    try:
+        group_ids = [int(group) for group in groups]
+    except (TypeError, ValueError):
+        raise ValueError("Invalid group. Use assignment group IDs.")
+    return start, end, group_ids
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@read_from_replica
+def getAbsentees(request):
+    """
+    Function-based view to list active assignments with no attendance record on
+    each day from ?start= to ?end= (YYYY-MM-DD, yesterday by default), optionally
+    limited to ?group=<id> (repeatable), with per-group summaries.
+    Only superusers or users with the 'Admin' role can view absentees.
+    """
+    try:
+        if not (request.user.is_superuser or request.user.role == 'Admin'):
+            return Response(
+                {"error": "You do not have permission to view this resource."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        try:
+            start, end, group_ids = absentee_range(request.query_params)
+            absentees = find_absentees(start, end, group_ids)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "start": start,
+            "end": end,
+            "total": len(absentees),
+            "groups": summarize_absentees(absentees),
+            "absentees": [
+                {
+                    "employee_id": employee_id,
+                    "employee_name": name,
+                    "employee_tag_id": tag_id,
+                    "assignment_group": group_id,
+                    "date": day
+                }
+                for _, employee_id, name, tag_id, group_id, _, _, day in absentees
+            ]
+        }, status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response(
+            {"error": str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def materializeAbsentees(request):
+    """
+    Function-based view to record absences: writes an attended=False record for
+    every active assignment without attendance on each day from start to end
+    (same parameters as getAbsentees, in the body). Returns per-group summaries.
+    Only superusers or users with the 'Admin' role can record absences.
+    """
+    try:
+        if not (request.user.is_superuser or request.user.role == 'Admin'):
+            return Response(
+                {"error": "You do not have permission to perform this action."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        try:
+            start, end, group_ids = absentee_range(request.data)
+            absentees = find_absentees(start, end, group_ids)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        created = materialize_absentees(absentees)
+        return Response({
+            "message": "Absences recorded successfully.",
+            "start": start,
+            "end": end,
+            "created": created,
+            "groups": summarize_absentees(absentees)
+        }, status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response(
+            {"error": str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@read_from_replica
+def getAttendanceStats(request):
+    """
+    Function-based view to report attendance counts, rate and salary earned per
+    ?group_by= (department, field, assignment_group, supervisor, day, week or
+    month) from ?start= to ?end= (YYYY-MM-DD; the last 30 days by default).
+    Results are computed in the database and cached per parameter set for
+    ATTENDANCE_STATS_CACHE_SECONDS.
+    Only superusers or users with the 'Admin' role can view statistics.
+    """
+    try:
+        if not (request.user.is_superuser or request.user.role == 'Admin'):
+            return Response(
+                {"error": "You do not have permission to view this resource."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        group_by = request.query_params.get('group_by', 'department')
+        if group_by not in STATS_GROUPINGS:
+            return Response(
+                {"error": f"Invalid group_by. Use one of: {', '.join(STATS_GROUPINGS)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            end_str = request.query_params.get('end')
+            end = timezone.datetime.strptime(end_str, "%Y-%m-%d").date() if end_str else timezone.now().date()
+            start_str = request.query_params.get('start')
+            start = (
+                timezone.datetime.strptime(start_str, "%Y-%m-%d").date() if start_str
+                else end - timezone.timedelta(days=29)
+            )
+        except ValueError:
+            return Response({"error": "Invalid date format. Use YYYY-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
+        if end < start:
+            return Response({"error": "End date cannot be before start date."}, status=status.HTTP_400_BAD_REQUEST)
+
+        cache_key = f"attendance-stats:{group_by}:{start.isoformat()}:{end.isoformat()}"
+        rows = cache.get(cache_key)
+        if rows is None:
+            rows = attendance_stats(start, end, group_by)
+            cache.set(cache_key, rows, getattr(settings, 'ATTENDANCE_STATS_CACHE_SECONDS', 300))
+
+        records = sum(row["records"] for row in rows)
+        present = sum(row["present"] for row in rows)
+        return Response({
+            "start": start,
+            "end": end,
+            "group_by": group_by,
+            "totals": {
+                "records": records,
+                "present": present,
+                "absent": records - present,
+                "rate": round(present / records, 4) if records else None,
+                "salary": str(sum((Decimal(row["salary"]) for row in rows), Decimal('0.00')))
+            },
+            "rows": rows
+        }, status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response(
+            {"error": str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def getChanges(request):
+    """
+    Function-based view to sync lists incrementally. Returns what changed after
+    ?since=<cursor>, compacted to one entry per object: current representations
+    under "upserts" and ids under "deletes", keyed by feed (departments,
+    employees, fields, assignments, employee_assignments, attendances), plus
+    the cursor for the next call. Without ?since= only the current cursor is
+    returned, to be taken right before a full fetch of the lists.
+    ?limit= caps the log entries read per call (default 500); has_more tells
+    the client to call again.
+    Only superusers or users with the 'Admin' role can read the change feed.
+    """
+    try:
+        if not (request.user.is_superuser or request.user.role == 'Admin'):
+            return Response(
+                {"error": "You do not have permission to view this resource."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        since = request.query_params.get('since')
+        if since is None:
+            return Response({
+                "cursor": head_cursor(),
+                "has_more": False,
+                "upserts": {},
+                "deletes": {}
+            }, status=status.HTTP_200_OK)
+        try:
+            since = int(since)
+            limit = min(int(request.query_params.get('limit', 500)), CHANGES_MAX_LIMIT)
+            if since < 0 or limit < 1:
+                raise ValueError
+        except ValueError:
+            return Response(
+                {"error": "since and limit must be non-negative integers (limit at least 1)."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        cursor, has_more, upserted, deleted = read_changes(since, limit)
+        upserts = {}
+        for feed, ids in upserted.items():
+            queryset, serializer_class, fast = CHANGE_FEED_SERIALIZERS[feed]
+            # Objects deleted since are skipped; their delete follows in a later page
+            queryset = queryset.filter(pk__in=ids).order_by('pk')
+            if fast:
+                upserts[feed] = fast_serialize(queryset, serializer_class)
+            else:
+                upserts[feed] = serializer_class(queryset, many=True).data
+
+        return Response({
+            "cursor": cursor,
+            "has_more": has_more,
+            "upserts": upserts,
+            "deletes": deleted
+        }, status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response(
+            {"error": str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+def stream_user(request):
+    """
+    Resolves the DRF token of an event stream request, from the Authorization
+    header or, for browser EventSource clients that cannot set headers, from
+    ?token=. Returns the user or None.
+    """
+    authenticator = TokenAuthentication()
+    key = request.GET.get('token')
+    try:
+        if key:
+            return authenticator.authenticate_credentials(key)[0]
+        credentials = authenticator.authenticate(request)
+    except AuthenticationFailed:
+        return None
+    return credentials[0] if credentials else None
+
+async def streamAttendance(request):
+    """
+    Server-sent events stream of attendance as it is marked (markAttendance and
+    markCrewAttendance), for live dashboards. Limited to ?group=<id> and/or
+    ?department=<id> (both repeatable), otherwise every record. Each event is
+    named "attendance", has the attendance id as its id and carries the
+    AttendanceSerializer data plus assignment_group. A client that falls
+    EVENT_STREAMS['BUFFER_SIZE'] events behind receives an "overflow" event and
+    is disconnected; it should refetch and reconnect.
+    Requires an ASGI server. Only superusers or users with the 'Admin' role can
+    open a stream.
+    """
+    if request.method != 'GET':
+        return JsonResponse({"error": "Method not allowed."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {"error": "Event streams are only served by the ASGI application."},
+            status=status.HTTP_501_NOT_IMPLEMENTED
+        )
+
+    user = await sync_to_async(stream_user)(request)
+    if user is None:
+        return JsonResponse(
+            {"detail": "Authentication credentials were not provided."},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+    if not (user.is_superuser or user.role == 'Admin'):
+        return JsonResponse(
+            {"error": "You do not have permission to view this resource."},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    try:
+        topics = [f'attendance:group:{int(group)}' for group in request.GET.getlist('group')]
+        topics += [f'attendance:department:{int(department)}' for department in request.GET.getlist('department')]
+    except ValueError:
+        return JsonResponse(
+            {"error": "Invalid group or department. Use IDs."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    response = StreamingHttpResponse(event_stream(topics or ['attendance']), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response